@@ -66,16 +66,25 @@ change from system to system.
 import os
 import re
 import stat
+import time
 import getpass
+import threading
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 from subprocess import CalledProcessError
 from taucmdr import logger, util, TAUCMDR_SCRIPT
 from taucmdr.error import ConfigurationError
 from taucmdr.cf.objects import TrackedInstance, KeyedRecord
+from taucmdr.cf.compiler.probe_cache import PROBE_CACHE
 
 
 LOGGER = logger.get_logger(__name__)
 
+MAX_PROBE_THREADS = 8
+"""int: Maximum number of compiler commands probed at the same time."""
+
+_PROBE_THREAD = threading.local()
+
 
 _COMPILER_WRAPPER_TEMPLATE = """#!/bin/sh
 #
@@ -209,6 +218,49 @@ class _CompilerRole(KeyedRecord):
     def __repr__(self):
         return '_CompilerRole(%s)' % self.keyword
 
+def _probe_concurrently(func, items):
+    """Apply a probe function to each item using a bounded pool of threads.
+    
+    Compiler probes spend nearly all their time waiting on compiler subprocesses so several can 
+    run at once.  Results are yielded in the order of `items` no matter which probe finishes first
+    so callers can keep their order of preference.  Probes that haven't started when the caller 
+    stops iterating are never started.  Probes started by a probe, e.g. to probe a compiler's wrapped 
+    compiler, run in the calling probe's thread so that no more than :any:`MAX_PROBE_THREADS` probes 
+    run at once.
+    
+    Args:
+        func: Callable accepting one item.
+        items (list): Items to probe.
+        
+    Yields:
+        The result of `func` for each item.
+    """
+    if len(items) < 2 or getattr(_PROBE_THREAD, 'active', False):
+        for item in items:
+            yield func(item)
+        return
+    def worker(item):
+        _PROBE_THREAD.active = True
+        return func(item)
+    pool = ThreadPool(min(MAX_PROBE_THREADS, len(items)))
+    try:
+        for result in pool.imap(worker, items):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def _timed_probe(func):
+    """Wrap a probe function so that it logs its duration."""
+    def wrapper(item):
+        start = time.time()
+        try:
+            return func(item)
+        finally:
+            LOGGER.debug("Probed %s in %.3f seconds", item, time.time() - start)
+    return wrapper
+
+
 class _CompilerFamily(TrackedInstance):
     """Information about a compiler family.
     
@@ -283,7 +335,6 @@ class _CompilerFamily(TrackedInstance):
             pass
         LOGGER.debug("Probing compiler '%s' to discover compiler family", absolute_path)
         messages = []
-        stdout = None
         # Settle down pylint... the __instances__ member is created by __new__
         # pylint: disable=no-member
         if candidates:
@@ -297,11 +348,27 @@ class _CompilerFamily(TrackedInstance):
         for family in families:
             if basename in family.commands:
                 (with_regex if family.family_regex else without_regex).append(family)
+        # Many families share version flags so run each distinct command once
+        commands = []
         for family in with_regex:
             cmd = [absolute_path] + family.version_flags
+            if cmd not in commands:
+                commands.append(cmd)
+        @_timed_probe
+        def version_output(cmd):
             try:
-                stdout = util.get_command_output(cmd)
+                return PROBE_CACHE.get_command_output(cmd)
             except CalledProcessError as err:
+                return err
+        results = _probe_concurrently(version_output, commands)
+        outputs = {}
+        for family in with_regex:
+            cmd = [absolute_path] + family.version_flags
+            while tuple(cmd) not in outputs:
+                outputs[tuple(commands[len(outputs)])] = next(results)
+            stdout = outputs[tuple(cmd)]
+            if isinstance(stdout, CalledProcessError):
+                err, stdout = stdout, None
                 messages.append(err.output)
                 LOGGER.debug("%s returned %d: %s", cmd, err.returncode, err.output)
                 # Keep going: Cray compilers return nonzero on version flag
@@ -424,7 +491,8 @@ class InstalledCompilerCreator(type):
         except KeyError: 
             LOGGER.debug('(%s, %s) not in compiler cache', absolute_path, info.role.keyword)
             instance = super(InstalledCompilerCreator, cls).__call__(absolute_path, info, **kwargs)
-            cls.__instances__[absolute_path, info] = instance
+            # Another thread may have probed the same compiler concurrently, keep the first instance
+            instance = cls.__instances__.setdefault((absolute_path, info), instance)
             LOGGER.debug('Added (%s, %s) to compiler cache', absolute_path, info.role.keyword)
         else:
             LOGGER.debug('Found (%s, %s) in compiler cache', absolute_path, info.role.keyword)
@@ -533,7 +601,7 @@ class InstalledCompiler(object):
         LOGGER.debug("Probing %s wrapper '%s'", self.info.short_descr, self.absolute_path)
         cmd = [self.absolute_path] + self.info.family.show_wrapper_flags
         try:
-            stdout = util.get_command_output(cmd)
+            stdout = PROBE_CACHE.get_command_output(cmd)
         except CalledProcessError:
             # If this command didn't accept show_wrapper_flags then it's not a compiler wrapper to begin with,
             # i.e. another command just happens to be the same as a known compiler command.
@@ -644,17 +712,41 @@ class InstalledCompiler(object):
                      "compiler '%s'" % absolute_path]
         raise ConfigurationError(''.join(msg_parts))
     
+    @classmethod
+    def probe_any(cls, candidates):
+        """Probe several compiler commands concurrently to find the first that is installed.
+        
+        Commands that aren't on PATH are skipped without probing.  The remaining commands are probed 
+        by up to :any:`MAX_PROBE_THREADS` threads but the result is chosen in order of preference.
+        
+        Args:
+            candidates (list): (command, family, role) tuples in order of preference, 
+                               see :any:`InstalledCompiler.probe`.
+        
+        Returns:
+            InstalledCompiler: The first candidate that could be probed, or None if no candidate could be probed.
+        """
+        candidates = [candidate for candidate in candidates if util.which(candidate[0])]
+        @_timed_probe
+        def probe(candidate):
+            command, family, role = candidate
+            try:
+                return cls.probe(command, family=family, role=role)
+            except ConfigurationError as err:
+                LOGGER.debug(err)
+                return None
+        for comp in _probe_concurrently(probe, candidates):
+            if comp:
+                return comp
+        return None
+
     @classmethod
     def find_any(cls, role):
-        for family in role.kbase.iterfamilies():
-            for info in family.members[role]:
-                try:
-                    comp = InstalledCompiler.probe(info.command, family=family, role=role)
-                except ConfigurationError:
-                    continue
-                else:
-                    return comp
-        raise ConfigurationError("Cannot find any installed compiler to fill the %s role" % role)
+        comp = cls.probe_any([(info.command, family, role) 
+                              for family in role.kbase.iterfamilies() for info in family.members[role]])
+        if not comp:
+            raise ConfigurationError("Cannot find any installed compiler to fill the %s role" % role)
+        return comp
 
 
     def unwrap(self):
@@ -680,7 +772,7 @@ class InstalledCompiler(object):
         if self._version_string is None:
             cmd = [self.absolute_path] + self.info.family.version_flags
             try:
-                self._version_string = util.get_command_output(cmd)
+                self._version_string = PROBE_CACHE.get_command_output(cmd)
             except CalledProcessError:
                 raise ConfigurationError("Compiler command '%s' failed." % ' '.join(cmd),
                                          "Check that this command works outside of TAU.",
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Persistent cache of compiler probe output.
+
+Compilers are probed by executing them with flags like ``--version`` or ``-show`` and parsing the 
+output.  Compiler wrappers may execute several more commands before they print anything so a probe 
+can take seconds on a busy login node.  Probe output is cached in files at user level so that later 
+invocations of TAU Commander don't execute the same compiler again.
+
+A cached entry is keyed by the compiler command's absolute path and is valid while the file's 
+inode, size, and modification time and the environment variables that influence compiler wrappers
+are unchanged.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from subprocess import CalledProcessError
+from taucmdr import logger, util, USER_PREFIX
+
+
+LOGGER = logger.get_logger(__name__)
+
+PROBE_ENVIRONMENT = ('PATH', 'LD_LIBRARY_PATH', 'LOADEDMODULES', '_LMFILES_', 'MODULEPATH')
+"""tuple: Environment variables that change which compiler a compiler command runs."""
+
+PROBE_ENVIRONMENT_PREFIXES = ('MPICH_', 'OMPI_', 'I_MPI_')
+"""tuple: Prefixes of environment variables that override the compiler wrapped by MPI compiler wrappers."""
+
+
+def _environment():
+    relevant = sorted((key, val) for key, val in os.environ.iteritems()
+                      if key in PROBE_ENVIRONMENT or key.startswith(PROBE_ENVIRONMENT_PREFIXES))
+    return hashlib.sha1(json.dumps(relevant)).hexdigest()
+
+
+class ProbeCache(object):
+    """Compiler probe output cached in a directory.
+    
+    Each compiler command has its own file in the directory so that processes probing different 
+    compilers never overwrite each other's results.  Files are replaced atomically.  Threads may 
+    probe compilers concurrently.
+    
+    Attributes:
+        prefix (str): Absolute path to the directory holding the cache files.
+        refresh (bool): If True then cached output from earlier processes is ignored and replaced.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.refresh = False
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _path(self, absolute_path):
+        return os.path.join(self.prefix, hashlib.sha1(absolute_path).hexdigest() + '.json')
+
+    def _load(self, absolute_path):
+        if self.refresh:
+            return None
+        try:
+            with open(self._path(absolute_path)) as fin:
+                entry = json.load(fin)
+        except (IOError, ValueError):
+            return None
+        return entry if isinstance(entry, dict) and entry.get('path') == absolute_path else None
+
+    def _save(self, entry):
+        path = self._path(entry['path'])
+        try:
+            util.mkdirp(self.prefix)
+            util.atomic_write(path, json.dumps(entry), fsync=False)
+        except (IOError, OSError, ValueError) as err:
+            LOGGER.debug("Failed to write compiler probe cache file '%s': %s", path, err)
+
+    def _entry(self, absolute_path):
+        identity, environment = util.file_identity(absolute_path), _environment()
+        entry = self._entries.get(absolute_path)
+        if entry is None:
+            entry = self._load(absolute_path)
+        if entry is None or entry.get('identity') != identity or entry.get('environment') != environment:
+            entry = {'path': absolute_path, 'identity': identity, 'environment': environment, 'outputs': {}}
+        self._entries[absolute_path] = entry
+        return entry
+
+    def get_command_output(self, cmd):
+        """Return the possibly cached output of a compiler probe command.
+        
+        Like :any:`util.get_command_output` except that output, and the return code of failed commands,
+        are also cached on disk.
+        
+        Args:
+            cmd (list): Absolute path to a compiler command followed by its command line arguments.
+
+        Raises:
+            subprocess.CalledProcessError: return code was non-zero.
+            OSError: The compiler command does not exist or is not executable.
+            
+        Returns:
+            str: Subprocess output.
+        """
+        absolute_path, key = cmd[0], ' '.join(cmd[1:])
+        with self._lock:
+            cached = self._entry(absolute_path)['outputs'].get(key)
+        if cached is None:
+            try:
+                returncode, output = 0, util.get_command_output(cmd)
+            except CalledProcessError as err:
+                returncode, output = err.returncode, err.output
+            with self._lock:
+                entry = self._entry(absolute_path)
+                entry['outputs'][key] = [returncode, output]
+                self._save(entry)
+        else:
+            returncode, output = cached
+            LOGGER.debug("Using cached compiler probe output: %s", cmd)
+            if isinstance(output, unicode):
+                output = output.encode('utf-8')
+        if returncode:
+            raise CalledProcessError(returncode, cmd, output)
+        return output
+
+
+PROBE_CACHE = ProbeCache(os.path.join(USER_PREFIX, 'compiler_probes'))
+"""ProbeCache: Cached output of compiler probes shared by all of the user's projects."""
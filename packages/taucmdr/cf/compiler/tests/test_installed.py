@@ -31,8 +31,51 @@ Functions used for unit tests of installed.py.
 """
 
 
+import time
+import threading
 from taucmdr import tests
+from taucmdr.error import ConfigurationError
+from taucmdr.cf import compiler
+from taucmdr.cf.compiler import InstalledCompiler
+
 
-@tests.not_implemented
 class InstalledTest(tests.TestCase):
-    pass
+    """Unit tests for probing installed compilers."""
+
+    def test_probe_order(self):
+        delays = {'sh': 0.3, 'ls': 0.2, 'cat': 0.0}
+        def probe(cls, command, family=None, role=None):
+            # pylint: disable=unused-argument
+            time.sleep(delays[command])
+            if command == 'sh':
+                raise ConfigurationError("Not a compiler")
+            return command
+        orig_probe = InstalledCompiler.__dict__['probe']
+        InstalledCompiler.probe = classmethod(probe)
+        try:
+            # 'cat' is probed first but 'ls' is preferred
+            self.assertEqual(InstalledCompiler.probe_any([(command, None, None) for command in 'sh', 'ls', 'cat']),
+                             'ls')
+            self.assertIsNone(InstalledCompiler.probe_any([('sh', None, None), ('not-a-command', None, None)]))
+        finally:
+            InstalledCompiler.probe = orig_probe
+
+    def test_nested_probes(self):
+        lock = threading.Lock()
+        running = [0, 0]
+        def probe(delay):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            try:
+                time.sleep(delay)
+            finally:
+                with lock:
+                    running[0] -= 1
+            return delay
+        def nested_probe(item):
+            return list(compiler._probe_concurrently(probe, [0.05 * (item % 3)] * compiler.MAX_PROBE_THREADS))
+        items = range(compiler.MAX_PROBE_THREADS)
+        results = list(compiler._probe_concurrently(nested_probe, items))
+        self.assertEqual([result[0] for result in results], [0.05 * (item % 3) for item in items])
+        self.assertLessEqual(running[1], compiler.MAX_PROBE_THREADS)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of probe_cache.py.
+"""
+
+import os
+from subprocess import CalledProcessError
+from taucmdr import tests, util
+from taucmdr.cf.compiler.probe_cache import ProbeCache
+
+
+class ProbeCacheTest(tests.TestCase):
+    """Unit tests for ProbeCache."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        util.mkdirp(self.prefix)
+        self.compiler = os.path.join(self.prefix, 'cc')
+        self._write_compiler('echo "cc version 1.0"')
+        self.cache_prefix = os.path.join(self.prefix, 'probes')
+        util.get_command_output.cache = {}
+
+    def _write_compiler(self, body):
+        with open(self.compiler, 'w') as fout:
+            fout.write('#!/bin/sh\n%s\n' % body)
+        os.chmod(self.compiler, 0755)
+
+    def _forget(self):
+        """Make sure the next probe can't be answered from memory or by executing the compiler."""
+        util.get_command_output.cache = {}
+        os.chmod(self.compiler, 0644)
+
+    def test_cached_output(self):
+        cmd = [self.compiler, '--version']
+        self.assertEqual(ProbeCache(self.cache_prefix).get_command_output(cmd), 'cc version 1.0\n')
+        self._forget()
+        self.assertEqual(ProbeCache(self.cache_prefix).get_command_output(cmd), 'cc version 1.0\n')
+        refresh = ProbeCache(self.cache_prefix)
+        refresh.refresh = True
+        self.assertRaises(OSError, refresh.get_command_output, cmd)
+
+    def test_cached_failure(self):
+        self._write_compiler('echo "bad flag"; exit 3')
+        cmd = [self.compiler, '-show']
+        self.assertRaises(CalledProcessError, ProbeCache(self.cache_prefix).get_command_output, cmd)
+        self._forget()
+        with self.assertRaises(CalledProcessError) as ctx:
+            ProbeCache(self.cache_prefix).get_command_output(cmd)
+        self.assertEqual(ctx.exception.returncode, 3)
+        self.assertEqual(ctx.exception.output, 'bad flag\n')
+
+    def test_invalidation(self):
+        cmd = [self.compiler, '--version']
+        ProbeCache(self.cache_prefix).get_command_output(cmd)
+        util.get_command_output.cache = {}
+        self._write_compiler('echo "cc version 2.0.1"')
+        self.assertEqual(ProbeCache(self.cache_prefix).get_command_output(cmd), 'cc version 2.0.1\n')
+        self._forget()
+        os.environ['OMPI_CC'] = 'other'
+        try:
+            self.assertRaises(OSError, ProbeCache(self.cache_prefix).get_command_output, cmd)
+        finally:
+            del os.environ['OMPI_CC']
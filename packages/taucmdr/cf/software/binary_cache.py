@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Local cache of built software packages.
+
+Building a package like PDT or PAPI can take much longer than unpacking it.  After a package is
+installed its installation prefix is packed into a tarball named by a hash of the package name 
+and all of :any:`Installation.uid_items`, i.e. the full UID, so that the same configuration doesn't 
+have to be built again for another project or storage level.
+
+Installed files may contain the installation prefix, e.g. in libtool archives or pkg-config files.
+Text files and absolute symbolic links into the prefix are rewritten when a cached package is unpacked 
+to a different prefix.  Packages with binary files that contain the prefix (e.g. an RPATH) are only 
+unpacked to the prefix they were built in.
+
+The cache is kept in ``<user prefix>/binary_cache`` unless the ``__TAUCMDR_BINARY_CACHE__`` environment 
+variable names another directory.  Set ``__TAUCMDR_BINARY_CACHE__`` to an empty string to disable the cache.
+"""
+
+import os
+import json
+import tarfile
+import hashlib
+import tempfile
+from taucmdr import logger, util, USER_PREFIX
+from taucmdr.cf.software.verification import MANIFEST_SUBDIR
+
+
+LOGGER = logger.get_logger(__name__)
+
+
+def _binary_cache_prefix():
+    return os.environ.get('__TAUCMDR_BINARY_CACHE__', os.path.join(USER_PREFIX, 'binary_cache'))
+
+
+class BinaryCache(object):
+    """Built software packages packed in a directory.
+    
+    Archives and their metadata are written atomically so any number of processes may use the 
+    cache without locking.
+    
+    Attributes:
+        prefix (str): Absolute path to the cache directory, or an empty string if the cache is disabled.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    @staticmethod
+    def key(pkg):
+        """The cache key of a package configuration.
+        
+        Args:
+            pkg (Installation): A software package.
+            
+        Returns:
+            str: A string of hexadecimal digits.
+        """
+        return hashlib.sha1(json.dumps([pkg.name] + list(pkg.uid_items()))).hexdigest()
+
+    def _paths(self, pkg):
+        base = os.path.join(self.prefix, pkg.name, self.key(pkg))
+        return base + '.tar.gz', base + '.json'
+
+    @staticmethod
+    def _scan(install_prefix):
+        """Find files and symbolic links that contain the installation prefix.
+        
+        Returns:
+            tuple: (text_files, symlinks, relocatable) where `text_files` and `symlinks` list paths relative 
+                   to `install_prefix` of text files containing the prefix and of symbolic links to absolute 
+                   paths in the prefix, and `relocatable` is False if any binary file contains the prefix.
+        """
+        text_files = []
+        symlinks = []
+        relocatable = True
+        for root, dirs, files in os.walk(install_prefix):
+            if MANIFEST_SUBDIR in dirs:
+                dirs.remove(MANIFEST_SUBDIR)
+            # os.walk lists symbolic links to directories in `dirs` but doesn't follow them
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    target = os.readlink(path)
+                    if target == install_prefix or target.startswith(install_prefix + os.sep):
+                        symlinks.append(os.path.relpath(path, install_prefix))
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.islink(path) or not os.path.isfile(path):
+                    continue
+                with open(path, 'rb') as fin:
+                    data = fin.read()
+                if install_prefix in data:
+                    if '\0' in data:
+                        relocatable = False
+                    else:
+                        text_files.append(os.path.relpath(path, install_prefix))
+        return text_files, symlinks, relocatable
+
+    def contains(self, pkg):
+        """Check if a build of a package is cached.
+        
+        Args:
+            pkg (Installation): A software package.
+            
+        Returns:
+            bool: True if a build of `pkg` is cached, though it may not be usable at `pkg`'s prefix.
+        """
+        return bool(self.prefix) and all(os.path.exists(path) for path in self._paths(pkg))
+
+    def store(self, pkg):
+        """Pack a successfully installed package into the cache.
+        
+        Failures are logged and otherwise ignored since the package is installed either way.
+        
+        Args:
+            pkg (Installation): An installed software package.
+        """
+        if not self.prefix:
+            return
+        archive, metadata = self._paths(pkg)
+        if os.path.exists(archive) and os.path.exists(metadata):
+            return
+        install_prefix = pkg.install_prefix
+        LOGGER.info("Adding %s to the binary cache...", pkg.title)
+        try:
+            text_files, symlinks, relocatable = self._scan(install_prefix)
+            util.mkdirp(os.path.dirname(archive))
+            skip = os.path.join('.', MANIFEST_SUBDIR)
+            fd, tmp_archive = tempfile.mkstemp(dir=os.path.dirname(archive))
+            os.close(fd)
+            try:
+                with tarfile.open(tmp_archive, 'w:gz') as tar:
+                    # Verification manifests are only valid in the installation they were written in
+                    tar.add(install_prefix, arcname='.', 
+                            filter=lambda info: None if info.name == skip else info)
+                os.rename(tmp_archive, archive)
+            except BaseException:
+                os.remove(tmp_archive)
+                raise
+            util.atomic_write(metadata, json.dumps({'name': pkg.name, 
+                                                    'prefix': install_prefix,
+                                                    'relocatable': relocatable,
+                                                    'text_files': text_files,
+                                                    'symlinks': symlinks}))
+        except (IOError, OSError, tarfile.TarError) as err:
+            LOGGER.warning("Unable to add %s to the binary cache at '%s': %s", pkg.title, self.prefix, err)
+        else:
+            LOGGER.debug("Cached %s installation '%s' as '%s' (relocatable: %s)", 
+                         pkg.name, install_prefix, archive, relocatable)
+
+    def restore(self, pkg):
+        """Unpack a cached build of a package to its installation prefix.
+        
+        The installation prefix must not exist.
+        
+        Args:
+            pkg (Installation): A software package that isn't installed.
+            
+        Returns:
+            bool: True if the package was unpacked, False if no usable build was cached.
+        """
+        if not self.prefix:
+            return False
+        archive, metadata = self._paths(pkg)
+        try:
+            with open(metadata) as fin:
+                meta = json.load(fin)
+        except (IOError, ValueError):
+            return False
+        install_prefix = pkg.install_prefix
+        old_prefix = meta['prefix'].encode('utf-8')
+        # Builds cached by earlier versions didn't record their symbolic links
+        if old_prefix != install_prefix and not (meta['relocatable'] and 'symlinks' in meta):
+            LOGGER.debug("Cached %s build at '%s' can't be moved to '%s'", pkg.name, old_prefix, install_prefix)
+            return False
+        LOGGER.info("Unpacking %s from the binary cache...", pkg.title)
+        parent = os.path.dirname(install_prefix)
+        try:
+            util.mkdirp(parent)
+            staging = tempfile.mkdtemp(dir=parent)
+            try:
+                with tarfile.open(archive, 'r:gz') as tar:
+                    tar.extractall(staging)
+                if old_prefix != install_prefix:
+                    for path in meta['text_files']:
+                        path = os.path.join(staging, path)
+                        with open(path, 'rb') as fin:
+                            data = fin.read()
+                        util.atomic_write(path, data.replace(old_prefix, install_prefix), fsync=False)
+                    for path in meta['symlinks']:
+                        path = os.path.join(staging, path.encode('utf-8'))
+                        target = os.readlink(path)
+                        os.remove(path)
+                        os.symlink(install_prefix + target[len(old_prefix):], path)
+                os.rename(staging, install_prefix)
+            except BaseException:
+                util.rmtree(staging, ignore_errors=True)
+                raise
+        except (IOError, OSError, tarfile.TarError) as err:
+            LOGGER.warning("Unable to unpack %s from the binary cache at '%s': %s", pkg.title, self.prefix, err)
+            return False
+        return True
+
+
+BINARY_CACHE = BinaryCache(_binary_cache_prefix())
+"""BinaryCache: The user's binary cache."""
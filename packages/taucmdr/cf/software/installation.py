@@ -38,6 +38,9 @@ from taucmdr.cf.storage import StorageError
 from taucmdr.cf.storage.levels import ORDERED_LEVELS
 from taucmdr.cf.storage.levels import highest_writable_storage 
 from taucmdr.cf.software import SoftwarePackageError
+from taucmdr.cf.software import prefetch
+from taucmdr.cf.software.binary_cache import BINARY_CACHE
+from taucmdr.cf.software.verification import VERIFICATION_MANIFESTS
 from taucmdr.cf import compiler
 from taucmdr.cf.compiler import InstalledCompilerSet
 from taucmdr.cf.platforms import Architecture, OperatingSystem, HOST_OS, DARWIN
@@ -315,28 +318,27 @@ class Installation(object):
                     LOGGER.debug("Cannot set group on '%s': %s", path, err)
                 progress_bar.update(i)
                 
-    def _acquire_source(self, reuse_archive):
+    def _acquire_source(self, reuse_archive, show_progress):
         archive_file = os.path.basename(self.src)
-        if reuse_archive:
+        # Archives in the source mirror are preferred over archives fetched to a storage level, see prefetch.fetch
+        if reuse_archive and not prefetch.mirrored_archive(archive_file):
             for storage in ORDERED_LEVELS:
                 try:
                     archive = os.path.join(storage.prefix, "src", archive_file)
                 except StorageError:
                     continue
-                if os.path.exists(archive):
+                if os.path.exists(archive) and prefetch.matches_checksum(archive, os.path.dirname(archive)):
                     return archive
         archive_prefix = os.path.join(highest_writable_storage().prefix, "src")
-        archive = os.path.join(archive_prefix, os.path.basename(self.src))
         try:
-            util.download(self.src, archive)
-        except IOError:
+            return prefetch.fetch(self.src, archive_prefix, reuse_archive, show_progress)
+        except IOError as err:
             hints = ("If a firewall is blocking access to this server, use another method to download "
                      "'%s' and copy that file to '%s' before trying this operation." % (self.src, archive_prefix),
                      "Check that the file or directory is accessible")
-            raise ConfigurationError("Cannot acquire source archive '%s'." % self.src, *hints)
-        return archive
+            raise ConfigurationError("Cannot acquire source archive '%s': %s" % (self.src, err), *hints)
     
-    def acquire_source(self, reuse_archive=True):
+    def acquire_source(self, reuse_archive=True, show_progress=True):
         """Acquires package source code archive file via download or file copy.
 
         If the package is configured to use an existing installation as the source then
@@ -344,6 +346,7 @@ class Installation(object):
         
         Args:
             reuse_archive (bool): If True don't download, just confirm that the archive exists.
+            show_progress (bool): If True, show a progress bar while downloading.
             
         Returns:
             str: Absolute path to the source archive.
@@ -355,14 +358,14 @@ class Installation(object):
             raise ConfigurationError("No source code provided for %s" % self.title)
         if self.unmanaged:
             return self.src
-        archive = self._acquire_source(reuse_archive)
+        archive = self._acquire_source(reuse_archive, show_progress)
         # Check that archive is valid by getting archive top-level directory
         try:
             util.archive_toplevel(archive)
         except IOError:
             if not reuse_archive:
                 raise ConfigurationError("Unable to acquire %s source package '%s'" % (self.name, self.src))
-            return self.acquire_source(reuse_archive=False)
+            return self.acquire_source(reuse_archive=False, show_progress=show_progress)
         return archive
 
     def _prepare_src(self, reuse_archive=True):
@@ -394,21 +397,55 @@ class Installation(object):
     def verify(self):
         """Check if the installation at :any:`installation_prefix` is valid.
         
-        A valid installation provides all expected files and commands.
-        Subclasses may wish to perform additional checks.
+        A valid installation provides all expected files and commands.  If the installation passed a full 
+        verification before and its verification manifest shows it hasn't changed then the installation 
+        is not scanned again.  Unmanaged installations belong to the user so they are always scanned and
+        no manifest is written in them.  Subclasses may wish to perform additional checks.
         
         Raises:
           SoftwarePackageError: Describs why the installation is invalid.
         """
         LOGGER.debug("Verifying %s installation at '%s'", self.title, self.install_prefix)
+        if self.unmanaged:
+            manifest = self._verify_files()
+        else:
+            key = self._verification_key()
+            manifest = VERIFICATION_MANIFESTS.load(self.install_prefix, key)
+            if manifest is None:
+                manifest = self._verify_files()
+                VERIFICATION_MANIFESTS.save(self.install_prefix, key, manifest)
+            else:
+                LOGGER.debug("%s installation at '%s' matches its verification manifest",
+                             self.name, self.install_prefix)
+        self._verified(manifest)
+        LOGGER.debug("%s installation at '%s' is valid", self.name, self.install_prefix)
+
+    def _verification_key(self):
+        """Name of this installation's verification manifest.
+        
+        Subclasses sharing an installation prefix between configurations must override this.
+        """
+        return self.uid
+
+    def _verify_files(self):
+        """Scan the installation prefix for all expected files and commands.
+        
+        Returns:
+            dict: A verification manifest whose 'files' item lists the files that were found.
+        
+        Raises:
+          SoftwarePackageError: Describs why the installation is invalid.
+        """
         if not os.path.exists(self.install_prefix):
             raise SoftwarePackageError("'%s' does not exist" % self.install_prefix)
+        found = []
         for cmd in self.verify_commands:
             path = os.path.join(self.bin_path, cmd)
             if not os.path.exists(path):
                 raise SoftwarePackageError("'%s' is missing" % path)
             if not os.access(path, os.X_OK):
                 raise SoftwarePackageError("'%s' exists but is not executable" % path)
+            found.append(path)
         for lib in self.verify_libraries:
             path = os.path.join(self.lib_path, lib)
             if not util.path_accessible(path):
@@ -416,11 +453,23 @@ class Installation(object):
                 path = os.path.join(self.lib_path+'64', lib)
                 if not util.path_accessible(path):
                     raise SoftwarePackageError("'%s' is not accessible" % path)
+            found.append(path)
         for header in self.verify_headers:
             path = os.path.join(self.include_path, header)
             if not util.path_accessible(path):
                 raise SoftwarePackageError("'%s' is not accessible" % path)
-        LOGGER.debug("%s installation at '%s' is valid", self.name, self.install_prefix)
+            found.append(path)
+        return {'files': found}
+
+    def _verified(self, manifest):
+        """Called with the verification manifest when the installation is valid.
+        
+        Subclasses may restore state recorded in the manifest by :any:`_verify_files`.
+        
+        Args:
+            manifest (dict): The verification manifest.
+        """
+        pass
         
     def add_dependency(self, name, sources, *args, **kwargs):
         """Adds a new package to the list of packages this package depends on.
@@ -436,6 +485,18 @@ class Installation(object):
         cls = software.get_installation(name)
         self.dependencies[name] = cls(sources, self.target_arch, self.target_os, self.compilers, *args, **kwargs)
 
+    def install_dependencies(self, force_reinstall=False):
+        """Install all packages this package depends on, building independent packages concurrently.
+        
+        Args:
+            force_reinstall (bool): If True, reinstall even if a software package passes verification.
+            
+        Raises:
+            SoftwarePackageError: Installation failed.
+        """
+        from taucmdr.cf.software.scheduler import install_dependencies
+        install_dependencies(self, force_reinstall)
+
     def install(self, force_reinstall=False):
         """Execute the installation sequence in a sanitized environment.
         
@@ -447,8 +508,11 @@ class Installation(object):
         Raises:
             SoftwarePackageError: Installation failed.
         """
-        for pkg in self.dependencies.itervalues():
-            pkg.install(force_reinstall)
+        self.install_dependencies(force_reinstall)
+        return self._install(force_reinstall)
+
+    def _install(self, force_reinstall):
+        """Install this package assuming all its dependencies are installed."""
         if self.unmanaged or not force_reinstall:
             try:
                 return self.verify()
@@ -463,6 +527,16 @@ class Installation(object):
         if os.path.isdir(self.install_prefix):
             LOGGER.info("Cleaning %s installation prefix '%s'", self.title, self.install_prefix)
             util.rmtree(self.install_prefix, ignore_errors=True)
+        if not force_reinstall:
+            with util.umask(002):
+                restored = BINARY_CACHE.restore(self)
+            if restored:
+                self.set_group()
+                try:
+                    return self.verify()
+                except SoftwarePackageError as err:
+                    LOGGER.info("Cached %s build is invalid, building from source: %s", self.title, err)
+                    util.rmtree(self.install_prefix, ignore_errors=True)
         with new_os_environ(), util.umask(002):
             try:
                 self._src_prefix = self._prepare_src()
@@ -479,7 +553,8 @@ class Installation(object):
                 self._src_prefix = None
         # Verify the new installation
         LOGGER.info("Verifying %s installation...", self.title)
-        return self.verify()
+        self.verify()
+        BINARY_CACHE.store(self)
 
     def installation_sequence(self):
         raise NotImplementedError
@@ -638,7 +713,7 @@ class CMakeInstallation(MakeInstallation):
         if not cmake:
             raise ConfigurationError("'cmake' not found in PATH.")
         try:
-            stdout = util.get_command_output([cmake, '--version'])
+            stdout = util.get_command_output([cmake, '--version'], ttl=7*24*3600)
         except (CalledProcessError, OSError) as err:
             raise ConfigurationError("Failed to get CMake version: %s" % err)
         for line in stdout.split('\n'):
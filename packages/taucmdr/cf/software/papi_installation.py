@@ -90,7 +90,8 @@ class PapiInstallation(AutotoolsInstallation):
     def xml_event_info(self):
         if not self._xml_event_info:
             self.install()
-            xml_event_info = util.get_command_output(os.path.join(self.bin_path, 'papi_xml_event_info'))
+            xml_event_info = util.get_command_output([os.path.join(self.bin_path, 'papi_xml_event_info')], 
+                                                     ttl=24*3600)
             self._xml_event_info = ElementTree.fromstring(xml_event_info)
         return self._xml_event_info
     
@@ -116,7 +117,7 @@ class PapiInstallation(AutotoolsInstallation):
         event_chooser_cmd = os.path.join(self.bin_path, 'papi_event_chooser')
         cmd = [event_chooser_cmd, 'PRESET'] + papi_metrics
         try:
-            util.get_command_output(cmd)
+            util.get_command_output(cmd, ttl=24*3600)
         except CalledProcessError as err:
             for line in err.output.split('\n'):
                 if "can't be counted with others" in line:
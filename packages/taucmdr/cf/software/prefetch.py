@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Concurrent acquisition of software package source archives.
+
+Source archives are downloaded or copied to the ``src`` directory of the highest writable storage 
+level.  :any:`prefetch` fetches the archives of several packages at once so that downloads overlap 
+each other instead of waiting for earlier packages to build.  Archives are fetched to a partial file 
+that is resumed if an earlier fetch was interrupted and renamed into place only when complete.
+
+Each archive directory may hold a checksum manifest named ``SHA256SUMS`` in the format written by 
+``sha256sum``.  A fetched archive must match its checksum if one is listed.  Otherwise its checksum 
+is added to the manifest so that later fetches of the same archive are verified.  Archives that were 
+already fetched, including archives in the mirror, are checked against the manifest in their directory 
+before they are used and fetched again if they don't match.  Remove an archive's line from the manifest 
+to accept a new version of that archive.
+
+The ``__TAUCMDR_SOURCE_MIRROR__`` environment variable may name a directory (or ``file://`` URL) 
+of source archives shared by all users, e.g. for clusters without internet access.  Archives found in
+the mirror are used in place.  If the mirror is writable then fetched archives are added to it so the
+mirror is populated once for everyone.
+"""
+
+import os
+import hashlib
+from multiprocessing.pool import ThreadPool
+from taucmdr import logger, util
+from taucmdr.error import ConfigurationError
+
+
+LOGGER = logger.get_logger(__name__)
+
+MAX_CONCURRENT_DOWNLOADS = 4
+"""int: Maximum number of source archives fetched at the same time."""
+
+CHECKSUM_MANIFEST = 'SHA256SUMS'
+"""str: Name of the checksum manifest file in an archive directory."""
+
+_VERIFIED = {}
+
+
+def _source_mirror():
+    mirror = os.environ.get('__TAUCMDR_SOURCE_MIRROR__', '')
+    if mirror.startswith('file://'):
+        mirror = mirror[7:]
+    return mirror
+
+
+SOURCE_MIRROR = _source_mirror()
+"""str: Absolute path to the shared source archive mirror, or an empty string if there is no mirror."""
+
+
+def file_checksum(path):
+    """Calculate the SHA-256 checksum of a file.
+    
+    Args:
+        path (str): Path to the file.
+        
+    Returns:
+        str: A string of hexadecimal digits.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1024*1024), ''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_checksums(prefix):
+    """Read the checksum manifest of an archive directory.
+    
+    Args:
+        prefix (str): Path to the archive directory.
+        
+    Returns:
+        dict: Checksums as strings of hexadecimal digits indexed by archive file name.
+    """
+    checksums = {}
+    try:
+        with open(os.path.join(prefix, CHECKSUM_MANIFEST)) as fin:
+            for line in fin:
+                parts = line.split(None, 1)
+                if len(parts) == 2:
+                    checksums[parts[1].strip().lstrip('*')] = parts[0].lower()
+    except IOError:
+        pass
+    return checksums
+
+
+def _update_checksum(prefix, name, checksum):
+    """Set or remove an archive's checksum and return the checksum the manifest listed before."""
+    path = os.path.join(prefix, CHECKSUM_MANIFEST)
+    with util.interprocess_lock(path + '.lock'):
+        checksums = read_checksums(prefix)
+        old_checksum = checksums.get(name)
+        if checksum:
+            checksums.setdefault(name, checksum)
+        else:
+            checksums.pop(name, None)
+        if checksums.get(name) != old_checksum:
+            util.atomic_write(path, ''.join('%s  %s\n' % (checksums[key], key) for key in sorted(checksums)))
+    return old_checksum
+
+
+def mirrored_archive(name):
+    """Find an archive in the source mirror.
+    
+    Args:
+        name (str): Archive file name.
+        
+    Returns:
+        str: Absolute path to the archive, or None if there is no mirror or the mirror doesn't have the archive.
+    """
+    if SOURCE_MIRROR:
+        mirrored = os.path.join(SOURCE_MIRROR, name)
+        if os.path.isfile(mirrored):
+            return mirrored
+    return None
+
+
+def matches_checksum(archive, prefix):
+    """Check an archive that was already fetched against the checksum manifest in its directory.
+    
+    Each archive is only hashed once per process unless it changes.
+    
+    Args:
+        archive (str): Path to the archive.
+        prefix (str): Path to the archive directory.
+    
+    Returns:
+        bool: False if the manifest lists a different checksum, True otherwise.
+    """
+    expected = read_checksums(prefix).get(os.path.basename(archive))
+    if not expected:
+        return True
+    stat = os.stat(archive)
+    verified = (stat.st_size, stat.st_mtime, expected)
+    if _VERIFIED.get(archive) == verified:
+        return True
+    checksum = file_checksum(archive)
+    if checksum != expected:
+        LOGGER.warning("Checksum of '%s' is %s but %s lists %s", 
+                       archive, checksum, os.path.join(prefix, CHECKSUM_MANIFEST), expected)
+        return False
+    _VERIFIED[archive] = verified
+    return True
+
+
+def fetch(src, archive_prefix, reuse_archive=True, show_progress=True):
+    """Fetch a source archive.
+    
+    Args:
+        src (str): Path or URL to the source archive.
+        archive_prefix (str): Directory to fetch the archive to if it isn't in the mirror.
+        reuse_archive (bool): If True, reuse an archive that was already fetched.  If False, the 
+                              archive was found to be unusable so it and its checksum are replaced.
+        show_progress (bool): If True, show a progress bar while downloading.
+    
+    Returns:
+        str: Absolute path to the archive.
+        
+    Raises:
+        IOError: The archive could not be fetched or does not match its checksum.
+    """
+    name = os.path.basename(src)
+    if SOURCE_MIRROR:
+        mirrored = mirrored_archive(name)
+        if reuse_archive and mirrored and matches_checksum(mirrored, SOURCE_MIRROR):
+            LOGGER.debug("Using '%s' from source mirror '%s'", name, SOURCE_MIRROR)
+            return mirrored
+        if util.path_accessible(SOURCE_MIRROR, 'w'):
+            archive_prefix = SOURCE_MIRROR
+    archive = os.path.join(archive_prefix, name)
+    util.mkdirp(archive_prefix)
+    with util.interprocess_lock(os.path.join(archive_prefix, '.%s.lock' % name)):
+        if os.path.isfile(archive):
+            if not reuse_archive:
+                _update_checksum(archive_prefix, name, None)
+            elif matches_checksum(archive, archive_prefix):
+                # The archive was fetched earlier, maybe by another process while we waited for the lock
+                return archive
+        partial = archive + '.part'
+        util.download(src, partial, show_progress=show_progress, resume=True)
+        checksum = file_checksum(partial)
+        expected = _update_checksum(archive_prefix, name, checksum)
+        if expected and expected != checksum:
+            os.remove(partial)
+            raise IOError("Checksum of '%s' is %s but %s lists %s" % 
+                          (src, checksum, os.path.join(archive_prefix, CHECKSUM_MANIFEST), expected))
+        os.rename(partial, archive)
+    LOGGER.debug("Fetched '%s' to '%s' (sha256 %s)", src, archive, checksum)
+    return archive
+
+
+def prefetch(packages):
+    """Acquire the source archives of several packages concurrently.
+    
+    Failures are logged and otherwise ignored since each package acquires its source again 
+    when it is installed and reports errors then.
+    
+    Args:
+        packages (list): :any:`Installation` instances.
+    """
+    by_src = {}
+    for pkg in packages:
+        if pkg.src and not pkg.unmanaged:
+            by_src.setdefault(os.path.basename(pkg.src), pkg)
+    if not by_src:
+        return
+    def acquire(pkg):
+        try:
+            pkg.acquire_source(show_progress=False)
+        except (ConfigurationError, IOError, OSError) as err:
+            LOGGER.debug(err)
+    if len(by_src) == 1:
+        acquire(by_src.values()[0])
+        return
+    LOGGER.info("Acquiring %s source archives...", ', '.join(sorted(pkg.title for pkg in by_src.itervalues())))
+    pool = ThreadPool(min(MAX_CONCURRENT_DOWNLOADS, len(by_src)))
+    try:
+        pool.map(acquire, by_src.values())
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Concurrent installation of software package dependency graphs.
+
+A package's dependencies, and their dependencies, form a directed acyclic graph.  Packages that don't
+depend on each other (e.g. binutils, libunwind, PAPI, and PDT) are built at the same time by forked 
+worker processes.  Each worker has its own environment, umask, and working directory so installation
+sequences that modify ``os.environ`` don't interfere with each other.  Running builds share the 
+`make` job budget from :any:`parallel_make_flags`.
+
+Each worker writes a debug log for its package next to the package's installation prefix.  If any
+package fails to install then all other running builds are stopped and their partially installed 
+prefixes are removed.
+"""
+
+import os
+import time
+import select
+import signal
+import logging
+import multiprocessing
+from collections import OrderedDict
+from taucmdr import logger, util
+from taucmdr.error import Error
+from taucmdr.cf.software import SoftwarePackageError
+from taucmdr.cf.software.installation import parallel_make_flags, tmpfs_prefix
+from taucmdr.cf.software.binary_cache import BINARY_CACHE
+from taucmdr.cf.software.prefetch import prefetch
+
+
+LOGGER = logger.get_logger(__name__)
+
+MAX_CONCURRENT_INSTALLS = 4
+"""int: Maximum number of packages built at the same time."""
+
+
+def _dependency_graph(pkg):
+    """Find all packages `pkg` depends on, directly or indirectly.
+    
+    Packages may list the same dependency as separate :any:`Installation` instances, e.g. TAU and
+    Score-P both depend on PAPI.  Instances with the same name and UID install to the same prefix 
+    so only one of them is kept.
+    
+    Returns:
+        tuple: (packages, requires) where `packages` is an OrderedDict of :any:`Installation` instances
+               in dependency order and `requires` maps each key of `packages` to the set of keys of 
+               the packages it depends on.
+    """
+    packages = OrderedDict()
+    requires = {}
+    def visit(dep):
+        key = (dep.name, dep.uid)
+        if key not in packages:
+            requires[key] = set(visit(sub) for sub in dep.dependencies.itervalues())
+            packages[key] = dep
+        return key
+    for dep in pkg.dependencies.itervalues():
+        visit(dep)
+    return packages, requires
+
+
+class _InstallWorker(object):
+    """Install one package in a forked process.
+    
+    Attributes:
+        pkg (Installation): The package to install.
+        log_file (str): Path to the package's build log.
+    """
+
+    def __init__(self, pkg, force_reinstall, make_jobs):
+        self.pkg = pkg
+        self.log_file = pkg.install_prefix + '.log'
+        self.start_time = time.time()
+        self._force_reinstall = force_reinstall
+        self._make_jobs = make_jobs
+        self._conn, child_conn = multiprocessing.Pipe(duplex=False)
+        self._process = multiprocessing.Process(target=self._run, args=(child_conn,))
+        self._process.start()
+        child_conn.close()
+        LOGGER.debug("Installing %s with %d make jobs in process %d", pkg.name, make_jobs, self._process.pid)
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def _run(self, conn):
+        # Lead a new process group so that the whole build can be stopped at once
+        os.setpgrp()
+        os.environ['__TAUCMDR_MAX_MAKE_JOBS__'] = str(self._make_jobs)
+        # Progress bars from concurrent builds would overwrite each other
+        os.environ['__TAUCMDR_PROGRESS_BARS__'] = 'disabled'
+        error_stack = len(util._DTEMP_ERROR_STACK)  # pylint: disable=protected-access
+        try:
+            util.mkdirp(os.path.dirname(self.log_file))
+            handler = logging.FileHandler(self.log_file, mode='w')
+            handler.setLevel(logging.DEBUG)
+            handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+            logging.getLogger().addHandler(handler)
+            self.pkg._install(self._force_reinstall)  # pylint: disable=protected-access
+        except BaseException as err:  # pylint: disable=broad-except
+            failed = util._DTEMP_ERROR_STACK[error_stack:]  # pylint: disable=protected-access
+            try:
+                conn.send((type(err), getattr(err, 'value', str(err)), getattr(err, 'hints', []), failed))
+            except Exception:  # pylint: disable=broad-except
+                conn.send((None, str(err), [], failed))
+        else:
+            conn.send(None)
+        finally:
+            conn.close()
+
+    def result(self):
+        """Wait for the worker to finish.
+        
+        Raises:
+            Error: The package failed to install.
+        """
+        try:
+            result = self._conn.recv()
+        except EOFError:
+            result = (None, "worker process exited unexpectedly", [], [])
+        self._conn.close()
+        self._process.join()
+        if result is None:
+            return
+        cls, value, hints, failed = result
+        util._DTEMP_ERROR_STACK.extend(failed)  # pylint: disable=protected-access
+        hints = list(hints) + ["See the build log at '%s'" % self.log_file]
+        if isinstance(cls, type) and issubclass(cls, Error):
+            raise cls(value, *hints)
+        raise SoftwarePackageError("%s installation failed: %s" % (self.pkg.title, value), *hints)
+
+    def abort(self):
+        """Stop the worker and everything it started.
+        
+        Returns:
+            bool: True if the package may be partially installed, False if it was installed successfully.
+        """
+        try:
+            incomplete = not (self._conn.poll() and self._conn.recv() is None)
+        except EOFError:
+            incomplete = True
+        if self._process.is_alive():
+            LOGGER.info("Stopping %s installation", self.pkg.title)
+            for sig in signal.SIGTERM, signal.SIGKILL:
+                try:
+                    os.killpg(self._process.pid, sig)
+                except OSError:
+                    break
+                self._process.join(5)
+                if not self._process.is_alive():
+                    break
+        self._process.join()
+        self._conn.close()
+        return incomplete
+
+
+def _rollback(pkg):
+    if not pkg.unmanaged and os.path.isdir(pkg.install_prefix):
+        LOGGER.info("Removing incomplete %s installation at '%s'", pkg.title, pkg.install_prefix)
+        util.rmtree(pkg.install_prefix, ignore_errors=True)
+
+
+def _needs_install(pkg, force_reinstall):
+    if pkg.unmanaged:
+        # Verifies the installation or explains why it can't be installed
+        pkg._install(force_reinstall)  # pylint: disable=protected-access
+        return False
+    if force_reinstall:
+        return True
+    try:
+        pkg.verify()
+    except SoftwarePackageError as err:
+        LOGGER.debug(err)
+        return True
+    return False
+
+
+def install_dependencies(pkg, force_reinstall=False):
+    """Install all packages a package depends on.
+    
+    Independent packages are built concurrently by up to :any:`MAX_CONCURRENT_INSTALLS` worker processes.
+    A package is only built after all the packages it depends on have been installed.
+    
+    Args:
+        pkg (Installation): Package whose dependencies should be installed.
+        force_reinstall (bool): If True, reinstall even if a package passes verification.
+        
+    Raises:
+        SoftwarePackageError: A package failed to install.
+    """
+    packages, requires = _dependency_graph(pkg)
+    pending = OrderedDict((key, dep) for key, dep in packages.iteritems() if _needs_install(dep, force_reinstall))
+    if not pending:
+        return
+    # Fetch all source archives up front so downloads overlap instead of waiting on earlier builds
+    prefetch([dep for dep in pending.itervalues() if not BINARY_CACHE.contains(dep)])
+    if len(pending) == 1 or MAX_CONCURRENT_INSTALLS < 2:
+        for dep in pending.itervalues():
+            dep._install(force_reinstall)  # pylint: disable=protected-access
+        return
+    total_jobs = int(parallel_make_flags()[1])
+    # Resolve shared state before forking so that all workers agree on it
+    tmpfs_prefix()
+    for dep in pending.itervalues():
+        _ = dep.install_prefix
+    LOGGER.info("Installing %s", ', '.join(dep.title for dep in pending.itervalues()))
+    start, count = time.time(), len(pending)
+    running = {}
+    try:
+        while pending or running:
+            blocked = set(pending) | set(running)
+            ready = [key for key in pending if not requires[key] & blocked]
+            ready = ready[:max(0, MAX_CONCURRENT_INSTALLS - len(running))]
+            if ready:
+                jobs = max(1, total_jobs // (len(running) + len(ready)))
+                for key in ready:
+                    running[key] = _InstallWorker(pending.pop(key), force_reinstall, jobs)
+            readable = select.select(running.values(), [], [])[0]
+            for worker in readable:
+                key = (worker.pkg.name, worker.pkg.uid)
+                del running[key]
+                try:
+                    worker.result()
+                except BaseException:
+                    _rollback(worker.pkg)
+                    raise
+                LOGGER.info("%s installed in %.1f seconds", worker.pkg.title, time.time() - worker.start_time)
+    except BaseException:
+        for worker in running.itervalues():
+            if worker.abort():
+                _rollback(worker.pkg)
+        raise
+    LOGGER.debug("Installed %d packages in %.1f seconds", count, time.time() - start)
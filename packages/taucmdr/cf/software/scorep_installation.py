@@ -168,7 +168,7 @@ class ScorepInstallation(AutotoolsInstallation):
         # was configured with the flags we need.
         cmd = [os.path.join(self.bin_path, 'scorep-info'), 'config-summary']
         try:
-            stdout = util.get_command_output(cmd)
+            stdout = util.get_command_output(cmd, ttl=30*24*3600)
         except CalledProcessError as err:
             raise SoftwarePackageError("%s failed with return code %d: %s" % (cmd, err.returncode, err.output))
         flags = self._get_flags()
@@ -47,6 +47,7 @@ from taucmdr import logger, util
 from taucmdr.error import ConfigurationError, InternalError
 from taucmdr.cf.software import SoftwarePackageError
 from taucmdr.cf.software.installation import Installation, parallel_make_flags, new_os_environ
+from taucmdr.cf.software.verification import VERIFICATION_MANIFESTS
 from taucmdr.cf.compiler import host as host_compilers, InstalledCompilerSet
 from taucmdr.cf.compiler.host import CC, CXX, FC, UPC, GNU, APPLE_LLVM, IBM
 from taucmdr.cf.compiler.mpi import MPI_CC, MPI_CXX, MPI_FC
@@ -448,10 +449,10 @@ class TauInstallation(Installation):
         static_lib = "libtau%s.*" % makefile_tags
         shared_lib = "libTAUsh%s.*" % makefile_tags
         for pattern in static_lib, shared_lib:
-            if glob.glob(os.path.join(self.lib_path, pattern)):
-                break
-        else:
-            raise SoftwarePackageError("TAU libraries for makefile '%s' not found" % tau_makefile)
+            tau_libs = glob.glob(os.path.join(self.lib_path, pattern))
+            if tau_libs:
+                return tau_libs
+        raise SoftwarePackageError("TAU libraries for makefile '%s' not found" % tau_makefile)
         
     def _verify_dependency_paths(self, tau_makefile):
         LOGGER.debug("Checking dependency paths in '%s'", tau_makefile)
@@ -525,7 +526,32 @@ class TauInstallation(Installation):
         if not os.path.exists(iowrap_link_options):
             raise SoftwarePackageError("TAU I/O wrapper link options not found in '%s'" % io_wrapper_dir)
         LOGGER.debug("Found iowrap link options: %s", iowrap_link_options)
+        return iowrap_libs + [iowrap_link_options]
     
+    def _verification_key(self):
+        # TAU configurations share the installation prefix so the key must identify the configuration
+        parts = sorted(self.get_tags())
+        parts.extend([str(self.minimal), str(self.unmanaged), str(self.measure_io)])
+        return util.calculate_uid(parts)
+
+    def _verify_files(self):
+        manifest = super(TauInstallation, self)._verify_files()
+        if not self.minimal:
+            tau_makefile = self.get_makefile()
+            manifest['files'].append(tau_makefile)
+            manifest['files'].extend(self._verify_tau_libs(tau_makefile))
+            if not self.unmanaged:
+                self._verify_dependency_paths(tau_makefile)
+            if self.measure_io:
+                manifest['files'].extend(self._verify_iowrapper(tau_makefile))
+            manifest['makefile'] = tau_makefile
+        return manifest
+
+    def _verified(self, manifest):
+        # Don't search for the makefile again if verification found it
+        if 'makefile' in manifest and not self._tau_makefile:
+            self._tau_makefile = manifest['makefile'].encode('utf-8')
+
     def verify(self):
         super(TauInstallation, self).verify()
         if not self.minimal:
@@ -534,12 +560,6 @@ class TauInstallation(Installation):
                     self.dependencies['papi'].check_metrics(self.metrics)
                 except ConfigurationError as err:
                     LOGGER.warning(err)
-            tau_makefile = self.get_makefile()
-            self._verify_tau_libs(tau_makefile)
-            if not self.unmanaged:
-                self._verify_dependency_paths(tau_makefile)
-            if self.measure_io:
-                self._verify_iowrapper(tau_makefile)
         LOGGER.debug("TAU installation at '%s' is valid", self.install_prefix)
 
     def _select_flags(self, header, libglobs, user_libraries, wrap_cc, wrap_cxx, wrap_fc):
@@ -777,8 +797,7 @@ class TauInstallation(Installation):
                                        *unmanaged_hints)
         # Check dependencies after verifying TAU instead of before in case 
         # we're using an unmanaged TAU or forced makefile. 
-        for pkg in self.dependencies.itervalues():
-            pkg.install(force_reinstall)
+        self.install_dependencies(force_reinstall)
         LOGGER.info("Installing %s at '%s'", self.title, self.install_prefix)
         with new_os_environ(), util.umask(002):
             try:
@@ -786,6 +805,8 @@ class TauInstallation(Installation):
                 if not (self.include_path and os.path.isdir(self.include_path)):
                     shutil.move(self._prepare_src(), self.install_prefix)
                 self._src_prefix = self.install_prefix
+                # Reconfiguring may change files recorded by any configuration's verification manifest
+                VERIFICATION_MANIFESTS.discard(self.install_prefix)
                 self.installation_sequence()
                 self.set_group()
             except SoftwarePackageError as err:
@@ -1287,7 +1308,7 @@ class TauInstallation(Installation):
         if not abspath:
             raise ConfigurationError("'java' not found in PATH")
         try:
-            stdout = util.get_command_output([abspath, '-version'])
+            stdout = util.get_command_output([abspath, '-version'], ttl=7*24*3600)
         except (CalledProcessError, OSError) as err:
             raise ConfigurationError("Failed to get Java version: %s" % err)
         if 'Java(TM)' not in stdout:
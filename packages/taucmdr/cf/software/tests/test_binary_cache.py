@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of binary_cache.py.
+"""
+
+import os
+from taucmdr import tests, util
+from taucmdr.cf.software.binary_cache import BinaryCache
+
+
+class _FakeInstallation(object):
+
+    def __init__(self, install_prefix):
+        self.name = 'papi'
+        self.title = 'PAPI'
+        self.install_prefix = install_prefix
+
+    @staticmethod
+    def uid_items():
+        return ['papi-5.5.1.tar.gz', 'x86_64', 'Linux']
+
+
+class BinaryCacheTest(tests.TestCase):
+    """Unit tests for BinaryCache."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        self.cache = BinaryCache(os.path.join(self.prefix, 'cache'))
+        self.built = _FakeInstallation(os.path.join(self.prefix, 'project', 'papi', 'abc123'))
+        util.mkdirp(os.path.join(self.built.install_prefix, 'lib'))
+        with open(os.path.join(self.built.install_prefix, 'lib', 'libpapi.la'), 'w') as fout:
+            fout.write("libdir='%s/lib'\n" % self.built.install_prefix)
+
+    def _read(self, pkg, path):
+        with open(os.path.join(pkg.install_prefix, path)) as fout:
+            return fout.read()
+
+    def test_relocate(self):
+        self.cache.store(self.built)
+        other = _FakeInstallation(os.path.join(self.prefix, 'user', 'papi', 'abc123'))
+        self.assertTrue(self.cache.restore(other))
+        self.assertEqual(self._read(other, 'lib/libpapi.la'), "libdir='%s/lib'\n" % other.install_prefix)
+        self.assertFalse(BinaryCache('').restore(_FakeInstallation(os.path.join(self.prefix, 'disabled'))))
+
+    def test_not_relocatable(self):
+        with open(os.path.join(self.built.install_prefix, 'lib', 'libpapi.so'), 'wb') as fout:
+            fout.write("\x7fELF\0RPATH=%s/lib\0" % self.built.install_prefix)
+        self.cache.store(self.built)
+        other = _FakeInstallation(os.path.join(self.prefix, 'user', 'papi', 'abc123'))
+        self.assertFalse(self.cache.restore(other))
+        util.rmtree(self.built.install_prefix)
+        self.assertTrue(self.cache.restore(self.built))
+        self.assertIn('RPATH', self._read(self.built, 'lib/libpapi.so'))
+
+    def test_relocate_symlinks(self):
+        lib = os.path.join(self.built.install_prefix, 'lib')
+        os.symlink(os.path.join(lib, 'libpapi.la'), os.path.join(lib, 'absolute.la'))
+        os.symlink('libpapi.la', os.path.join(lib, 'relative.la'))
+        os.symlink(lib, os.path.join(self.built.install_prefix, 'lib64'))
+        os.symlink(self.prefix, os.path.join(lib, 'outside'))
+        self.cache.store(self.built)
+        util.rmtree(self.built.install_prefix)
+        other = _FakeInstallation(os.path.join(self.prefix, 'user', 'papi', 'abc123'))
+        self.assertTrue(self.cache.restore(other))
+        other_lib = os.path.join(other.install_prefix, 'lib')
+        self.assertEqual(os.readlink(os.path.join(other_lib, 'absolute.la')), os.path.join(other_lib, 'libpapi.la'))
+        self.assertEqual(os.readlink(os.path.join(other_lib, 'relative.la')), 'libpapi.la')
+        self.assertEqual(os.readlink(os.path.join(other.install_prefix, 'lib64')), other_lib)
+        self.assertEqual(os.readlink(os.path.join(other_lib, 'outside')), self.prefix)
+        self.assertEqual(self._read(other, 'lib64/absolute.la'), "libdir='%s/lib'\n" % other.install_prefix)
@@ -31,8 +31,59 @@ Functions used for unit tests of installation.py.
 """
 
 
-from taucmdr.tests import TestCase, not_implemented
+import os
+from taucmdr import tests, util
+from taucmdr.cf.platforms import HOST_ARCH, HOST_OS
+from taucmdr.cf.compiler import InstalledCompilerSet
+from taucmdr.cf.software import SoftwarePackageError
+from taucmdr.cf.software import installation
+from taucmdr.cf.software.binary_cache import BinaryCache
+from taucmdr.cf.software.installation import Installation
+from taucmdr.cf.software.verification import MANIFEST_SUBDIR
 
-@not_implemented
-class InstallationTest(TestCase):
-    pass
+
+class InstallationTest(tests.TestCase):
+    """Unit tests for Installation."""
+
+    def test_verify_unmanaged(self):
+        prefix = os.path.join(tests.get_test_workdir(), self.id())
+        util.mkdirp(os.path.join(prefix, 'include'))
+        with open(os.path.join(prefix, 'include', 'papi.h'), 'w') as fout:
+            fout.write('papi.h')
+        inst = Installation('papi', 'PAPI', {'papi': prefix}, HOST_ARCH, HOST_OS, InstalledCompilerSet('test'),
+                            None, None, None, {None: ['papi.h']})
+        self.assertTrue(inst.unmanaged)
+        inst._uid = 'abc123'  # pylint: disable=protected-access
+        inst.verify()
+        # Installations that TAU Commander doesn't own are never modified
+        self.assertFalse(os.path.exists(os.path.join(prefix, MANIFEST_SUBDIR)))
+        os.remove(os.path.join(prefix, 'include', 'papi.h'))
+        with self.assertRaises(SoftwarePackageError):
+            inst.verify()
+
+    def test_restore_sets_group(self):
+        # pylint: disable=protected-access
+        prefix = os.path.join(tests.get_test_workdir(), self.id())
+        def papi(install_prefix):
+            inst = Installation('papi', 'PAPI', {'papi': os.path.join(prefix, 'papi.tgz')}, HOST_ARCH, HOST_OS,
+                                InstalledCompilerSet('test'), None, None, None, {None: ['papi.h']})
+            inst._uid = 'abc123'
+            inst._install_prefix = os.path.join(prefix, install_prefix)
+            inst.uid_items = lambda: ['papi.tgz']
+            return inst
+        built = papi('built')
+        util.mkdirp(os.path.join(built.install_prefix, 'include'))
+        with open(os.path.join(built.install_prefix, 'include', 'papi.h'), 'w') as fout:
+            fout.write('papi.h')
+        cache = BinaryCache(os.path.join(prefix, 'cache'))
+        cache.store(built)
+        restored = papi('restored')
+        groups_set = []
+        restored.set_group = lambda gid=None: groups_set.append(os.path.isdir(restored.install_prefix))
+        saved_cache = installation.BINARY_CACHE
+        installation.BINARY_CACHE = cache
+        try:
+            restored.install()
+        finally:
+            installation.BINARY_CACHE = saved_cache
+        self.assertEqual(groups_set, [True])
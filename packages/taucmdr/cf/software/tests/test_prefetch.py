@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of prefetch.py.
+"""
+
+import os
+from taucmdr import tests, util
+from taucmdr.cf.software import prefetch
+
+
+class _FakeInstallation(object):
+
+    def __init__(self, src, archive_prefix):
+        self.title = os.path.basename(src)
+        self.src = src
+        self.unmanaged = False
+        self.archive_prefix = archive_prefix
+        self.archive = None
+
+    def acquire_source(self, show_progress=True):
+        self.archive = prefetch.fetch(self.src, self.archive_prefix, show_progress=show_progress)
+        return self.archive
+
+
+class PrefetchTest(tests.TestCase):
+    """Unit tests for source archive prefetching."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        self.upstream = os.path.join(self.prefix, 'upstream')
+        util.mkdirp(self.upstream)
+        for name in 'papi.tgz', 'pdt.tgz', 'libunwind.tgz':
+            self._write_upstream(name, name)
+        self.archive_prefix = os.path.join(self.prefix, 'src')
+        self._saved_mirror = prefetch.SOURCE_MIRROR
+        prefetch.SOURCE_MIRROR = ''
+
+    def tearDown(self):
+        prefetch.SOURCE_MIRROR = self._saved_mirror
+
+    def _write_upstream(self, name, data):
+        with open(os.path.join(self.upstream, name), 'w') as fout:
+            fout.write(data)
+
+    def test_checksum(self):
+        src = os.path.join(self.upstream, 'papi.tgz')
+        archive = prefetch.fetch(src, self.archive_prefix, show_progress=False)
+        self.assertEqual(archive, os.path.join(self.archive_prefix, 'papi.tgz'))
+        checksums = prefetch.read_checksums(self.archive_prefix)
+        self.assertEqual(checksums, {'papi.tgz': prefetch.file_checksum(src)})
+        self._write_upstream('papi.tgz', 'tampered')
+        os.remove(archive)
+        with self.assertRaises(IOError):
+            prefetch.fetch(src, self.archive_prefix, show_progress=False)
+        self.assertFalse(os.path.exists(archive + '.part'))
+        # An archive found to be unusable is replaced along with its checksum
+        util.download(src, archive)
+        self.assertEqual(prefetch.fetch(src, self.archive_prefix, reuse_archive=False, show_progress=False), archive)
+        self.assertEqual(prefetch.read_checksums(self.archive_prefix)['papi.tgz'], prefetch.file_checksum(src))
+
+    def test_mirror(self):
+        prefetch.SOURCE_MIRROR = os.path.join(self.prefix, 'mirror')
+        util.mkdirp(prefetch.SOURCE_MIRROR)
+        src = 'file://' + os.path.join(self.upstream, 'pdt.tgz')
+        archive = prefetch.fetch(src, self.archive_prefix, show_progress=False)
+        self.assertEqual(archive, os.path.join(prefetch.SOURCE_MIRROR, 'pdt.tgz'))
+        self.assertIn('pdt.tgz', prefetch.read_checksums(prefetch.SOURCE_MIRROR))
+        self.assertEqual(prefetch.mirrored_archive('pdt.tgz'), archive)
+        self.assertIsNone(prefetch.mirrored_archive('papi.tgz'))
+        os.remove(os.path.join(self.upstream, 'pdt.tgz'))
+        self.assertEqual(prefetch.fetch(src, self.archive_prefix, show_progress=False), archive)
+
+    def test_tampered_mirror(self):
+        prefetch.SOURCE_MIRROR = os.path.join(self.prefix, 'mirror')
+        util.mkdirp(prefetch.SOURCE_MIRROR)
+        src = os.path.join(self.upstream, 'pdt.tgz')
+        archive = prefetch.fetch(src, self.archive_prefix, show_progress=False)
+        with open(archive, 'w') as fout:
+            fout.write('tampered')
+        # The mirrored archive doesn't match the mirror's manifest so it is fetched again
+        self.assertEqual(prefetch.fetch(src, self.archive_prefix, show_progress=False), archive)
+        with open(archive) as fin:
+            self.assertEqual(fin.read(), 'pdt.tgz')
+        with open(archive, 'w') as fout:
+            fout.write('tampered again')
+        self._write_upstream('pdt.tgz', 'tampered upstream')
+        with self.assertRaises(IOError):
+            prefetch.fetch(src, self.archive_prefix, show_progress=False)
+
+    def test_tampered_archive(self):
+        src = os.path.join(self.upstream, 'papi.tgz')
+        archive = prefetch.fetch(src, self.archive_prefix, show_progress=False)
+        self.assertEqual(prefetch.fetch(src, self.archive_prefix, show_progress=False), archive)
+        with open(archive, 'w') as fout:
+            fout.write('tampered papi.tgz')
+        self.assertEqual(prefetch.fetch(src, self.archive_prefix, show_progress=False), archive)
+        with open(archive) as fin:
+            self.assertEqual(fin.read(), 'papi.tgz')
+
+    def test_prefetch(self):
+        packages = [_FakeInstallation(os.path.join(self.upstream, name), self.archive_prefix) 
+                    for name in 'papi.tgz', 'pdt.tgz', 'libunwind.tgz', 'missing.tgz']
+        prefetch.prefetch(packages)
+        for pkg in packages[:3]:
+            with open(pkg.archive) as fin:
+                self.assertEqual(fin.read(), pkg.title)
+        self.assertIsNone(packages[3].archive)
+        self.assertEqual(len(prefetch.read_checksums(self.archive_prefix)), 3)
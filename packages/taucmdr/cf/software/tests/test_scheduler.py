@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of scheduler.py.
+"""
+
+import os
+import time
+from taucmdr import tests, util
+from taucmdr.cf.software import SoftwarePackageError, scheduler
+
+
+class _FakeInstallation(object):
+    """Stands in for an :any:`Installation` that records when it was built."""
+
+    def __init__(self, prefix, name, dependencies=(), fail=False):
+        self.name = name
+        self.uid = name
+        self.title = name.upper()
+        self.src = ''
+        self.unmanaged = False
+        self.install_prefix = os.path.join(prefix, name)
+        self.dependencies = {dep.name: dep for dep in dependencies}
+        self.fail = fail
+
+    def uid_items(self):
+        return [self.name]
+
+    def verify(self):
+        if not os.path.exists(os.path.join(self.install_prefix, 'done')):
+            raise SoftwarePackageError("%s is not installed" % self.name)
+
+    def times(self):
+        with open(os.path.join(self.install_prefix, 'done')) as fin:
+            return [float(x) for x in fin.read().split()]
+
+    def _install(self, _):
+        util.mkdirp(self.install_prefix)
+        begin = time.time()
+        time.sleep(0.2)
+        if self.fail:
+            raise SoftwarePackageError("%s failed" % self.name)
+        with open(os.path.join(self.install_prefix, 'done'), 'w') as fout:
+            fout.write("%f %f %s" % (begin, time.time(), os.environ['__TAUCMDR_MAX_MAKE_JOBS__']))
+
+
+class SchedulerTest(tests.TestCase):
+    """Unit tests for install_dependencies."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        self._environ = dict(os.environ)
+        os.environ['__TAUCMDR_MAX_MAKE_JOBS__'] = '4'
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self._environ)
+
+    def test_dependency_order(self):
+        papi = _FakeInstallation(self.prefix, 'papi')
+        pdt = _FakeInstallation(self.prefix, 'pdt')
+        scorep = _FakeInstallation(self.prefix, 'scorep', [papi, _FakeInstallation(self.prefix, 'pdt')])
+        tau = _FakeInstallation(self.prefix, 'tau', [papi, pdt, scorep])
+        scheduler.install_dependencies(tau)
+        papi_times, pdt_times, scorep_times = papi.times(), pdt.times(), scorep.times()
+        # PAPI and PDT build at the same time and split the make jobs
+        self.assertLess(papi_times[0], pdt_times[1])
+        self.assertLess(pdt_times[0], papi_times[1])
+        self.assertEqual(papi_times[2], 2)
+        self.assertGreaterEqual(scorep_times[0], max(papi_times[1], pdt_times[1]))
+        self.assertEqual(scorep_times[2], 4)
+        self.assertTrue(os.path.exists(scorep.install_prefix + '.log'))
+
+    def test_rollback(self):
+        papi = _FakeInstallation(self.prefix, 'papi', fail=True)
+        pdt = _FakeInstallation(self.prefix, 'pdt')
+        tau = _FakeInstallation(self.prefix, 'tau', [papi, pdt])
+        with self.assertRaises(SoftwarePackageError) as ctx:
+            scheduler.install_dependencies(tau)
+        self.assertIn('papi failed', ctx.exception.value)
+        self.assertFalse(os.path.exists(papi.install_prefix))
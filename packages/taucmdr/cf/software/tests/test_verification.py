@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of verification.py.
+"""
+
+import os
+from taucmdr import tests, util
+from taucmdr.cf.software.verification import VerificationManifests
+
+
+class VerificationManifestsTest(tests.TestCase):
+    """Unit tests for VerificationManifests."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        self.manifests = VerificationManifests(sample_size=0)
+        self.files = []
+        for name in 'libpapi.a', 'libpapi.so', 'papi.h':
+            path = os.path.join(self.prefix, name)
+            util.mkdirp(self.prefix)
+            with open(path, 'w') as fout:
+                fout.write(name)
+            self.files.append(path)
+        self.manifests.save(self.prefix, 'abc123', {'files': self.files, 'makefile': self.files[0]})
+
+    def test_load(self):
+        manifest = self.manifests.load(self.prefix, 'abc123')
+        self.assertEqual(manifest['makefile'], self.files[0])
+        self.assertItemsEqual(manifest['files'], self.files)
+        self.assertIsNone(self.manifests.load(self.prefix, 'def456'))
+        self.manifests.deep = True
+        self.assertIsNone(self.manifests.load(self.prefix, 'abc123'))
+
+    def test_changed(self):
+        with open(self.files[1], 'a') as fout:
+            fout.write('changed')
+        self.assertIsNone(self.manifests.load(self.prefix, 'abc123'))
+        self.manifests.save(self.prefix, 'abc123', {'files': self.files})
+        os.remove(self.files[2])
+        self.assertIsNone(self.manifests.load(self.prefix, 'abc123'))
+
+    def test_discard(self):
+        self.manifests.save(self.prefix, 'def456', {'files': []})
+        VerificationManifests.discard(self.prefix)
+        self.assertIsNone(self.manifests.load(self.prefix, 'abc123'))
+        self.assertIsNone(self.manifests.load(self.prefix, 'def456'))
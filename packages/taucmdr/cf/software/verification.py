@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Verification manifests for installed software packages.
+
+Verifying an installation checks that every command, library, and header it provides is accessible
+and TAU additionally searches for makefiles and libraries.  Installations are verified by every wrapped
+compile and every trial, often on a network filesystem, so after an installation passes a full 
+verification the files it checked are recorded in a manifest in the installation prefix.  Later 
+verifications read the manifest and compare the size and modification time of a sample of the 
+recorded files instead of scanning the installation again.
+
+Manifests are removed when a package is reinstalled.  Set :any:`VerificationManifests.deep` to
+ignore manifests and always perform a full verification.
+"""
+
+import os
+import json
+import random
+from taucmdr import logger, util
+
+
+LOGGER = logger.get_logger(__name__)
+
+MANIFEST_SUBDIR = '.taucmdr_verified'
+"""str: Name of the installation prefix subdirectory holding verification manifests."""
+
+MANIFEST_VERSION = 1
+"""int: Manifests written with a different version are ignored."""
+
+
+class VerificationManifests(object):
+    """Records of installations that passed a full verification.
+    
+    An installation prefix may hold several manifests, e.g. one for each TAU configuration sharing 
+    the prefix, so each manifest is named by a key chosen by the package.
+    
+    Attributes:
+        sample_size (int): Number of recorded files to check when a manifest is loaded, or 0 to check all.
+        deep (bool): If True then manifests are ignored so every verification scans the installation.
+    """
+
+    def __init__(self, sample_size):
+        self.sample_size = sample_size
+        self.deep = False
+
+    @staticmethod
+    def _path(install_prefix, key):
+        return os.path.join(install_prefix, MANIFEST_SUBDIR, key + '.json')
+
+    def load(self, install_prefix, key):
+        """Load the manifest of a verified installation.
+        
+        Args:
+            install_prefix (str): Installation prefix.
+            key (str): Manifest name.
+            
+        Returns:
+            dict: The manifest, or None if there is no manifest or the installation has changed since
+                  the manifest was written.
+        """
+        if self.deep:
+            return None
+        try:
+            with open(self._path(install_prefix, key)) as fin:
+                manifest = json.load(fin)
+        except (IOError, ValueError):
+            return None
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('prefix') != install_prefix:
+            return None
+        files = manifest['files']
+        paths = files.keys()
+        if self.sample_size and len(paths) > self.sample_size:
+            paths = random.sample(paths, self.sample_size)
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                LOGGER.debug("'%s' listed in verification manifest is missing", path)
+                return None
+            if [stat.st_size, stat.st_mtime] != files[path]:
+                LOGGER.debug("'%s' changed after it was verified", path)
+                return None
+        return manifest
+
+    def save(self, install_prefix, key, manifest):
+        """Write the manifest of an installation that passed a full verification.
+        
+        Failures are logged and otherwise ignored, e.g. the installation may be read-only.
+        
+        Args:
+            install_prefix (str): Installation prefix.
+            key (str): Manifest name.
+            manifest (dict): Manifest data.  The 'files' item lists paths to files found by verification.
+        """
+        manifest = dict(manifest, version=MANIFEST_VERSION, prefix=install_prefix)
+        path = self._path(install_prefix, key)
+        try:
+            files = {}
+            for fname in manifest['files']:
+                stat = os.stat(fname)
+                files[fname] = [stat.st_size, stat.st_mtime]
+            manifest['files'] = files
+            util.mkdirp(os.path.dirname(path))
+            util.atomic_write(path, json.dumps(manifest), fsync=False)
+        except (IOError, OSError) as err:
+            LOGGER.debug("Unable to write verification manifest '%s': %s", path, err)
+
+    @staticmethod
+    def discard(install_prefix):
+        """Remove all manifests in an installation prefix.
+        
+        Args:
+            install_prefix (str): Installation prefix.
+        """
+        util.rmtree(os.path.join(install_prefix, MANIFEST_SUBDIR), ignore_errors=True)
+
+
+VERIFICATION_MANIFESTS = VerificationManifests(sample_size=8)
+"""VerificationManifests: Manifests of all installations."""
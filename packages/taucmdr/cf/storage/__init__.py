@@ -35,7 +35,10 @@ The key/value store is accessed via the `[]` operator, i.e. treat the storage ob
 """
 
 
+import os
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+from taucmdr import util
 from taucmdr.error import Error
 
 
@@ -77,12 +80,15 @@ class AbstractStorage(object):
         name (str): The storage container's name, e.g. "system" or "user".
         prefix (str): Absolute path to the top-level directory of the container's filesystem.
         database (str): Database object implementing :any:`AbstractDatabase`. 
+        isolated_tables (bool): True if changing one table never rewrites another table, see :any:`lock`.
     """
 
     __metaclass__ = ABCMeta
     
     Record = StorageRecord
 
+    isolated_tables = True
+
     def __init__(self, name):
         self.name = name
         
@@ -173,6 +179,65 @@ class AbstractStorage(object):
             object: A database table object.
         """
 
+    def lock(self, table_name=None, shared=False):
+        """Return a context manager holding an interprocess lock on the storage container or one of its tables.
+
+        Shared locks are for operations that only read from the storage container and may be held by 
+        many processes at once.  Exclusive locks are for operations that must not run concurrently with
+        any other operation on the same table, e.g. read-modify-write sequences.  Locks on different 
+        tables do not exclude each other unless the container rewrites every table when any table 
+        changes (i.e. `isolated_tables` is False), in which case all table locks are the container lock.
+        If `table_name` is None then lock the whole container, e.g. to serialize software installation 
+        in the container's filesystem.
+        
+        Args:
+            table_name (str): Name of the table to lock or None.
+            shared (bool): If True acquire a shared lock, otherwise acquire an exclusive lock.
+            
+        Returns:
+            A context manager, see :any:`util.interprocess_lock`.
+        """
+        lock_file = '.lock' if table_name is None or not self.isolated_tables else '.%s.lock' % table_name.lower()
+        return util.interprocess_lock(os.path.join(self.prefix, lock_file), shared=shared)
+
+    def compact(self):
+        """Rewrite the database to reclaim space held by removed or modified records.
+        
+        The default implementation does nothing.
+        """
+
+    @contextmanager
+    def snapshot(self):
+        """Read one version of the database for the duration of the context.
+
+        Long-running readers use a snapshot to see a consistent database without holding a lock:
+        changes committed by other processes while the snapshot is held are not visible and don't 
+        wait for the snapshot to be released.  The default implementation provides no isolation.
+        """
+        yield
+
+    def add_index(self, table_name, fields):
+        """Declare that records in a table are frequently matched on the given fields.
+        
+        Storage containers may use this hint to build secondary indexes for equality lookups
+        by :any:`get`, :any:`search`, and :any:`contains`.  The default implementation ignores the hint.
+        
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractStorage.table`.
+            fields (iterable): Names of fields to index, or tuples of names for composite indexes.
+        """
+
+    def add_reference_index(self, table_name, fields):
+        """Declare that fields of records in a table hold element identifiers of other records.
+        
+        Storage containers may use this hint to build indexes for :any:`search_references`.  
+        The default implementation ignores the hint.
+        
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractStorage.table`.
+            fields (iterable): Names of reference fields to index.
+        """
+
     @abstractmethod
     def count(self, table_name=None):
         """Count the records in the database.
@@ -209,6 +274,23 @@ class AbstractStorage(object):
             ValueError: Invalid value for `keys`.
         """
 
+    def get_many(self, keys, table_name=None, match_any=False):
+        """Find a single record for each element of `keys`.
+        
+        The default implementation calls :any:`get` once per element.  Storage containers
+        that can look up many records in one pass should override this method.
+        
+        Args:
+            keys (list): Fields or element identifiers to match, see :any:`get`.
+            table_name (str): Name of the table to operate on.  See :any:`AbstractStorage.table`.
+            match_any (bool): Only applies to dictionaries in `keys`.  If True then any key 
+                              may match or if False then all keys must match.
+
+        Returns:
+            list: The matching data record, or None if no record was found, for each element of `keys`.
+        """
+        return [self.get(key, table_name=table_name, match_any=match_any) for key in keys]
+
     @abstractmethod
     def search(self, keys=None, table_name=None, match_any=False):
         """Find multiple records.
@@ -254,6 +336,24 @@ class AbstractStorage(object):
             ValueError: Invalid value for `keys`.
         """
 
+    def search_references(self, field, eids, table_name=None):
+        """Find records where `field` holds any of the element identifiers `eids`.
+        
+        A record's `field` holds an identifier if it is equal to the identifier or is a list 
+        containing the identifier.  The default implementation tests every record in the table.
+        
+        Args:
+            field (str): Name of the reference field to match.
+            eids (iterable): Element identifiers of referenced records.
+            table_name (str): Name of the table to operate on.  See :any:`AbstractStorage.table`.
+
+        Returns:
+            list: Matching data records.
+        """
+        eids = set(eids)
+        test = lambda x: not eids.isdisjoint(x) if isinstance(x, list) else x in eids
+        return self.match(field, test=test, table_name=table_name)
+
     @abstractmethod
     def contains(self, keys, table_name=None, match_any=False):
         """Check if the specified table contains at least one matching record.
@@ -290,6 +390,22 @@ class AbstractStorage(object):
             Record: The new record.
         """
 
+    def insert_many(self, data, table_name=None):
+        """Create new records.
+        
+        The default implementation calls :any:`insert` once per record in a single transaction.
+        Storage containers that can insert many records in one write should override this method.
+        
+        Args:
+            data (list): Dictionaries of data to insert in table.
+            table_name (str): Name of the table to operate on.  See :any:`AbstractStorage.table`.
+            
+        Returns:
+            list: The new records in the same order as `data`.
+        """
+        with self:
+            return [self.insert(item, table_name=table_name) for item in data]
+
     @abstractmethod
     def update(self, fields, keys, table_name=None, match_any=False):
         """Update records.
@@ -310,6 +426,33 @@ class AbstractStorage(object):
             ValueError: ``bool(keys) == False`` or invaild value for `keys`.
         """
 
+    def update_many(self, updates, table_name=None, match_any=False):
+        """Apply many updates to records.
+        
+        The default implementation calls :any:`update` once per update in a single transaction.
+        Storage containers that can apply many updates in one write should override this method.
+        
+        All keys are matched against the records as they were before any update was applied.
+        
+        Args:
+            updates (list): ``(fields, keys)`` tuples, see :any:`update`.  Updates are applied in order.
+            table_name (str): Name of the table to operate on.  See :any:`AbstractStorage.table`.
+            match_any (bool): Only applies to dictionaries in `keys`.  If True then any key 
+                              may match or if False then all keys must match.
+            
+        Raises:
+            ValueError: ``bool(keys) == False`` or invaild value for `keys`.
+        """
+        with self:
+            matched = []
+            for fields, keys in updates:
+                if isinstance(keys, dict):
+                    keys = [record.eid for record in self.search(keys, table_name=table_name, match_any=match_any)]
+                matched.append((fields, keys))
+            for fields, keys in matched:
+                if keys:
+                    self.update(fields, keys, table_name=table_name)
+
     @abstractmethod      
     def unset(self, fields, keys, table_name=None, match_any=False):
         """Update records by unsetting fields.
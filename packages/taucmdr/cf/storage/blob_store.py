@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Content-addressed blob storage.
+
+Blobs are byte strings too large or too repetitive to store in a record database, e.g. the shell 
+environment of a trial.  Each blob is stored once, zlib-compressed, in a file named by the SHA-1 hash
+of its contents.  Records hold the hash instead of the blob.
+"""
+
+import os
+import re
+import zlib
+import hashlib
+from taucmdr import util
+from taucmdr.cf.storage import StorageError
+
+
+_KEY_RE = re.compile('^[0-9a-f]{40}$')
+
+
+class BlobStore(object):
+    """A content-addressed store of compressed blobs in a directory.
+    
+    Blob files are written atomically and never modified so any number of processes may
+    read and write the store without locking.
+    
+    Attributes:
+        prefix (str): Absolute path to the directory holding the blob files.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    @staticmethod
+    def is_key(value):
+        """Returns True if `value` could be a blob key."""
+        return isinstance(value, basestring) and bool(_KEY_RE.match(value))
+
+    def _path(self, key):
+        if not self.is_key(key):
+            raise StorageError("Invalid blob key '%s'" % key)
+        return os.path.join(self.prefix, key[:2], key[2:])
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, data):
+        """Store a blob.
+        
+        Args:
+            data (str): Blob contents.
+            
+        Returns:
+            str: The blob's key.
+        """
+        key = hashlib.sha1(data).hexdigest()
+        path = self._path(key)
+        if not os.path.exists(path):
+            try:
+                util.mkdirp(os.path.dirname(path))
+                util.atomic_write(path, zlib.compress(data), fsync=False)
+            except (IOError, OSError) as err:
+                raise StorageError("Failed to write blob '%s': %s" % (path, err), "Check that you have `write` access.")
+        return key
+
+    def get(self, key):
+        """Retrieve a blob.
+        
+        Args:
+            key (str): The blob's key as returned by :any:`put`.
+            
+        Returns:
+            str: Blob contents.
+        
+        Raises:
+            StorageError: The blob does not exist or cannot be read.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fin:
+                return zlib.decompress(fin.read())
+        except (IOError, zlib.error) as err:
+            raise StorageError("Failed to read blob '%s': %s" % (path, err))
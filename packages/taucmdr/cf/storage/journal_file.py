@@ -0,0 +1,628 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+Journaled file backend for storage containers.
+
+A persistant, transactional record storage system that appends each database operation
+to a journal file instead of rewriting the whole database on every write.  The journal
+is periodically compacted into a snapshot file so that opening the database stays fast.
+"""
+
+import os
+import json
+import errno
+from contextlib import contextmanager
+import tinydb
+import fasteners
+from taucmdr import logger, util
+from taucmdr.error import ConfigurationError
+from taucmdr.cf.storage import StorageError
+from taucmdr.cf.storage.local_file import FileStorage, VERSION_KEY
+
+LOGGER = logger.get_logger(__name__)
+
+
+COMPACT_MIN_BYTES = 1024*1024
+"""int: The journal is not compacted until it is at least this many bytes long."""
+
+_DEFAULT_TABLE = '_default'
+
+
+def _matches(element, keys, match_any):
+    """Check if a database element has attributes matching `keys`.
+
+    Equivalent to evaluating the query built by :any:`LocalFileStorage._query` but avoids the
+    overhead of constructing and evaluating TinyDB query objects for every element.
+    """
+    if match_any:
+        return any(key in element and element[key] == value for key, value in keys.iteritems())
+    return all(key in element and element[key] == value for key, value in keys.iteritems())
+
+
+class JournalFileStorage(FileStorage):
+    """A persistant, transactional record storage system backed by an append-only journal.
+
+    The database is held in memory.  Each change is appended to the journal as a single line of JSON
+    so writing a record costs O(record) instead of O(database).  When the journal grows larger than
+    the snapshot it is compacted into a new snapshot and truncated.  Journal entries always name the
+    element identifiers they affect so replaying the journal is deterministic.
+
+    Changes made inside a transaction (i.e. ``with storage:``) are appended to the journal in a single
+    write when the outermost transaction exits, or discarded if the transaction raises an exception.
+    The journal is locked from the transaction's first change until it exits so that concurrent 
+    transactions can't assign the same element identifier to different records.
+
+    Attributes:
+        snapshot_file (str): Absolute path to the database snapshot file.
+        journal_file (str): Absolute path to the database journal file.
+    """
+
+    dbfile_ext = '.journal'
+
+    def __init__(self, name, prefix):
+        super(JournalFileStorage, self).__init__(name, prefix)
+        self._tables = None
+        self._last_eid = None
+        self._generation = 0
+        self._snapshot_stat = None
+        self._snapshot_size = 0
+        self._journal_stat = None
+        self._journal_offset = 0
+        self._readonly = False
+        self._pending = []
+        self._undo = None
+        self._undo_last_eid = None
+        self._pinned = 0
+        self._held_lock = None
+
+    @property
+    def snapshot_file(self):
+        return os.path.join(self.prefix, self.name + '.snapshot')
+
+    @property
+    def journal_file(self):
+        return self.dbfile
+
+    @property
+    def legacy_file(self):
+        """Path to the :any:`LocalFileStorage` database this database may be migrated from."""
+        return os.path.join(self.prefix, self.name + '.json')
+
+    @property
+    def database_files(self):
+        return [self.snapshot_file, self.journal_file]
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def _acquire_journal_lock(self):
+        if self._held_lock is None and not self._readonly:
+            lock = fasteners.InterProcessLock(self.journal_file + '.lock')
+            lock.acquire()
+            self._held_lock = lock
+
+    def _release_journal_lock(self):
+        if self._held_lock is not None:
+            self._held_lock.release()
+            self._held_lock = None
+
+    @contextmanager
+    def _journal_lock(self):
+        """Serialize journal writes and compaction between processes.
+
+        Does nothing if the lock is already held, e.g. by the current transaction.
+        """
+        if self._held_lock is not None or self._readonly:
+            yield
+            return
+        self._acquire_journal_lock()
+        try:
+            yield
+        finally:
+            self._release_journal_lock()
+
+    def _begin_changes(self):
+        """Lock the journal before the current transaction's first change.
+
+        The lock is held until the transaction ends so that the transaction changes the latest version
+        of the database and no other process can give new records the element identifiers it assigns.
+        """
+        if self._held_lock is None and not self._readonly:
+            self._acquire_journal_lock()
+            self._sync()
+            self._undo_last_eid = dict(self._last_eid)
+
+    def connect_database(self, *args, **kwargs):
+        """Open the database for reading and writing.
+
+        If neither the snapshot nor the journal exist but a :any:`LocalFileStorage` database
+        does exist then its records are migrated to this database.
+        """
+        if self._tables is None:
+            util.mkdirp(self.prefix)
+            self._readonly = not os.access(self.prefix, os.W_OK)
+            if (not self._readonly and os.path.exists(self.legacy_file) and
+                    not (os.path.exists(self.snapshot_file) or os.path.exists(self.journal_file))):
+                self.migrate(self.legacy_file)
+            else:
+                self._load()
+            LOGGER.debug("Initialized %s database '%s'", self.name, self.journal_file)
+
+    def disconnect_database(self, *args, **kwargs):
+        """Close the database for reading and writing."""
+        self._tables = None
+        self._last_eid = None
+        self._pending = []
+        super(JournalFileStorage, self).disconnect_database(*args, **kwargs)
+
+    def migrate(self, path):
+        """Replace all records in this database with records from a :any:`LocalFileStorage` database.
+
+        The :any:`LocalFileStorage` database file is not modified.
+
+        Args:
+            path (str): Path to the JSON database file.
+
+        Raises:
+            StorageError: The JSON database file could not be read.
+        """
+        try:
+            with open(path, 'r') as fin:
+                data = json.load(fin)
+        except (IOError, ValueError) as err:
+            raise StorageError("Failed to migrate %s database '%s': %s" % (self.name, path, err),
+                               "Check that you have `read` access and that the file is valid JSON.")
+        tables = {}
+        last_eid = {}
+        data.pop(VERSION_KEY, None)
+        for table_name, elements in data.iteritems():
+            table = tables[table_name] = {int(eid): element for eid, element in elements.iteritems()}
+            last_eid[table_name] = max(table) if table else 0
+        util.mkdirp(self.prefix)
+        with self._journal_lock():
+            self._write_snapshot(tables, last_eid, self._generation + 1)
+        LOGGER.debug("Migrated %d records from '%s' to %s database '%s'",
+                     sum(len(table) for table in tables.itervalues()), path, self.name, self.journal_file)
+
+    def _write_snapshot(self, tables, last_eid, generation):
+        """Write a new snapshot and an empty journal then make them the current database.
+
+        Must be called while holding the journal lock.
+        """
+        snapshot = json.dumps({'generation': generation, 'last_eid': last_eid, 'tables': tables})
+        header = json.dumps({'generation': generation}) + '\n'
+        util.atomic_write(self.snapshot_file, snapshot)
+        util.atomic_write(self.journal_file, header)
+        self._tables = tables
+        self._last_eid = last_eid
+        self._generation = generation
+        self._snapshot_size = len(snapshot)
+        self._snapshot_stat = self._stat(self.snapshot_file)
+        self._journal_stat = self._stat(self.journal_file)
+        self._journal_offset = len(header)
+
+    def _load(self):
+        """Read the snapshot and replay the journal."""
+        tables = {}
+        last_eid = {}
+        generation = 0
+        snapshot_size = 0
+        try:
+            with open(self.snapshot_file, 'r') as fin:
+                snapshot_size = os.fstat(fin.fileno()).st_size
+                snapshot = json.load(fin)
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise StorageError("Failed to access %s database '%s': %s" % (self.name, self.snapshot_file, err),
+                                   "Check that you have `read` access")
+        except ValueError as err:
+            raise StorageError("Database snapshot '%s' is corrupt: %s" % (self.snapshot_file, err))
+        else:
+            generation = snapshot['generation']
+            last_eid = snapshot['last_eid']
+            for table_name, elements in snapshot['tables'].iteritems():
+                tables[table_name] = {int(eid): element for eid, element in elements.iteritems()}
+        self._tables = tables
+        self._last_eid = last_eid
+        self._generation = generation
+        self._snapshot_size = snapshot_size
+        self._snapshot_stat = self._stat(self.snapshot_file)
+        self._journal_stat = None
+        self._journal_offset = 0
+        self._replay()
+
+    def _replay(self):
+        """Apply journal entries that have been written since the journal was last replayed."""
+        try:
+            fin = open(self.journal_file, 'r')
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise StorageError("Failed to access %s database '%s': %s" % (self.name, self.journal_file, err),
+                                   "Check that you have `read` access")
+            return
+        with fin:
+            stat = os.fstat(fin.fileno())
+            if self._journal_stat and self._journal_stat[0] != stat.st_ino:
+                # The journal was compacted by another process
+                return self._load()
+            offset = self._journal_offset
+            fin.seek(offset)
+            for line in fin:
+                if not line.endswith('\n'):
+                    # Another process is still writing this entry
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    LOGGER.warning("Ignoring corrupt entry in %s database journal '%s'", self.name, self.journal_file)
+                    continue
+                if 'op' in entry:
+                    self._apply(entry)
+                elif entry['generation'] > self._generation:
+                    # The snapshot was replaced after we read it
+                    return self._load()
+                elif entry['generation'] < self._generation:
+                    # Stale journal left behind by an interrupted compaction
+                    offset = stat.st_size
+                    break
+            self._journal_offset = offset
+            self._journal_stat = (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def _sync(self):
+        """Catch up with changes made to the database by other processes."""
+        if self._stat(self.snapshot_file) != self._snapshot_stat:
+            self._load()
+        elif self._stat(self.journal_file) != self._journal_stat:
+            self._replay()
+
+    def _apply(self, entry):
+        """Apply a journal entry to the in-memory database."""
+        table_name = entry['table']
+        table = self._tables.setdefault(table_name, {})
+        operation = entry['op']
+        if operation == 'insert':
+            eid = entry['eid']
+            table[eid] = dict(entry['data'])
+            self._last_eid[table_name] = max(self._last_eid.get(table_name, 0), eid)
+        elif operation == 'update':
+            for eid in entry['eids']:
+                if eid in table:
+                    table[eid].update(entry['fields'])
+        elif operation == 'unset':
+            for eid in entry['eids']:
+                for field in entry['fields']:
+                    table.get(eid, {}).pop(field, None)
+        elif operation == 'remove':
+            for eid in entry['eids']:
+                table.pop(eid, None)
+        elif operation == 'purge':
+            table.clear()
+            self._last_eid[table_name] = 0
+        else:
+            raise StorageError("Invalid operation '%s' in %s database journal '%s'" %
+                               (operation, self.name, self.journal_file))
+
+    def _log(self, entry):
+        """Apply a journal entry and add it to the current transaction.
+
+        Must be called inside a transaction.
+        """
+        table = self._tables.setdefault(entry['table'], {})
+        affected = table.iterkeys() if entry['op'] == 'purge' else entry.get('eids', (entry.get('eid'),))
+        for eid in affected:
+            key = (entry['table'], eid)
+            if key not in self._undo:
+                element = table.get(eid, None)
+                self._undo[key] = dict(element) if element is not None else None
+        self._apply(entry)
+        self._pending.append(entry)
+
+    def _rollback(self):
+        """Discard changes made in the current transaction."""
+        for (table_name, eid), element in self._undo.iteritems():
+            table = self._tables.setdefault(table_name, {})
+            if element is None:
+                table.pop(eid, None)
+            else:
+                table[eid] = element
+        self._last_eid = self._undo_last_eid
+        self._pending = []
+
+    def _flush(self):
+        """Append changes made in the current transaction to the journal."""
+        if not self._pending:
+            return
+        if self._readonly:
+            self._rollback()
+            raise ConfigurationError("Cannot write to '%s'" % self.journal_file, "Check that you have `write` access.")
+        pending = self._pending
+        self._pending = []
+        data = ''.join(json.dumps(entry) + '\n' for entry in pending)
+        try:
+            with self._journal_lock():
+                if not os.path.exists(self.journal_file):
+                    header = json.dumps({'generation': self._generation}) + '\n'
+                    util.atomic_write(self.journal_file, header)
+                    self._journal_offset = len(header)
+                with open(self.journal_file, 'a') as fout:
+                    fout.write(data)
+                self._journal_offset += len(data)
+                self._journal_stat = self._stat(self.journal_file)
+                if self._journal_offset > max(COMPACT_MIN_BYTES, self._snapshot_size):
+                    self._compact()
+        except (IOError, OSError) as err:
+            self._rollback()
+            raise StorageError("Failed to write %s database '%s': %s" % (self.name, self.journal_file, err),
+                               "Check that you have `write` access")
+
+    def _compact(self):
+        LOGGER.debug("Compacting %s database journal '%s' (%s)",
+                     self.name, self.journal_file, util.human_size(self._journal_offset))
+        self._write_snapshot(self._tables, self._last_eid, self._generation + 1)
+
+    def compact(self):
+        """Write all records to a new snapshot and truncate the journal."""
+        self.connect_database()
+        with self._journal_lock():
+            self._sync()
+            self._compact()
+
+    def __enter__(self):
+        """Initiates the database transaction."""
+        if self._transaction_count == 0:
+            self.connect_database()
+            self._sync()
+            self._pending = []
+            self._undo = {}
+            self._undo_last_eid = dict(self._last_eid)
+            self._begin_kvstore()
+        self._transaction_count += 1
+        return self
+
+    def __exit__(self, ex_type, value, traceback):
+        """Finalizes the database transaction."""
+        self._transaction_count -= 1
+        if self._transaction_count == 0:
+            try:
+                if ex_type:
+                    self._rollback()
+                else:
+                    self._flush()
+            except Exception:
+                self._end_kvstore(StorageError)
+                raise
+            finally:
+                self._undo = None
+                self._undo_last_eid = None
+                self._release_journal_lock()
+            self._end_kvstore(ex_type)
+        return False
+
+    @contextmanager
+    def snapshot(self):
+        """Read one version of the database for the duration of the context.
+
+        The in-memory database is not brought up to date with the journal while the snapshot is held.
+        Transactions begun while the snapshot is held still apply changes made by other processes
+        first, so that journal entries are always applied in order.
+        """
+        self.connect_database()
+        if not self._pinned:
+            self._sync()
+        self._pinned += 1
+        try:
+            yield
+        finally:
+            self._pinned -= 1
+
+    def table(self, table_name):
+        self.connect_database()
+        if self._transaction_count == 0 and not self._pinned:
+            self._sync()
+        return self._tables.setdefault(table_name or _DEFAULT_TABLE, {})
+
+    def _record(self, eid, element):
+        return self.Record(self, eid=eid, element=element)
+
+    def _matching(self, table, keys, match_any):
+        """Return the element identifiers of records in `table` with attributes matching `keys`."""
+        return [eid for eid, element in table.iteritems() if _matches(element, keys, match_any)]
+
+    def count(self, table_name=None):
+        """Count the records in the database.
+
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractDatabase.table`.
+
+        Returns:
+            int: Number of records in the table.
+        """
+        return len(self.table(table_name))
+
+    def get(self, keys, table_name=None, match_any=False):
+        """Find a single record.
+
+        See :any:`AbstractStorage.get`.
+        """
+        table = self.table(table_name)
+        if keys is None:
+            return None
+        elif isinstance(keys, self.Record.eid_type):
+            element = table.get(keys, None)
+            return self._record(keys, element) if element is not None else None
+        elif isinstance(keys, dict) and keys:
+            for eid, element in table.iteritems():
+                if _matches(element, keys, match_any):
+                    return self._record(eid, element)
+            return None
+        elif isinstance(keys, (list, tuple)):
+            return [self.get(key, table_name=table_name, match_any=match_any) for key in keys]
+        else:
+            raise ValueError(keys)
+
+    def search(self, keys=None, table_name=None, match_any=False):
+        """Find multiple records.
+
+        See :any:`AbstractStorage.search`.
+        """
+        table = self.table(table_name)
+        if keys is None:
+            return [self._record(eid, element) for eid, element in table.iteritems()]
+        elif isinstance(keys, self.Record.eid_type):
+            element = table.get(keys, None)
+            return [self._record(keys, element)] if element is not None else []
+        elif isinstance(keys, dict) and keys:
+            return [self._record(eid, table[eid]) for eid in self._matching(table, keys, match_any)]
+        elif isinstance(keys, (list, tuple)):
+            result = []
+            for key in keys:
+                result.extend(self.search(keys=key, table_name=table_name, match_any=match_any))
+            return result
+        else:
+            raise ValueError(keys)
+
+    def match(self, field, table_name=None, regex=None, test=None):
+        """Find records where `field` matches `regex` or `test`.
+
+        See :any:`AbstractStorage.match`.
+        """
+        table = self.table(table_name)
+        if test is not None:
+            query = tinydb.where(field).test(test)
+        elif regex is not None:
+            query = tinydb.where(field).matches(regex)
+        else:
+            query = tinydb.where(field).matches(".*")
+        return [self._record(eid, element) for eid, element in table.iteritems() if query(element)]
+
+    def contains(self, keys, table_name=None, match_any=False):
+        """Check if the specified table contains at least one matching record.
+
+        See :any:`AbstractStorage.contains`.
+        """
+        table = self.table(table_name)
+        if keys is None:
+            return False
+        elif isinstance(keys, self.Record.eid_type):
+            return keys in table
+        elif isinstance(keys, dict) and keys:
+            return any(_matches(element, keys, match_any) for element in table.itervalues())
+        elif isinstance(keys, (list, tuple)):
+            return [self.contains(keys=key, table_name=table_name, match_any=match_any) for key in keys]
+        else:
+            raise ValueError(keys)
+
+    def _affected(self, table, keys, match_any):
+        """Return the element identifiers of records to be modified.
+
+        Raises:
+            KeyError: `keys` lists an element identifier that is not in the table.
+            ValueError: Invalid value for `keys`.
+        """
+        if isinstance(keys, self.Record.eid_type):
+            eids = [keys]
+        elif isinstance(keys, dict) and keys:
+            return self._matching(table, keys, match_any)
+        elif isinstance(keys, (list, tuple)):
+            eids = list(keys)
+        else:
+            raise ValueError(keys)
+        for eid in eids:
+            if eid not in table:
+                raise KeyError(eid)
+        return eids
+
+    def insert(self, data, table_name=None):
+        """Create a new record.
+
+        See :any:`AbstractStorage.insert`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            self._begin_changes()
+            eid = self._last_eid.get(table_name, 0) + 1
+            self._log({'op': 'insert', 'table': table_name, 'eid': eid, 'data': dict(data)})
+        return self._record(eid, data)
+
+    def update(self, fields, keys, table_name=None, match_any=False):
+        """Update records.
+
+        See :any:`AbstractStorage.update`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            self._begin_changes()
+            eids = self._affected(self.table(table_name), keys, match_any)
+            if eids:
+                self._log({'op': 'update', 'table': table_name, 'eids': eids, 'fields': dict(fields)})
+
+    def unset(self, fields, keys, table_name=None, match_any=False):
+        """Update records by unsetting fields.
+
+        See :any:`AbstractStorage.unset`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            self._begin_changes()
+            table = self.table(table_name)
+            eids = self._affected(table, keys, match_any)
+            for eid in eids:
+                for field in fields:
+                    if field not in table[eid]:
+                        raise KeyError(field)
+            if eids:
+                self._log({'op': 'unset', 'table': table_name, 'eids': eids, 'fields': list(fields)})
+
+    def remove(self, keys, table_name=None, match_any=False):
+        """Delete records.
+
+        See :any:`AbstractStorage.remove`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            self._begin_changes()
+            eids = self._affected(self.table(table_name), keys, match_any)
+            if eids:
+                self._log({'op': 'remove', 'table': table_name, 'eids': eids})
+
+    def purge(self, table_name=None):
+        """Delete all records.
+
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractDatabase.table`.
+        """
+        LOGGER.debug("%s: purge()", table_name)
+        with self:
+            self._begin_changes()
+            self._log({'op': 'purge', 'table': table_name or _DEFAULT_TABLE})
@@ -38,21 +38,43 @@ It's a good place for user-specific records, i.e. preferences or encrypted login
 Project-level records define the project and its member components.  The user may also
 want to install software packages at the project level to avoid quotas or in situations
 where :any:`USER_PREFIX` is not accessible from cluster compute nodes.
+
+Each level's storage backend is selected by setting the ``__TAUCMDR_SYSTEM_STORAGE__``,
+``__TAUCMDR_USER_STORAGE__``, or ``__TAUCMDR_PROJECT_STORAGE__`` environment variable to
+one of the keys of :any:`STORAGE_BACKENDS`.  The default backend is ``local``.
 """
 
+import os
+from contextlib import contextmanager
 from taucmdr import SYSTEM_PREFIX, USER_PREFIX
 from taucmdr.cf.storage import StorageError
 from taucmdr.cf.storage.local_file import LocalFileStorage
-from taucmdr.cf.storage.project import ProjectStorage
+from taucmdr.cf.storage.journal_file import JournalFileStorage
+from taucmdr.cf.storage.sqlite_file import SqliteStorage
+from taucmdr.cf.storage.project import project_storage
+
+
+STORAGE_BACKENDS = {'local': LocalFileStorage,
+                    'journal': JournalFileStorage,
+                    'sqlite': SqliteStorage}
+"""Storage backend classes indexed by the names used to select them."""
+
+def _storage_backend(level_name):
+    backend = os.environ.get('__TAUCMDR_%s_STORAGE__' % level_name.upper(), 'local')
+    try:
+        return STORAGE_BACKENDS[backend]
+    except KeyError:
+        raise StorageError("Invalid %s storage backend '%s'" % (level_name, backend),
+                           "Valid backends are: %s" % ', '.join(sorted(STORAGE_BACKENDS)))
 
 
-SYSTEM_STORAGE = LocalFileStorage('system', SYSTEM_PREFIX)
+SYSTEM_STORAGE = _storage_backend('system')('system', SYSTEM_PREFIX)
 """System-level data storage."""
 
-USER_STORAGE = LocalFileStorage('user', USER_PREFIX)
+USER_STORAGE = _storage_backend('user')('user', USER_PREFIX)
 """User-level data storage."""
 
-PROJECT_STORAGE = ProjectStorage()
+PROJECT_STORAGE = project_storage(_storage_backend('project'))
 """Project-level data storage."""
 
 ORDERED_LEVELS = (PROJECT_STORAGE, USER_STORAGE, SYSTEM_STORAGE)
@@ -73,3 +95,24 @@ def highest_writable_storage():
             raise StorageError("No writable storage levels")
         return highest_writable_storage.value
 
+@contextmanager
+def snapshot(levels=ORDERED_LEVELS):
+    """Read one version of each storage level's database for the duration of the context.
+    
+    See :any:`AbstractStorage.snapshot`.  Storage levels whose databases cannot be opened, 
+    e.g. project storage outside of a project, are skipped.
+    
+    Args:
+        levels (tuple): Storage levels to snapshot.
+    """
+    if not levels:
+        yield
+        return
+    try:
+        levels[0].connect_database()
+    except (StorageError, OSError):
+        with snapshot(levels[1:]):
+            yield
+        return
+    with levels[0].snapshot(), snapshot(levels[1:]):
+        yield
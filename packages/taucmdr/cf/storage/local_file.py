@@ -34,8 +34,11 @@ both the database and the key/value store.
 
 import os
 import json
+import atexit
+import marshal
 import tinydb
 import tempfile
+from contextlib import contextmanager
 from tinydb import operations
 from taucmdr import logger, util
 from taucmdr.error import ConfigurationError
@@ -44,6 +47,169 @@ from taucmdr.cf.storage import AbstractStorage, StorageRecord, StorageError
 LOGGER = logger.get_logger(__name__)
 
 
+_DEFAULT_TABLE = '_default'
+
+_CACHE_FORMAT = 'taucmdr-json-cache-1'
+
+VERSION_KEY = '_version'
+"""str: Name of the database file header field holding the number of times the file has been written."""
+
+CACHE_STATISTICS = {'hits': 0, 'misses': 0, 'index_hits': 0, 'index_misses': 0}
+"""dict: Number of times a database file was loaded from its parse cache (hits) or parsed (misses), 
+and number of times a table index was loaded from the index sidecar file (index_hits) or built (index_misses)."""
+
+
+def _log_cache_statistics():
+    loads = CACHE_STATISTICS['hits'] + CACHE_STATISTICS['misses']
+    if loads:
+        LOGGER.debug("Database parse cache: %(hits)d hits, %(misses)d misses", CACHE_STATISTICS)
+    if CACHE_STATISTICS['index_hits'] + CACHE_STATISTICS['index_misses']:
+        LOGGER.debug("Database index cache: %(index_hits)d hits, %(index_misses)d misses", CACHE_STATISTICS)
+
+atexit.register(_log_cache_statistics)
+
+
+def _index_key(value):
+    """Return a hashable key that compares equal to the keys of equal values."""
+    try:
+        hash(value)
+    except TypeError:
+        return (_index_key, json.dumps(value, sort_keys=True))
+    return value
+
+
+class _TableIndex(object):
+    """Secondary hash indexes mapping field values to element identifiers in one table.
+    
+    A tuple of field names declares a composite index on the combined values of those fields.
+    Elements are only entered in a composite index if they have all of its fields.
+    
+    Reference fields hold the element identifier, or a list of element identifiers, of records in 
+    another table.  They are indexed by each identifier they hold so that the records referring to a 
+    given record can be found without testing every record in the table.
+    
+    Attributes:
+        fields (frozenset): Names of indexed fields, or tuples of names for composite indexes.
+        field_names (frozenset): Names of all fields that are part of an index.
+        references (frozenset): Names of indexed reference fields.
+        generation (int): Generation of the database file the index was built from, see :any:`_JsonFileStorage`.
+    """
+    
+    def __init__(self, fields, references=()):
+        self.fields = frozenset(fields)
+        self.field_names = frozenset(name for field in self.fields 
+                                     for name in (field if isinstance(field, tuple) else (field,)))
+        self.references = frozenset(references)
+        self.generation = None
+        self._entries = {}
+        self._referrers = {}
+
+    @staticmethod
+    def _has_field(element, field):
+        if isinstance(field, tuple):
+            return all(name in element for name in field)
+        return field in element
+
+    @staticmethod
+    def _field_key(element, field):
+        if isinstance(field, tuple):
+            return tuple(_index_key(element[name]) for name in field)
+        return _index_key(element[field])
+
+    @staticmethod
+    def _referenced(element, field):
+        value = element.get(field, None)
+        if value is None:
+            return ()
+        elif isinstance(value, list):
+            return set(_index_key(item) for item in value)
+        return (_index_key(value),)
+
+    def build(self, elements, generation):
+        self._entries = {field: {} for field in self.fields}
+        self._referrers = {field: {} for field in self.references}
+        for eid, element in elements.iteritems():
+            self.add(eid, element)
+        self.generation = generation
+
+    def state(self):
+        """Return the index contents in a form that can be saved with :py:mod:`marshal`."""
+        return (self.fields, self.references, self._entries, self._referrers)
+
+    def restore(self, state, generation):
+        """Use index contents returned by :any:`state` if they index the same fields as this index.
+        
+        Returns:
+            bool: True if `state` was used, False if the index must be built.
+        """
+        if state is None:
+            return False
+        fields, references, entries, referrers = state
+        if fields != self.fields or references != self.references:
+            return False
+        self._entries = entries
+        self._referrers = referrers
+        self.generation = generation
+        return True
+
+    def add(self, eid, element):
+        for field in self.fields:
+            if self._has_field(element, field):
+                self._entries[field].setdefault(self._field_key(element, field), set()).add(eid)
+        for field in self.references:
+            referrers = self._referrers[field]
+            for key in self._referenced(element, field):
+                referrers.setdefault(key, set()).add(eid)
+
+    @staticmethod
+    def _discard(entry, key, eid):
+        eids = entry.get(key, None)
+        if eids is not None:
+            eids.discard(eid)
+            if not eids:
+                del entry[key]
+
+    def discard(self, eid, element):
+        for field in self.fields:
+            if self._has_field(element, field):
+                self._discard(self._entries[field], self._field_key(element, field), eid)
+        for field in self.references:
+            referrers = self._referrers[field]
+            for key in self._referenced(element, field):
+                self._discard(referrers, key, eid)
+
+    def referrers(self, field, eids):
+        """Find element identifiers of elements whose reference field `field` holds any of `eids`.
+        
+        Returns:
+            set: Identifiers of referring elements, or None if `field` is not an indexed reference field.
+        """
+        if field not in self.references:
+            return None
+        referrers = self._referrers[field]
+        return set().union(*(referrers.get(_index_key(eid), ()) for eid in eids))
+
+    def lookup(self, keys, match_any):
+        """Find element identifiers of elements that may match `keys`.
+        
+        Returns:
+            set: Identifiers of candidate elements, or None if the index can't narrow the search.
+        """
+        indexed = [field for field in keys if field in self.fields]
+        if match_any:
+            if not indexed or len(indexed) != len(keys):
+                return None
+            return set().union(*(self._entries[field].get(_index_key(keys[field]), ()) for field in indexed))
+        # A composite index covering the keys narrows the search better than its parts
+        composite = [field for field in self.fields if isinstance(field, tuple) and self._has_field(keys, field)]
+        if composite:
+            indexed = [field for field in indexed if not any(field in covered for covered in composite)] + composite
+        elif not indexed:
+            return None
+        candidates = sorted((self._entries[field].get(self._field_key(keys, field), set()) for field in indexed), 
+                            key=len)
+        return set(candidates[0]).intersection(*candidates[1:])
+
 
 class _JsonRecord(StorageRecord):
     eid_type = int
@@ -63,82 +229,429 @@ class _JsonFileStorage(tinydb.JSONStorage):
     
     TinyDB's default storage (:any:`tinydb.JSONStorage`) assumes write access to the JSON file.
     This isn't the case for system-level storage and possibly others.
+    
+    The parsed file is kept in memory and only parsed again when the file changes.  `generation`
+    is incremented each time the file is loaded so that indexes know when to rebuild.  The parsed 
+    file is also saved in a :py:mod:`marshal` sidecar file (:any:`cache_path`) tagged with the file's 
+    inode, size, and modification time so that other processes can skip parsing the unchanged file.
+    Table indexes built from the file are saved the same way in a second sidecar file (:any:`index_path`)
+    so that other processes can skip building them.
+    
+    The file is always replaced atomically (write to a temporary file, fsync, rename).  Between 
+    :any:`begin` and :any:`commit` writes only change the in-memory copy of the file so that 
+    a transaction rewrites the file once no matter how many records it changes.
+
+    Each write increments `version`, which is stored in the file's :any:`VERSION_KEY` field.  Since 
+    the file is never modified in place, a reader can keep using the version it loaded for as long
+    as it likes.  Between :any:`pin` and :any:`unpin` the loaded version is used even if the file 
+    has changed, and writing fails if the file has changed.
     """
     def __init__(self, path):
+        # pylint: disable=super-init-not-called
+        # tinydb.JSONStorage.__init__ touches the file, which would invalidate the parse cache, 
+        # and keeps a handle open, which would be stale after the file is replaced.
+        self.path = path
+        self._data = None
+        self._stat = None
+        self._committed = None
+        self._dirty = False
+        self._pinned = 0
+        self.generation = 0
+        self.version = 0
         try:
-            super(_JsonFileStorage, self).__init__(path)
+            # Create the file if it doesn't exist without modifying an existing file
+            open(path, 'a').close()
         except IOError:
-            self.path = path
-            self._handle = open(path, 'r')
+            open(path, 'r').close()
             self.readonly = True
             LOGGER.debug("'%s' opened read-only", path)
         else:
-            self.readonly = False
-            LOGGER.debug("'%s' opened read-write", path)
+            # The file is replaced on write so its directory must be writable too
+            self.readonly = not os.access(os.path.dirname(path), os.W_OK)
+            LOGGER.debug("'%s' opened %s", path, 'read-only' if self.readonly else 'read-write')
+
+    @property
+    def cache_path(self):
+        return self.path + '.cache'
+
+    @staticmethod
+    def _stat_key(stat):
+        return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def _load_cache(self, stat_key):
+        try:
+            with open(self.cache_path, 'rb') as fin:
+                fmt, key, data = marshal.load(fin)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if fmt != _CACHE_FORMAT or key != stat_key:
+            return None
+        return data
+
+    def _save_cache(self, stat_key, data):
+        if self.readonly:
+            return
+        try:
+            util.atomic_write(self.cache_path, marshal.dumps((_CACHE_FORMAT, stat_key, data)), fsync=False)
+        except (IOError, OSError, ValueError) as err:
+            LOGGER.debug("Failed to write parse cache '%s': %s", self.cache_path, err)
+
+    @property
+    def index_path(self):
+        return self.path + '.index'
+
+    def _load_indexes(self):
+        try:
+            with open(self.index_path, 'rb') as fin:
+                fmt, key, indexes = marshal.load(fin)
+        except (IOError, EOFError, ValueError, TypeError):
+            return {}
+        if fmt != _CACHE_FORMAT or key != self._stat:
+            return {}
+        return indexes
+
+    def load_index(self, table_name):
+        """Return index contents saved by :any:`save_index` for the loaded version of the file.
+        
+        Returns:
+            The saved contents of the table's index, or None if they weren't saved or changes
+            to the file haven't been written yet.
+        """
+        if self._dirty or self._stat is None:
+            return None
+        return self._load_indexes().get(table_name, None)
+
+    def save_index(self, table_name, state):
+        """Save the contents of a table's index built from the loaded version of the file.
+        
+        Args:
+            table_name (str): Name of the indexed table.
+            state: Index contents, see :any:`_TableIndex.state`.
+        """
+        if self.readonly or self._dirty or self._stat is None:
+            return
+        indexes = self._load_indexes()
+        indexes[table_name] = state
+        try:
+            util.atomic_write(self.index_path, marshal.dumps((_CACHE_FORMAT, self._stat, indexes)), fsync=False)
+        except (IOError, OSError, ValueError) as err:
+            LOGGER.debug("Failed to write index cache '%s': %s", self.index_path, err)
+
+    def _load(self):
+        with open(self.path, 'r') as fin:
+            stat_key = self._stat_key(os.fstat(fin.fileno()))
+            data = self._load_cache(stat_key)
+            if data is not None:
+                CACHE_STATISTICS['hits'] += 1
+            else:
+                CACHE_STATISTICS['misses'] += 1
+                data = json.load(fin)
+                self._save_cache(stat_key, data)
+        self.version = data.pop(VERSION_KEY, 0)
+        self._data = {table_name: {int(eid): element for eid, element in elements.iteritems()}
+                      for table_name, elements in data.iteritems()}
+        self._stat = stat_key
+        self.generation += 1
+
+    def read(self):
+        if self._committed is not None or (self._pinned and self._data is not None):
+            return self._data
+        if self._data is None or self._stat_key(os.stat(self.path)) != self._stat:
+            self._load()
+        return self._data
 
-    def write(self, *args, **kwargs):
+    def pin(self):
+        """Keep reading the currently loaded version of the file until :any:`unpin`."""
+        if not self._pinned and self._committed is None:
+            try:
+                self.read()
+            except ValueError:
+                # New, empty file
+                self._data = {}
+                self._stat = self._stat_key(os.stat(self.path))
+            LOGGER.debug("Pinned '%s' version %d", self.path, self.version)
+        self._pinned += 1
+
+    def unpin(self):
+        """Resume reading the latest version of the file."""
+        self._pinned -= 1
+
+    def write(self, data):
         if self.readonly:
             raise ConfigurationError("Cannot write to '%s'" % self.path, "Check that you have `write` access.")
+        self._data = data
+        if self._committed is None:
+            self._flush()
         else:
-            super(_JsonFileStorage, self).write(*args, **kwargs)
+            self._dirty = True
+
+    def _flush(self):
+        if self._pinned and self._stat_key(os.stat(self.path)) != self._stat:
+            raise StorageError("'%s' was changed by another process after version %d was pinned" % 
+                               (self.path, self.version), "Try the operation again.")
+        data = dict(self._data)
+        data[VERSION_KEY] = self.version + 1
+        try:
+            stat = util.atomic_write(self.path, json.dumps(data, separators=(',', ':')))
+        except (IOError, OSError) as err:
+            raise StorageError("Failed to write '%s': %s" % (self.path, err), "Check that you have `write` access.")
+        self._stat = self._stat_key(stat)
+        self.version += 1
 
+    def rewrite(self):
+        """Write the file even if it hasn't changed, dropping empty tables."""
+        self._data = {table_name: elements for table_name, elements in self.read().iteritems() if elements}
+        self._flush()
 
-class LocalFileStorage(AbstractStorage):
-    """A persistant, transactional record storage system.  
+    def begin(self):
+        """Begin a transaction: defer writes until :any:`commit`."""
+        try:
+            self._committed = self.read()
+        except ValueError:
+            self._committed = {}
+        self._data = dict(self._committed)
+        self._dirty = False
+
+    def commit(self):
+        """End a transaction: write the file if the transaction changed it."""
+        committed, self._committed = self._committed, None
+        if self._dirty:
+            self._dirty = False
+            try:
+                self._flush()
+            except StorageError:
+                self._data = committed
+                raise
+
+    def rollback(self):
+        """End a transaction: discard all changes made since :any:`begin`."""
+        if self._committed is not None:
+            self._data, self._committed = self._committed, None
+            self._dirty = False
+
+
+class _KeyValueFile(object):
+    """A dictionary persisted to a JSON file separately from the record database.
+    
+    Like :any:`_JsonFileStorage`, the file is only parsed again when it changes and is always replaced
+    atomically.  Between :any:`begin` and :any:`commit` changes are only made in memory.
+    
+    Attributes:
+        path (str): Path to the JSON file.
+        readonly (bool): True if the file cannot be written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.readonly = not os.access(os.path.dirname(path), os.W_OK)
+        self._data = None
+        self._stat = None
+        self._committed = None
+        self._dirty = False
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _read(self):
+        if self._committed is not None:
+            return self._data
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            if self._data is None:
+                self._data = {}
+            return self._data
+        if self._data is None or (stat.st_ino, stat.st_size, stat.st_mtime) != self._stat:
+            try:
+                with open(self.path, 'r') as fin:
+                    stat = os.fstat(fin.fileno())
+                    self._data = json.load(fin)
+            except (IOError, ValueError) as err:
+                raise StorageError("Failed to read '%s': %s" % (self.path, err), "Check that you have `read` access.")
+            self._stat = (stat.st_ino, stat.st_size, stat.st_mtime)
+        return self._data
+
+    def _replace(self, data):
+        if self.readonly:
+            raise ConfigurationError("Cannot write to '%s'" % self.path, "Check that you have `write` access.")
+        if self._committed is not None:
+            self._data = data
+            self._dirty = True
+            return
+        try:
+            stat = util.atomic_write(self.path, json.dumps(data))
+        except (IOError, OSError) as err:
+            raise StorageError("Failed to write '%s': %s" % (self.path, err), "Check that you have `write` access.")
+        self._data = data
+        self._stat = (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def begin(self):
+        """Begin a transaction: defer writes until :any:`commit`."""
+        self._committed = self._read()
+        self._data = dict(self._committed)
+        self._dirty = False
+
+    def commit(self):
+        """End a transaction: write the file if the transaction changed it."""
+        committed, self._committed = self._committed, None
+        if self._dirty:
+            self._dirty = False
+            try:
+                self._replace(self._data)
+            except StorageError:
+                self._data = committed
+                raise
+
+    def rollback(self):
+        """End a transaction: discard all changes made since :any:`begin`."""
+        if self._committed is not None:
+            self._data, self._committed = self._committed, None
+            self._dirty = False
+
+    def __len__(self):
+        return len(self._read())
+
+    def __getitem__(self, key):
+        return self._read()[key]
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __delitem__(self, key):
+        data = dict(self._read())
+        del data[key]
+        self._replace(data)
+
+    def __contains__(self, key):
+        return key in self._read()
+
+    def __iter__(self):
+        return iter(self._read().keys())
+
+    def iterkeys(self):
+        return iter(self._read().keys())
+
+    def itervalues(self):
+        return iter(self._read().values())
+
+    def iteritems(self):
+        return iter(self._read().items())
+
+    def get(self, key, default=None):
+        return self._read().get(key, default)
+
+    def get_many(self, keys, default=None):
+        """Retrieve several values at once.
+        
+        Args:
+            keys (list): Keys to look up.
+            default: Value to return for keys that are not in the store.
+        
+        Returns:
+            list: The value of each key in `keys`, or `default` if the key is not in the store.
+        """
+        data = self._read()
+        return [data.get(key, default) for key in keys]
+
+    def update(self, mapping):
+        """Store several values with a single write.
+        
+        Args:
+            mapping (dict): Values to store indexed by key.
+        """
+        data = dict(self._read())
+        data.update(mapping)
+        self._replace(data)
+
+
+class FileStorage(AbstractStorage):
+    """Base class of storage containers that keep their files in a filesystem prefix.
     
-    Uses :py:class:`TinyDB` for both the database and the key/value store.
+    Implements the filesystem prefix, the key/value store, and the transaction depth count shared 
+    by :any:`LocalFileStorage`, :any:`JournalFileStorage`, and :any:`SqliteStorage`.  Subclasses 
+    implement the record database.
     
     Attributes:
         dbfile (str): Absolute path to database file.
     """
     
     Record = _JsonRecord
+
+    dbfile_ext = None
     
     def __init__(self, name, prefix):
-        super(LocalFileStorage, self).__init__(name)
+        super(FileStorage, self).__init__(name)
         self._transaction_count = 0
-        self._db_copy = None
-        self._database = None
         self._prefix = prefix
+        self._kvstore = None
         
     def __len__(self):
-        return self.count()
+        return len(self.kvstore)
 
     def __getitem__(self, key):
-        record = self.get({'key': key})
-        if record is not None:
-            return record['value']
-        raise KeyError
+        return self.kvstore[key]
     
     def __setitem__(self, key, value):
-        if self.contains({'key': key}):
-            self.update({'value': value}, {'key': key})
-        else:
-            self.insert({'key': key, 'value': value})
+        self.kvstore[key] = value
         
     def __delitem__(self, key):
-        if not self.contains({'key': key}):
-            raise KeyError
-        self.remove({'key': key})
+        del self.kvstore[key]
     
     def __contains__(self, key):
-        return self.contains({'key': key})
+        return key in self.kvstore
     
     def __iter__(self):
-        for item in self.search():
-            yield item['key']
+        return iter(self.kvstore)
 
     def iterkeys(self):
-        for item in self.search():
-            yield item['key']
+        return self.kvstore.iterkeys()
 
     def itervalues(self):
-        for item in self.search():
-            yield item['value']
+        return self.kvstore.itervalues()
 
     def iteritems(self):
-        for item in self.search():
-            yield item['key'], item['value']
+        return self.kvstore.iteritems()
+
+    @property
+    def kvstore(self):
+        """The key/value store.
+        
+        Key/value pairs are kept in ``<name>.kv.json``, separately from the record database, 
+        so that reading or writing a value doesn't depend on the size of the database.  
+        Earlier versions kept key/value pairs as records in the default table.  These records are
+        moved to the key/value store when it is first opened.
+        
+        Returns:
+            _KeyValueFile: A dictionary-like object with batched :any:`_KeyValueFile.update` and 
+                           :any:`_KeyValueFile.get_many` methods.
+        """
+        if self._kvstore is None:
+            self.connect_database()
+            kvstore = _KeyValueFile(os.path.join(self.prefix, self.name + '.kv.json'))
+            if not kvstore.exists():
+                legacy = {record['key']: record['value'] for record in self.search() if 'key' in record}
+                if legacy and kvstore.readonly:
+                    kvstore._data = legacy  # pylint: disable=protected-access
+                elif legacy:
+                    kvstore.update(legacy)
+                    self.purge()
+                    LOGGER.debug("Moved %d key/value pairs from %s database to '%s'", 
+                                 len(legacy), self.name, kvstore.path)
+            if self._transaction_count:
+                kvstore.begin()
+            self._kvstore = kvstore
+        return self._kvstore
+
+    def _begin_kvstore(self):
+        if self._kvstore is not None:
+            self._kvstore.begin()
+
+    def _end_kvstore(self, ex_type):
+        if self._kvstore is not None:
+            if ex_type:
+                self._kvstore.rollback()
+            else:
+                self._kvstore.commit()
     
     def is_writable(self):
         """Check if the storage filesystem is writable.
@@ -172,11 +685,49 @@ class LocalFileStorage(AbstractStorage):
         """Disconnects the store filesystem."""
         self.disconnect_database()
 
+    def disconnect_database(self, *args, **kwargs):
+        """Close the database for reading and writing."""
+        self._kvstore = None
+
+    @property
+    def prefix(self):
+        return self._prefix
+
+    @property
+    def dbfile(self):
+        return os.path.join(self.prefix, self.name + self.dbfile_ext)
+
+    @property
+    def database_files(self):
+        """list: Paths to the files holding the record database."""
+        return [self.dbfile]
+        
+    def __str__(self):
+        """Human-readable identifier for this database."""
+        return self.dbfile
+
+
+class LocalFileStorage(FileStorage):
+    """A persistant, transactional record storage system.  
+    
+    Uses :py:class:`TinyDB` for the database.  Every write rewrites the whole database file so 
+    table locks are the storage container lock.
+    """
+
+    dbfile_ext = '.json'
+
+    isolated_tables = False
+    
+    def __init__(self, name, prefix):
+        super(LocalFileStorage, self).__init__(name, prefix)
+        self._database = None
+        self._indexes = {}
+
     def connect_database(self, *args, **kwargs):
         """Open the database for reading and writing."""
         if self._database is None:
             util.mkdirp(self.prefix)
-            dbfile = os.path.join(self.prefix, self.name + '.json')
+            dbfile = self.dbfile
             try:
                 self._database = tinydb.TinyDB(dbfile, storage=_JsonFileStorage)
             except IOError as err:
@@ -189,38 +740,81 @@ class LocalFileStorage(AbstractStorage):
 
     def disconnect_database(self, *args, **kwargs):
         """Close the database for reading and writing."""
-        if self._database:
+        if self._database is not None:
             self._database.close()
             self._database = None
-
-    @property
-    def prefix(self):
-        return self._prefix
-        
-    def __str__(self):
-        """Human-readable identifier for this database."""
-        # pylint: disable=protected-access
-        return self._database._storage.path
+        super(LocalFileStorage, self).disconnect_database(*args, **kwargs)
 
     def __enter__(self):
-        """Initiates the database transaction."""
-        # Use protected methods to duplicate database in memory rather than on disk.
+        """Initiates the database transaction.
+        
+        Changes are made to an in-memory copy of the database until the outermost transaction exits.
+        """
         # pylint: disable=protected-access
         if self._transaction_count == 0:
             self.connect_database()
-            self._db_copy = self._database._read()
+            self._database._storage.begin()
+            self._begin_kvstore()
         self._transaction_count += 1
         return self
 
     def __exit__(self, ex_type, value, traceback):
-        """Finalizes the database transaction."""
-        # Use protected methods to duplicate database in memory rather than on disk.
+        """Finalizes the database transaction.
+        
+        The outermost transaction writes the database file once if no exception was raised,
+        or discards all changes made in the transaction if an exception was raised.
+        """
         # pylint: disable=protected-access
         self._transaction_count -= 1
-        if ex_type and self._transaction_count == 0:
-            self._database._write(self._db_copy)
-            self._db_copy = None
-            return False
+        if self._transaction_count == 0:
+            storage = self._database._storage
+            if not ex_type:
+                try:
+                    storage.commit()
+                except StorageError:
+                    self._discard_cached_queries()
+                    self._end_kvstore(StorageError)
+                    raise
+            else:
+                storage.rollback()
+                self._discard_cached_queries()
+            self._end_kvstore(ex_type)
+        return False
+
+    def compact(self):
+        """Rewrite the database file.
+        
+        Files written by earlier versions are rewritten without whitespace and empty tables are dropped.
+        """
+        # pylint: disable=protected-access
+        self.connect_database()
+        self._database._storage.rewrite()
+        self._discard_cached_queries()
+
+    @contextmanager
+    def snapshot(self):
+        """Read one version of the database for the duration of the context.
+        
+        Every write replaces the database file so the version loaded when the snapshot begins stays 
+        intact no matter what other processes write.  Writing to the database while the snapshot is
+        held raises :any:`StorageError` if another process has written to the database since.
+        """
+        # pylint: disable=protected-access
+        self.connect_database()
+        storage = self._database._storage
+        storage.pin()
+        try:
+            yield
+        finally:
+            storage.unpin()
+
+    def _discard_cached_queries(self):
+        """Forget query results and indexes that may include discarded changes."""
+        # pylint: disable=protected-access
+        for table in self._database._table_cache.itervalues():
+            table._query_cache.clear()
+        for index in self._indexes.itervalues():
+            index.generation = None
 
     def table(self, table_name):
         self.connect_database()
@@ -228,6 +822,132 @@ class LocalFileStorage(AbstractStorage):
             return self._database
         else:
             return self._database.table(table_name)
+
+    def add_index(self, table_name, fields):
+        """Declare that records in a table are frequently matched on the given fields.
+        
+        Equality lookups on indexed fields by :any:`get`, :any:`search`, and :any:`contains` use
+        a hash index instead of testing every record in the table.  Indexes are built when first
+        used and updated as records are inserted, updated, and removed.
+        
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractDatabase.table`.
+            fields (iterable): Names of fields to index, or tuples of names for composite indexes.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        index = self._indexes.get(table_name, None)
+        if index is None:
+            self._indexes[table_name] = _TableIndex(fields)
+        elif not index.fields.issuperset(fields):
+            self._indexes[table_name] = _TableIndex(index.fields.union(fields), index.references)
+
+    def add_reference_index(self, table_name, fields):
+        """Declare that fields of records in a table hold element identifiers of other records.
+        
+        :any:`search_references` uses an index mapping each identifier held by the fields to 
+        the records that hold it instead of testing every record in the table.  Like the indexes
+        declared by :any:`add_index`, the index is built when first used and updated as records 
+        are inserted, updated, and removed.  Indexes are saved alongside the database file so that
+        other processes don't rebuild them until the file changes.
+        
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractDatabase.table`.
+            fields (iterable): Names of reference fields to index.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        index = self._indexes.get(table_name, None)
+        if index is None:
+            self._indexes[table_name] = _TableIndex((), fields)
+        elif not index.references.issuperset(fields):
+            self._indexes[table_name] = _TableIndex(index.fields, index.references.union(fields))
+
+    def _elements(self, table_name):
+        """Return the table's elements as a dictionary indexed by element identifier.
+        
+        The dictionary is shared with the database and must not be modified.
+        """
+        # pylint: disable=protected-access
+        return self._database._read(table_name or _DEFAULT_TABLE)
+
+    def _index(self, table_name):
+        """Return the table's index after bringing it up to date, or None if the table has no index."""
+        # pylint: disable=protected-access
+        table_name = table_name or _DEFAULT_TABLE
+        index = self._indexes.get(table_name, None)
+        if index is None or not (index.fields or index.references):
+            return None
+        elements = self._elements(table_name)
+        storage = self._database._storage
+        if index.generation != storage.generation:
+            if index.restore(storage.load_index(table_name), storage.generation):
+                CACHE_STATISTICS['index_hits'] += 1
+            else:
+                CACHE_STATISTICS['index_misses'] += 1
+                index.build(elements, storage.generation)
+                storage.save_index(table_name, index.state())
+        return index
+
+    def _index_is_current(self, index):
+        # pylint: disable=protected-access
+        return index is not None and index.generation == self._database._storage.generation
+
+    def _indexed_search(self, table_name, keys, match_any):
+        """Use the table's index to find records matching `keys`.
+        
+        Returns:
+            list: Matching data records, or None if the index can't be used to match `keys`.
+        """
+        index = self._index(table_name)
+        if index is None:
+            return None
+        eids = index.lookup(keys, match_any)
+        if eids is None:
+            return None
+        elements = self._elements(table_name)
+        found = []
+        for eid in sorted(eids):
+            element = elements[eid]
+            if match_any or all(key in element and element[key] == val for key, val in keys.iteritems()):
+                found.append(self.Record(self, eid=eid, element=element))
+        return found
+
+    def _affected_eids(self, table, keys, table_name, match_any):
+        """Return the element identifiers of records to be modified."""
+        if isinstance(keys, self.Record.eid_type):
+            return [keys]
+        elif isinstance(keys, dict) and keys:
+            found = self._indexed_search(table_name, keys, match_any)
+            if found is None:
+                return [element.eid for element in table.search(self._query(keys, match_any))]
+            return [record.eid for record in found]
+        elif isinstance(keys, (list, tuple)):
+            return keys
+        else:
+            raise ValueError(keys)
+
+    @contextmanager
+    def _reindex(self, table_name, eids, fields=None):
+        """Update the table's index after records `eids` are modified.
+        
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractDatabase.table`.
+            eids (list): Identifiers of records that will be modified or removed.
+            fields: Names of modified fields or None if any field may be modified.
+        """
+        index = self._index(table_name)
+        if index is None or (fields is not None and index.field_names.isdisjoint(fields) and 
+                             index.references.isdisjoint(fields)):
+            yield
+            return
+        elements = self._elements(table_name)
+        old_elements = [(eid, elements[eid]) for eid in eids if eid in elements]
+        yield
+        if self._index_is_current(index):
+            elements = self._elements(table_name)
+            for eid, element in old_elements:
+                index.discard(eid, element)
+                if eid in elements:
+                    index.add(eid, elements[eid])
     
     @staticmethod
     def _query(keys, match_any):
@@ -253,7 +973,8 @@ class LocalFileStorage(AbstractStorage):
         Returns:
             int: Number of records in the table.
         """
-        return len(self.table(table_name))
+        self.table(table_name)
+        return len(self._elements(table_name))
     
     def get(self, keys, table_name=None, match_any=False):
         """Find a single record.
@@ -283,19 +1004,42 @@ class LocalFileStorage(AbstractStorage):
             return None
         elif isinstance(keys, self.Record.eid_type):
             #LOGGER.debug("%s: get(eid=%r)", table_name, keys)
-            element = table.get(eid=keys)
+            element = self._elements(table_name).get(keys, None)
+            if element is not None:
+                return self.Record(self, eid=keys, element=element)
+            return None
         elif isinstance(keys, dict) and keys:
             #LOGGER.debug("%s: get(keys=%r)", table_name, keys)
+            found = self._indexed_search(table_name, keys, match_any)
+            if found is not None:
+                return found[0] if found else None
             element = table.get(self._query(keys, match_any))
         elif isinstance(keys, (list, tuple)):
             #LOGGER.debug("%s: get(keys=%r)", table_name, keys)
-            return [self.get(key, table_name=table_name, match_any=match_any) for key in keys]
+            return self.get_many(keys, table_name=table_name, match_any=match_any)
         else:
             raise ValueError(keys)
         if element:
             return self.Record(self, element=element)
         return None
 
+    def get_many(self, keys, table_name=None, match_any=False):
+        """Find a single record for each element of `keys`.
+        
+        Element identifiers are resolved with a single read of the table.
+        See :any:`AbstractStorage.get_many`.
+        """
+        self.table(table_name)
+        elements = self._elements(table_name)
+        found = []
+        for key in keys:
+            if isinstance(key, self.Record.eid_type):
+                element = elements.get(key, None)
+                found.append(self.Record(self, eid=key, element=element) if element is not None else None)
+            else:
+                found.append(self.get(key, table_name=table_name, match_any=match_any))
+        return found
+
     def search(self, keys=None, table_name=None, match_any=False):
         """Find multiple records.
         
@@ -324,16 +1068,25 @@ class LocalFileStorage(AbstractStorage):
             return [self.Record(self, element=element) for element in table.all()]
         elif isinstance(keys, self.Record.eid_type):
             #LOGGER.debug("%s: search(eid=%r)", table_name, keys)
-            element = table.get(eid=keys)
-            return [self.Record(self, element=element)] if element else []
+            element = self._elements(table_name).get(keys, None)
+            return [self.Record(self, eid=keys, element=element)] if element is not None else []
         elif isinstance(keys, dict) and keys:
             #LOGGER.debug("%s: search(keys=%r)", table_name, keys)
+            found = self._indexed_search(table_name, keys, match_any)
+            if found is not None:
+                return found
             return [self.Record(self, element=element) for element in table.search(self._query(keys, match_any))]
         elif isinstance(keys, (list, tuple)):
             #LOGGER.debug("%s: search(keys=%r)", table_name, keys)
+            elements = self._elements(table_name)
             result = []
             for key in keys:
-                result.extend(self.search(keys=key, table_name=table_name, match_any=match_any))
+                if isinstance(key, self.Record.eid_type):
+                    element = elements.get(key, None)
+                    if element is not None:
+                        result.append(self.Record(self, eid=key, element=element))
+                else:
+                    result.extend(self.search(keys=key, table_name=table_name, match_any=match_any))
             return result
         else:
             raise ValueError(keys)
@@ -369,6 +1122,20 @@ class LocalFileStorage(AbstractStorage):
             #LOGGER.debug("%s: search(where(%s).matches('.*'))", table_name, field)
             return [self.Record(self, element=elem) for elem in table.search(tinydb.where(field).matches(".*"))]
 
+    def search_references(self, field, eids, table_name=None):
+        """Find records where `field` holds any of the element identifiers `eids`.
+        
+        Uses the reference index if `field` was declared by :any:`add_reference_index`.
+        See :any:`AbstractStorage.search_references`.
+        """
+        self.table(table_name)
+        index = self._index(table_name)
+        found = index.referrers(field, eids) if index else None
+        if found is None:
+            return super(LocalFileStorage, self).search_references(field, eids, table_name=table_name)
+        elements = self._elements(table_name)
+        return [self.Record(self, eid=eid, element=elements[eid]) for eid in sorted(found)]
+
     def contains(self, keys, table_name=None, match_any=False):
         """Check if the specified table contains at least one matching record.
         
@@ -395,9 +1162,12 @@ class LocalFileStorage(AbstractStorage):
             return False
         elif isinstance(keys, self.Record.eid_type):
             #LOGGER.debug("%s: contains(eid=%r)", table_name, keys)
-            return table.contains(eid=keys)
+            return keys in self._elements(table_name)
         elif isinstance(keys, dict) and keys:
             #LOGGER.debug("%s: contains(keys=%r)", table_name, keys)
+            found = self._indexed_search(table_name, keys, match_any)
+            if found is not None:
+                return bool(found)
             return table.contains(self._query(keys, match_any))
         elif isinstance(keys, (list, tuple)):
             return [self.contains(keys=key, table_name=table_name, match_any=match_any) for key in keys]
@@ -416,10 +1186,37 @@ class LocalFileStorage(AbstractStorage):
         Returns:
             Record: The new record.
         """
-        eid = self.table(table_name).insert(data)
+        table = self.table(table_name)
+        index = self._index(table_name)
+        eid = table.insert(dict(data))
+        if self._index_is_current(index):
+            index.add(eid, data)
         record = self.Record(self, eid=eid, element=data)
         return record
 
+    def insert_many(self, data, table_name=None):
+        """Create new records with a single write to the database file.
+        
+        TinyDB's ``Table.insert_multiple`` rewrites the whole database once per record, so
+        the new elements are added to the table in memory and the table is written once.
+        See :any:`AbstractStorage.insert_many`.
+        """
+        # pylint: disable=protected-access
+        table = self.table(table_name or _DEFAULT_TABLE)
+        index = self._index(table_name)
+        elements = table._read()
+        records = []
+        for item in data:
+            eid = table._get_next_id()
+            elements[eid] = dict(item)
+            records.append(self.Record(self, eid=eid, element=item))
+        if records:
+            table._write(elements)
+            if self._index_is_current(index):
+                for record in records:
+                    index.add(record.eid, record)
+        return records
+
     def update(self, fields, keys, table_name=None, match_any=False):
         """Update records.
         
@@ -439,17 +1236,29 @@ class LocalFileStorage(AbstractStorage):
             ValueError: ``bool(keys) == False`` or invaild value for `keys`.
         """
         table = self.table(table_name)
-        if isinstance(keys, self.Record.eid_type):
-            #LOGGER.debug("%s: update(%r, eid=%r)", table_name, fields, keys)
-            table.update(fields, eids=[keys])
-        elif isinstance(keys, dict):
-            #LOGGER.debug("%s: update(%r, keys=%r)", table_name, fields, keys)
-            table.update(fields, self._query(keys, match_any))
-        elif isinstance(keys, (list, tuple)):
-            #LOGGER.debug("%s: update(%r, eids=%r)", table_name, fields, keys)
-            table.update(fields, eids=keys)
-        else:
-            raise ValueError(keys)
+        eids = self._affected_eids(table, keys, table_name, match_any)
+        #LOGGER.debug("%s: update(%r, eids=%r)", table_name, fields, eids)
+        with self._reindex(table_name, eids, fields):
+            table.update(fields, eids=eids)
+
+    def update_many(self, updates, table_name=None, match_any=False):
+        """Apply many updates to records with a single write to the database file.
+        
+        See :any:`AbstractStorage.update_many`.
+        """
+        # pylint: disable=protected-access
+        table = self.table(table_name or _DEFAULT_TABLE)
+        matched = [(fields, self._affected_eids(table, keys, table_name, match_any)) for fields, keys in updates]
+        if not matched:
+            return
+        eids = set(eid for _, affected in matched for eid in affected)
+        modified = set(field for fields, _ in matched for field in fields)
+        with self._reindex(table_name, eids, modified):
+            elements = table._read()
+            for fields, affected in matched:
+                for eid in affected:
+                    elements[eid].update(fields)
+            table._write(elements)
       
     def unset(self, fields, keys, table_name=None, match_any=False):
         """Update records by unsetting fields.
@@ -473,20 +1282,11 @@ class LocalFileStorage(AbstractStorage):
             ValueError: ``bool(keys) == False`` or invaild value for `keys`.
         """
         table = self.table(table_name)
-        if isinstance(keys, self.Record.eid_type):
-            for field in fields:
-                #LOGGER.debug("%s: unset(%s, eid=%r)", table_name, field, keys)
-                table.update(operations.delete(field), eids=[keys])
-        elif isinstance(keys, dict):
+        eids = self._affected_eids(table, keys, table_name, match_any)
+        with self._reindex(table_name, eids, fields):
             for field in fields:
-                #LOGGER.debug("%s: unset(%s, keys=%r)", table_name, field, keys)
-                table.update(operations.delete(field), self._query(keys, match_any))
-        elif isinstance(keys, (list, tuple)):
-            for field in fields:
-                #LOGGER.debug("%s: unset(%s, eids=%r)", table_name, field, keys)
-                table.update(operations.delete(field), eids=keys)
-        else:
-            raise ValueError(keys)
+                #LOGGER.debug("%s: unset(%s, eids=%r)", table_name, field, eids)
+                table.update(operations.delete(field), eids=eids)
         
     def remove(self, keys, table_name=None, match_any=False):
         """Delete records.
@@ -506,17 +1306,10 @@ class LocalFileStorage(AbstractStorage):
             ValueError: ``bool(keys) == False`` or invaild value for `keys`.
         """
         table = self.table(table_name)
-        if isinstance(keys, self.Record.eid_type):
-            #LOGGER.debug("%s: remove(eid=%r)", table_name, keys)
-            table.remove(eids=[keys])
-        elif isinstance(keys, dict):
-            #LOGGER.debug("%s: remove(keys=%r)", table_name, keys)
-            table.remove(self._query(keys, match_any))
-        elif isinstance(keys, (list, tuple)):
-            #LOGGER.debug("%s: remove(eids=%r)", table_name, keys)
-            table.remove(eids=keys)
-        else:
-            raise ValueError(keys)
+        eids = self._affected_eids(table, keys, table_name, match_any)
+        #LOGGER.debug("%s: remove(eids=%r)", table_name, eids)
+        with self._reindex(table_name, eids):
+            table.remove(eids=eids)
 
     def purge(self, table_name=None):
         """Delete all records.
@@ -526,3 +1319,6 @@ class LocalFileStorage(AbstractStorage):
         """
         LOGGER.debug("%s: purge()", table_name)
         self.table(table_name).purge()
+        index = self._indexes.get(table_name or _DEFAULT_TABLE, None)
+        if index is not None:
+            index.generation = None
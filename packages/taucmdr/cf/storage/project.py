@@ -37,7 +37,7 @@ import os
 from taucmdr import logger, util
 from taucmdr import PROJECT_DIR
 from taucmdr.cf.storage import StorageError
-from taucmdr.cf.storage.local_file import LocalFileStorage
+from taucmdr.cf.storage.local_file import FileStorage, LocalFileStorage
 
 LOGGER = logger.get_logger(__name__)
 
@@ -62,15 +62,37 @@ class ProjectStorageError(StorageError):
         
 
 
-class ProjectStorage(LocalFileStorage):
+class ProjectStorage(FileStorage):
     """Handle the special case project storage.
     
     Each TAU Commander project has its own project storage that holds project-specific files
-    (i.e. performance data) and the project configuration.
+    (i.e. performance data) and the project configuration.  The record database is implemented
+    by the storage backend class combined with this class by :any:`project_storage`.
     """
     
     def __init__(self):
         super(ProjectStorage, self).__init__('project', None)
+        self._archive = None
+
+    def archive_storage(self, create=False):
+        """Get the storage container holding records archived by ``tau project compact``.
+        
+        Archived records are kept out of the project database so that commands that don't need 
+        them don't pay to load them.  The archive shares the project's filesystem prefix.
+        
+        Args:
+            create (bool): If True, create the archive if it doesn't exist.
+        
+        Returns:
+            LocalFileStorage: The archive storage container, or None if `create` is False 
+                              and the project has no archive.
+        """
+        if self._archive is None or self._archive.prefix != self.prefix:
+            archive = LocalFileStorage('archive', self.prefix)
+            if not (create or os.path.exists(archive.dbfile)):
+                return None
+            self._archive = archive
+        return self._archive
     
     def connect_filesystem(self, *args, **kwargs):
         """Prepares the store filesystem for reading and writing."""
@@ -79,7 +101,7 @@ class ProjectStorage(LocalFileStorage):
             project_prefix = self.prefix
         except ProjectStorageError:
             project_prefix = os.path.join(os.getcwd(), PROJECT_DIR)
-            if os.path.exists(os.path.join(project_prefix, USER_STORAGE.name + ".json")):
+            if os.path.exists(os.path.join(project_prefix, USER_STORAGE.name + USER_STORAGE.dbfile_ext)):
                 raise StorageError("Cannot create project in home directory. "
                                    "Use '-@ user' option for user level storage.")
             try:
@@ -100,6 +122,9 @@ class ProjectStorage(LocalFileStorage):
             **kwargs: Keyword arguments for :any:`disconnect_filesystem` or :any:`shutil.rmtree`.
         """
         self.disconnect_filesystem(*args, **kwargs)
+        if self._archive is not None:
+            self._archive.disconnect_database()
+            self._archive = None
         ignore_errors = kwargs.pop('ignore_errors', False)
         onerror = kwargs.pop('onerror', None)
         if self._prefix:
@@ -131,7 +156,7 @@ class ProjectStorage(LocalFileStorage):
             prefix = os.path.realpath(os.path.join(root, PROJECT_DIR))
             if os.path.isdir(prefix):
                 for exclude_storage in USER_STORAGE, SYSTEM_STORAGE:
-                    if os.path.exists(os.path.join(prefix, exclude_storage.name + ".json")):
+                    if os.path.exists(os.path.join(prefix, exclude_storage.name + exclude_storage.dbfile_ext)):
                         break
                 else:
                     LOGGER.debug("Located project storage prefix '%s'", prefix)
@@ -141,3 +166,15 @@ class ProjectStorage(LocalFileStorage):
             root = os.path.dirname(root)
         raise ProjectStorageError(cwd)
         
+
+
+def project_storage(backend=LocalFileStorage):
+    """Create the project storage container.
+
+    Args:
+        backend (type): :any:`FileStorage` subclass that stores the project records.
+
+    Returns:
+        ProjectStorage: The project storage container.
+    """
+    return type(ProjectStorage.__name__, (ProjectStorage, backend), {'__module__': __name__})()
@@ -0,0 +1,600 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+SQLite backend for storage containers.
+
+A persistant, transactional record storage system using :py:mod:`sqlite3`.  Each table is
+an SQLite table of JSON encoded records with indexed columns for frequently searched attributes.
+"""
+
+import os
+import json
+import sqlite3
+from contextlib import contextmanager
+import tinydb
+from taucmdr import logger, util
+from taucmdr.error import ConfigurationError
+from taucmdr.cf.storage import StorageError
+from taucmdr.cf.storage.local_file import FileStorage, VERSION_KEY
+from taucmdr.cf.storage.journal_file import _matches
+
+LOGGER = logger.get_logger(__name__)
+
+
+INDEXED_FIELDS = ('key', 'name', 'experiment', 'number', 'uid')
+"""tuple: Record attributes that are stored in indexed columns."""
+
+INDEXED_COMPOSITES = (('experiment', 'number'),)
+"""tuple: Combinations of :any:`INDEXED_FIELDS` that are frequently matched together."""
+
+SQLITE_TIMEOUT = 60
+"""int: Seconds to wait for another process to release a database lock."""
+
+MAX_PARAMETERS = 500
+"""int: Maximum number of element identifiers bound to one statement."""
+
+_DEFAULT_TABLE = '_default'
+
+_REFERENCE_FIELDS = '_reference_fields'
+
+_REFERENCES = '_references'
+
+
+def _quote(identifier):
+    return '"%s"' % identifier.replace('"', '""')
+
+
+def _column_value(value):
+    """Encode an attribute value for comparison in an indexed column."""
+    return json.dumps(value, sort_keys=True)
+
+
+def _referenced(element, field):
+    """Return the element identifiers held by an element's reference field."""
+    value = element.get(field, None)
+    if value is None:
+        return ()
+    elif isinstance(value, list):
+        return set(item for item in value if isinstance(item, (int, long)))
+    return (value,) if isinstance(value, (int, long)) else ()
+
+
+class SqliteStorage(FileStorage):
+    """A persistant, transactional record storage system backed by an SQLite database.
+
+    Records are stored as JSON text.  Attributes listed in :any:`INDEXED_FIELDS` are also stored in
+    indexed columns so that :any:`get`, :any:`search`, and :any:`contains` don't have to decode every
+    record in the table.  The database uses write-ahead logging so that many processes may read the
+    database while another process writes to it.
+
+    Changes made inside a transaction (i.e. ``with storage:``) are committed when the outermost
+    transaction exits, or rolled back if the transaction raises an exception.
+
+    Reference fields declared by :any:`add_reference_index` are recorded in the database.  Every 
+    process writing the database keeps the ``_references`` table of identifiers held by those fields 
+    up to date so that :any:`search_references` is an indexed lookup.
+    """
+
+    dbfile_ext = '.sqlite3'
+
+    def __init__(self, name, prefix):
+        super(SqliteStorage, self).__init__(name, prefix)
+        self._connection = None
+        self._tables = None
+        self._readonly = False
+        self._reference_fields = {}
+
+    @property
+    def legacy_file(self):
+        """Path to the :any:`LocalFileStorage` database this database may be migrated from."""
+        return os.path.join(self.prefix, self.name + '.json')
+
+    @property
+    def database_files(self):
+        return [self.dbfile, self.dbfile + '-wal']
+
+    def compact(self):
+        """Rebuild the database file and empty the write-ahead log."""
+        self.connect_database()
+        self._execute('VACUUM')
+        self._execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def connect_database(self, *args, **kwargs):
+        """Open the database for reading and writing.
+
+        If the database does not exist but a :any:`LocalFileStorage` database does exist then its
+        records are migrated to this database.
+        """
+        if self._connection is None:
+            util.mkdirp(self.prefix)
+            dbfile = self.dbfile
+            exists = os.path.exists(dbfile)
+            self._readonly = not (os.access(self.prefix, os.W_OK) and (not exists or os.access(dbfile, os.W_OK)))
+            try:
+                self._connection = sqlite3.connect(dbfile, timeout=SQLITE_TIMEOUT, isolation_level=None)
+                if not self._readonly:
+                    self._connection.execute('PRAGMA journal_mode=WAL')
+                self._tables = set(row[0] for row in self._connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name != 'sqlite_sequence'"))
+            except sqlite3.Error as err:
+                self._connection = None
+                raise StorageError("Failed to access %s database '%s': %s" % (self.name, dbfile, err),
+                                   "Check that you have `read` access to the database and its directory")
+            self._load_reference_fields()
+            LOGGER.debug("Initialized %s database '%s'", self.name, dbfile)
+            if not exists and not self._readonly and os.path.exists(self.legacy_file):
+                self.migrate(self.legacy_file)
+
+    def disconnect_database(self, *args, **kwargs):
+        """Close the database for reading and writing."""
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+            self._tables = None
+        self._reference_fields = {}
+        super(SqliteStorage, self).disconnect_database(*args, **kwargs)
+
+    def migrate(self, path):
+        """Replace all records in this database with records from a :any:`LocalFileStorage` database.
+
+        The :any:`LocalFileStorage` database file is not modified.
+
+        Args:
+            path (str): Path to the JSON database file.
+
+        Raises:
+            StorageError: The JSON database file could not be read.
+        """
+        try:
+            with open(path, 'r') as fin:
+                data = json.load(fin)
+        except (IOError, ValueError) as err:
+            raise StorageError("Failed to migrate %s database '%s': %s" % (self.name, path, err),
+                               "Check that you have `read` access and that the file is valid JSON.")
+        data.pop(VERSION_KEY, None)
+        count = 0
+        with self:
+            for table_name, elements in data.iteritems():
+                self.purge(table_name)
+                self._write(table_name, ((int(eid), element) for eid, element in elements.iteritems()),
+                            'INSERT')
+                count += len(elements)
+        LOGGER.debug("Migrated %d records from '%s' to %s database '%s'", count, path, self.name, self.dbfile)
+
+    def _execute(self, sql, params=(), many=False):
+        try:
+            if many:
+                return self._connection.executemany(sql, params)
+            return self._connection.execute(sql, params)
+        except sqlite3.OperationalError as err:
+            if self._readonly or 'readonly' in str(err):
+                raise ConfigurationError("Cannot write to '%s'" % self.dbfile, "Check that you have `write` access.")
+            raise StorageError("Failed to access %s database '%s': %s" % (self.name, self.dbfile, err))
+
+    def __enter__(self):
+        """Initiates the database transaction."""
+        if self._transaction_count == 0:
+            self.connect_database()
+            # Take the write lock up front so concurrent writers wait on each other instead of
+            # failing when a deferred transaction is upgraded.
+            self._execute('BEGIN' if self._readonly else 'BEGIN IMMEDIATE')
+            # Another process may have declared reference fields that this transaction must maintain
+            self._load_reference_fields()
+            self._begin_kvstore()
+        self._transaction_count += 1
+        return self
+
+    def __exit__(self, ex_type, value, traceback):
+        """Finalizes the database transaction."""
+        self._transaction_count -= 1
+        if self._transaction_count == 0:
+            try:
+                self._execute('ROLLBACK' if ex_type else 'COMMIT')
+            except Exception:
+                self._end_kvstore(StorageError)
+                raise
+            self._end_kvstore(ex_type)
+        return False
+
+    @contextmanager
+    def snapshot(self):
+        """Read one version of the database for the duration of the context.
+
+        Holds a read transaction open so that SQLite's write-ahead log keeps the version of the database 
+        that was current when the snapshot began.  Changes made while the snapshot is held are committed
+        when the snapshot is released; they fail if another process has changed the database since.
+        """
+        if self._transaction_count:
+            yield
+            return
+        self.connect_database()
+        self._execute('BEGIN')
+        # A deferred transaction doesn't read the database until its first statement
+        self._execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        self._load_reference_fields()
+        self._begin_kvstore()
+        self._transaction_count += 1
+        ex_type = None
+        try:
+            yield
+        except BaseException as err:
+            ex_type = type(err)
+            raise
+        finally:
+            self.__exit__(ex_type, None, None)
+
+    def _table_exists(self, table_name):
+        if table_name not in self._tables:
+            if self._execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone():
+                self._tables.add(table_name)
+            else:
+                return False
+        return True
+
+    def _create_table(self, table_name):
+        if not self._table_exists(table_name):
+            table = _quote(table_name)
+            columns = ''.join(', %s TEXT' % _quote(field) for field in INDEXED_FIELDS)
+            self._execute('CREATE TABLE IF NOT EXISTS %s (eid INTEGER PRIMARY KEY AUTOINCREMENT, '
+                          'data TEXT NOT NULL%s)' % (table, columns))
+            for field in INDEXED_FIELDS:
+                self._execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' %
+                              (_quote(table_name + '.' + field), table, _quote(field)))
+            for fields in INDEXED_COMPOSITES:
+                composite = ', '.join(_quote(field) for field in fields)
+                self._execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' %
+                              (_quote(table_name + '.' + '.'.join(fields)), table, composite))
+            self._tables.add(table_name)
+
+    def _load_reference_fields(self):
+        """Read the reference fields declared by :any:`add_reference_index` in any process."""
+        self._reference_fields = {}
+        if self._table_exists(_REFERENCE_FIELDS):
+            for table_name, field in self._execute('SELECT tbl, field FROM %s' % _quote(_REFERENCE_FIELDS)):
+                self._reference_fields.setdefault(table_name, set()).add(field)
+
+    def _index_references(self, table_name, fields, elements):
+        """Add the identifiers held by reference fields of (eid, element) pairs to the ``_references`` table."""
+        rows = [(table_name, field, target, eid) for eid, element in elements 
+                for field in fields for target in _referenced(element, field)]
+        if rows:
+            self._execute('INSERT INTO %s (tbl, field, target, eid) VALUES (?, ?, ?, ?)' % _quote(_REFERENCES), 
+                          rows, many=True)
+
+    def _discard_references(self, table_name, eids=None):
+        """Remove identifiers held by records `eids`, or by all records if `eids` is None, from ``_references``."""
+        if table_name not in self._reference_fields:
+            return
+        sql = 'DELETE FROM %s WHERE tbl = ?' % _quote(_REFERENCES)
+        if eids is None:
+            self._execute(sql, (table_name,))
+        else:
+            self._execute(sql + ' AND eid = ?', [(table_name, eid) for eid in eids], many=True)
+
+    def add_reference_index(self, table_name, fields):
+        """Declare that fields of records in a table hold element identifiers of other records.
+
+        The declaration is recorded in the database and the identifiers held by the fields of existing 
+        records are indexed.  Nothing is done if the database is read-only.
+        See :any:`AbstractStorage.add_reference_index`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        self.connect_database()
+        if self._readonly or self._reference_fields.get(table_name, set()).issuperset(fields):
+            return
+        with self:
+            fields = set(fields) - self._reference_fields.get(table_name, set())
+            if not fields:
+                return
+            if not self._table_exists(_REFERENCE_FIELDS):
+                self._execute('CREATE TABLE IF NOT EXISTS %s (tbl TEXT NOT NULL, field TEXT NOT NULL, '
+                              'PRIMARY KEY (tbl, field))' % _quote(_REFERENCE_FIELDS))
+                self._execute('CREATE TABLE IF NOT EXISTS %s (tbl TEXT NOT NULL, field TEXT NOT NULL, '
+                              'target INTEGER NOT NULL, eid INTEGER NOT NULL)' % _quote(_REFERENCES))
+                self._execute('CREATE INDEX IF NOT EXISTS %s ON %s (tbl, field, target)' % 
+                              (_quote(_REFERENCES + '.target'), _quote(_REFERENCES)))
+                self._execute('CREATE INDEX IF NOT EXISTS %s ON %s (tbl, eid)' % 
+                              (_quote(_REFERENCES + '.eid'), _quote(_REFERENCES)))
+                self._tables.update((_REFERENCE_FIELDS, _REFERENCES))
+            self._execute('INSERT INTO %s (tbl, field) VALUES (?, ?)' % _quote(_REFERENCE_FIELDS), 
+                          [(table_name, field) for field in fields], many=True)
+            self._index_references(table_name, fields, self._select(table_name))
+            self._reference_fields.setdefault(table_name, set()).update(fields)
+
+    def table(self, table_name):
+        """Return the name of the SQLite table holding `table_name` records, or None if it doesn't exist yet."""
+        self.connect_database()
+        table_name = table_name or _DEFAULT_TABLE
+        return _quote(table_name) if self._table_exists(table_name) else None
+
+    def _select(self, table_name, keys=None, match_any=False, limit=None):
+        """Iterate over (eid, element) pairs in `table_name` with attributes matching `keys`.
+
+        Indexed attributes are matched by SQLite; all other attributes are matched as records are decoded.
+        """
+        table = self.table(table_name)
+        if table is None:
+            return
+        sql = 'SELECT eid, data FROM %s' % table
+        params = []
+        check = bool(keys)
+        if keys:
+            indexed = [(field, value) for field, value in keys.iteritems() if field in INDEXED_FIELDS]
+            if indexed and (not match_any or len(indexed) == len(keys)):
+                sql += ' WHERE ' + (' OR ' if match_any else ' AND ').join('%s = ?' % _quote(field) for field, _ in indexed)
+                params = [_column_value(value) for _, value in indexed]
+                check = len(indexed) != len(keys)
+        if limit and not check:
+            sql += ' LIMIT %d' % limit
+        for eid, data in self._execute(sql, params).fetchall():
+            element = json.loads(data)
+            if not check or _matches(element, keys, match_any):
+                yield eid, element
+
+    def _write(self, table_name, elements, verb):
+        """INSERT or REPLACE (eid, element) pairs in `table_name`.
+
+        Returns:
+            list: Element identifiers of the written records, including those assigned to new records.
+        """
+        self._create_table(table_name)
+        elements = list(elements)
+        if not elements:
+            return []
+        columns = ('eid', 'data') + INDEXED_FIELDS
+        sql = '%s INTO %s (%s) VALUES (%s)' % (verb, _quote(table_name), ', '.join(_quote(col) for col in columns),
+                                               ', '.join('?' for _ in columns))
+        rows = [(eid, json.dumps(element)) +
+                tuple(_column_value(element[field]) if field in element else None for field in INDEXED_FIELDS)
+                for eid, element in elements]
+        self._execute(sql, rows, many=True)
+        eids = [eid for eid, _ in elements]
+        if eids[0] is None:
+            # The write lock is held so nothing else can insert rows between ours
+            last_eid = self._execute('SELECT last_insert_rowid()').fetchone()[0]
+            eids = range(last_eid - len(eids) + 1, last_eid + 1)
+        fields = self._reference_fields.get(table_name, None)
+        if fields:
+            if verb == 'REPLACE':
+                self._discard_references(table_name, eids)
+            self._index_references(table_name, fields, zip(eids, (element for _, element in elements)))
+        return eids
+
+    def _record(self, eid, element):
+        return self.Record(self, eid=eid, element=element)
+
+    def _element(self, table_name, eid):
+        table = self.table(table_name)
+        if table is None:
+            return None
+        row = self._execute('SELECT data FROM %s WHERE eid = ?' % table, (eid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self, table_name=None):
+        """Count the records in the database.
+
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractDatabase.table`.
+
+        Returns:
+            int: Number of records in the table.
+        """
+        table = self.table(table_name)
+        if table is None:
+            return 0
+        return self._execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+
+    def get(self, keys, table_name=None, match_any=False):
+        """Find a single record.
+
+        See :any:`AbstractStorage.get`.
+        """
+        if keys is None:
+            return None
+        elif isinstance(keys, self.Record.eid_type):
+            element = self._element(table_name, keys)
+            return self._record(keys, element) if element is not None else None
+        elif isinstance(keys, dict) and keys:
+            for eid, element in self._select(table_name, keys, match_any, limit=1):
+                return self._record(eid, element)
+            return None
+        elif isinstance(keys, (list, tuple)):
+            return [self.get(key, table_name=table_name, match_any=match_any) for key in keys]
+        else:
+            raise ValueError(keys)
+
+    def search(self, keys=None, table_name=None, match_any=False):
+        """Find multiple records.
+
+        See :any:`AbstractStorage.search`.
+        """
+        if keys is None:
+            return [self._record(eid, element) for eid, element in self._select(table_name)]
+        elif isinstance(keys, self.Record.eid_type):
+            element = self._element(table_name, keys)
+            return [self._record(keys, element)] if element is not None else []
+        elif isinstance(keys, dict) and keys:
+            return [self._record(eid, element) for eid, element in self._select(table_name, keys, match_any)]
+        elif isinstance(keys, (list, tuple)):
+            result = []
+            for key in keys:
+                result.extend(self.search(keys=key, table_name=table_name, match_any=match_any))
+            return result
+        else:
+            raise ValueError(keys)
+
+    def match(self, field, table_name=None, regex=None, test=None):
+        """Find records where `field` matches `regex` or `test`.
+
+        See :any:`AbstractStorage.match`.
+        """
+        if test is not None:
+            query = tinydb.where(field).test(test)
+        elif regex is not None:
+            query = tinydb.where(field).matches(regex)
+        else:
+            query = tinydb.where(field).matches(".*")
+        return [self._record(eid, element) for eid, element in self._select(table_name) if query(element)]
+
+    def search_references(self, field, eids, table_name=None):
+        """Find records where `field` holds any of the element identifiers `eids`.
+
+        Uses the ``_references`` table if `field` was declared by :any:`add_reference_index`.
+        See :any:`AbstractStorage.search_references`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        table = self.table(table_name)
+        if field not in self._reference_fields.get(table_name, ()):
+            return super(SqliteStorage, self).search_references(field, eids, table_name=table_name)
+        elif table is None:
+            return []
+        eids = sorted(set(eids))
+        found = {}
+        for i in xrange(0, len(eids), MAX_PARAMETERS):
+            chunk = eids[i:i+MAX_PARAMETERS]
+            sql = ('SELECT eid, data FROM %s WHERE eid IN (SELECT eid FROM %s WHERE tbl = ? AND field = ? '
+                   'AND target IN (%s))' % (table, _quote(_REFERENCES), ', '.join('?' for _ in chunk)))
+            for eid, data in self._execute(sql, [table_name, field] + chunk).fetchall():
+                found[eid] = data
+        return [self._record(eid, json.loads(found[eid])) for eid in sorted(found)]
+
+    def contains(self, keys, table_name=None, match_any=False):
+        """Check if the specified table contains at least one matching record.
+
+        See :any:`AbstractStorage.contains`.
+        """
+        if keys is None:
+            return False
+        elif isinstance(keys, self.Record.eid_type):
+            table = self.table(table_name)
+            return bool(table and self._execute('SELECT 1 FROM %s WHERE eid = ?' % table, (keys,)).fetchone())
+        elif isinstance(keys, dict) and keys:
+            return any(True for _ in self._select(table_name, keys, match_any, limit=1))
+        elif isinstance(keys, (list, tuple)):
+            return [self.contains(keys=key, table_name=table_name, match_any=match_any) for key in keys]
+        else:
+            raise ValueError(keys)
+
+    def _affected(self, table_name, keys, match_any):
+        """Return (eid, element) pairs for records to be modified.
+
+        Raises:
+            KeyError: `keys` lists an element identifier that is not in the table.
+            ValueError: Invalid value for `keys`.
+        """
+        if isinstance(keys, self.Record.eid_type):
+            eids = [keys]
+        elif isinstance(keys, dict) and keys:
+            return list(self._select(table_name, keys, match_any))
+        elif isinstance(keys, (list, tuple)):
+            eids = list(keys)
+        else:
+            raise ValueError(keys)
+        affected = []
+        for eid in eids:
+            element = self._element(table_name, eid)
+            if element is None:
+                raise KeyError(eid)
+            affected.append((eid, element))
+        return affected
+
+    def insert(self, data, table_name=None):
+        """Create a new record.
+
+        See :any:`AbstractStorage.insert`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            eid = self._write(table_name, [(None, data)], 'INSERT')[0]
+        return self._record(eid, data)
+
+    def insert_many(self, data, table_name=None):
+        """Create new records with one batched INSERT.
+
+        See :any:`AbstractStorage.insert_many`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        data = list(data)
+        if not data:
+            return []
+        with self:
+            eids = self._write(table_name, [(None, item) for item in data], 'INSERT')
+        return [self._record(eid, item) for eid, item in zip(eids, data)]
+
+    def update(self, fields, keys, table_name=None, match_any=False):
+        """Update records.
+
+        See :any:`AbstractStorage.update`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            affected = self._affected(table_name, keys, match_any)
+            for _, element in affected:
+                element.update(fields)
+            self._write(table_name, affected, 'REPLACE')
+
+    def unset(self, fields, keys, table_name=None, match_any=False):
+        """Update records by unsetting fields.
+
+        See :any:`AbstractStorage.unset`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            affected = self._affected(table_name, keys, match_any)
+            for _, element in affected:
+                for field in fields:
+                    del element[field]
+            self._write(table_name, affected, 'REPLACE')
+
+    def remove(self, keys, table_name=None, match_any=False):
+        """Delete records.
+
+        See :any:`AbstractStorage.remove`.
+        """
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            affected = self._affected(table_name, keys, match_any)
+            if affected:
+                table = self.table(table_name)
+                self._execute('DELETE FROM %s WHERE eid = ?' % table, [(eid,) for eid, _ in affected], many=True)
+                self._discard_references(table_name, [eid for eid, _ in affected])
+
+    def purge(self, table_name=None):
+        """Delete all records.
+
+        Args:
+            table_name (str): Name of the table to operate on.  See :any:`AbstractDatabase.table`.
+        """
+        LOGGER.debug("%s: purge()", table_name)
+        table_name = table_name or _DEFAULT_TABLE
+        with self:
+            table = self.table(table_name)
+            if table is not None:
+                self._execute('DELETE FROM %s' % table)
+                self._execute('DELETE FROM sqlite_sequence WHERE name = ?', (table_name,))
+                self._discard_references(table_name)
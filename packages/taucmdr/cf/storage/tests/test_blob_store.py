@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of blob_store.py.
+"""
+
+import os
+from taucmdr import tests
+from taucmdr.cf.storage import StorageError
+from taucmdr.cf.storage.blob_store import BlobStore
+
+
+class BlobStoreTest(tests.TestCase):
+    """Unit tests for BlobStore."""
+
+    def setUp(self):
+        self.store = BlobStore(os.path.join(tests.get_test_workdir(), self.id()))
+
+    def test_put_get(self):
+        data = 'x' * 10000
+        key = self.store.put(data)
+        self.assertTrue(BlobStore.is_key(key))
+        self.assertIn(key, self.store)
+        self.assertEqual(self.store.put(data), key)
+        self.assertEqual(self.store.get(key), data)
+        self.assertLess(os.path.getsize(os.path.join(self.store.prefix, key[:2], key[2:])), len(data))
+
+    def test_invalid_key(self):
+        with self.assertRaises(StorageError):
+            self.store.get('../../etc/passwd')
+        with self.assertRaises(StorageError):
+            self.store.get('0' * 40)
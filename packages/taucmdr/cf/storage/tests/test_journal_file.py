@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of journal_file.py.
+"""
+
+import os
+import json
+import time
+from taucmdr import tests
+from taucmdr.cf.storage.journal_file import JournalFileStorage
+
+
+class JournalFileTest(tests.TestCase):
+    """Unit tests for JournalFileStorage."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        self.storage = JournalFileStorage('test', self.prefix)
+
+    def tearDown(self):
+        self.storage.disconnect_database()
+
+    def test_insert_search(self):
+        first = self.storage.insert({'name': 'a', 'value': 1}, table_name='Foo')
+        second = self.storage.insert({'name': 'b', 'value': 2}, table_name='Foo')
+        self.assertNotEqual(first.eid, second.eid)
+        self.assertEqual(self.storage.get(second.eid, table_name='Foo')['name'], 'b')
+        self.assertEqual(self.storage.get({'value': 1}, table_name='Foo').eid, first.eid)
+        self.assertEqual(len(self.storage.search({'name': 'a', 'value': 2}, table_name='Foo', match_any=True)), 2)
+        self.assertTrue(self.storage.contains({'name': 'b'}, table_name='Foo'))
+        self.assertEqual(self.storage.count(table_name='Foo'), 2)
+
+    def test_reopen(self):
+        record = self.storage.insert({'name': 'a', 'value': 1}, table_name='Foo')
+        self.storage.update({'value': 2}, record.eid, table_name='Foo')
+        self.storage.unset(['name'], record.eid, table_name='Foo')
+        self.storage['key'] = 'value'
+        reopened = JournalFileStorage('test', self.prefix)
+        self.assertEqual(dict(reopened.get(record.eid, table_name='Foo')), {'value': 2})
+        self.assertEqual(reopened['key'], 'value')
+        reopened.remove(record.eid, table_name='Foo')
+        self.assertFalse(self.storage.contains(record.eid, table_name='Foo'))
+
+    def test_snapshot(self):
+        record = self.storage.insert({'name': 'a', 'value': 1}, table_name='Foo')
+        other = JournalFileStorage('test', self.prefix)
+        with self.storage.snapshot():
+            other.update({'value': 2}, record.eid, table_name='Foo')
+            self.assertEqual(self.storage.get(record.eid, table_name='Foo')['value'], 1)
+        self.assertEqual(self.storage.get(record.eid, table_name='Foo')['value'], 2)
+
+    def test_rollback(self):
+        record = self.storage.insert({'name': 'a'}, table_name='Foo')
+        with self.assertRaises(RuntimeError):
+            with self.storage:
+                self.storage.update({'name': 'b'}, record.eid, table_name='Foo')
+                self.storage.insert({'name': 'c'}, table_name='Foo')
+                raise RuntimeError
+        self.assertEqual(self.storage.search(table_name='Foo'), [{'name': 'a'}])
+        self.assertEqual(JournalFileStorage('test', self.prefix).search(table_name='Foo'), [{'name': 'a'}])
+
+    def test_compact(self):
+        for i in xrange(10):
+            self.storage.insert({'value': i}, table_name='Foo')
+        self.storage.remove({'value': 0}, table_name='Foo')
+        self.storage.compact()
+        with open(self.storage.journal_file) as fin:
+            self.assertEqual(len(fin.readlines()), 1)
+        reopened = JournalFileStorage('test', self.prefix)
+        self.assertEqual(reopened.count(table_name='Foo'), 9)
+        self.assertEqual(reopened.insert({'value': 10}, table_name='Foo').eid, 11)
+
+    def test_migrate(self):
+        os.makedirs(self.prefix)
+        with open(os.path.join(self.prefix, 'test.json'), 'w') as fout:
+            json.dump({'_default': {'1': {'key': 'selected', 'value': 3}},
+                       'Foo': {'3': {'name': 'a'}, '7': {'name': 'b'}}}, fout)
+        self.assertEqual(self.storage['selected'], 3)
+        self.assertEqual(self.storage.get(7, table_name='Foo')['name'], 'b')
+        self.assertEqual(self.storage.insert({'name': 'c'}, table_name='Foo').eid, 8)
+
+    def test_concurrent_insert(self):
+        first = self.storage.insert({'name': 'a'}, table_name='Foo')
+        with self.storage:
+            second = self.storage.insert({'name': 'b'}, table_name='Foo')
+            pid = os.fork()
+            if not pid:
+                # Waits for the parent's transaction to release the journal before inserting
+                try:
+                    JournalFileStorage('test', self.prefix).insert({'name': 'c'}, table_name='Foo')
+                except Exception:  # pylint: disable=broad-except
+                    os._exit(1)
+                os._exit(0)
+            time.sleep(0.2)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        reopened = JournalFileStorage('test', self.prefix)
+        records = reopened.search(table_name='Foo')
+        self.assertEqual(sorted(record['name'] for record in records), ['a', 'b', 'c'])
+        self.assertEqual(sorted(record.eid for record in records), [first.eid, second.eid, second.eid + 1])
+        self.assertEqual(self.storage.get(second.eid + 1, table_name='Foo')['name'], 'c')
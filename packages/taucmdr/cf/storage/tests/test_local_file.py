@@ -30,8 +30,183 @@
 Functions used for unit tests of local_file.py.
 """
 
+import os
+import time
 from taucmdr import tests
+from taucmdr.cf.storage import local_file, StorageError
+from taucmdr.cf.storage.local_file import LocalFileStorage
+
 
-@tests.not_implemented
 class LocalFileTest(tests.TestCase):
-    pass
+    """Unit tests for LocalFileStorage."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        self.storage = LocalFileStorage('test', self.prefix)
+        self.storage.add_index('Trial', ['experiment', 'number'])
+        for i in xrange(10):
+            self.storage.insert({'experiment': i % 2, 'number': i // 2, 'tags': [i]}, table_name='Trial')
+
+    def tearDown(self):
+        self.storage.disconnect_database()
+
+    def test_indexed_lookup(self):
+        found = self.storage.get({'experiment': 1, 'number': 3}, table_name='Trial')
+        self.assertEqual(found.eid, 8)
+        self.assertEqual(len(self.storage.search({'experiment': 0}, table_name='Trial')), 5)
+        self.assertEqual(len(self.storage.search({'experiment': 0, 'number': 4}, 
+                                                 table_name='Trial', match_any=True)), 6)
+        self.assertEqual(len(self.storage.search({'experiment': 0, 'tags': [4]}, table_name='Trial')), 1)
+        self.assertFalse(self.storage.contains({'experiment': 2}, table_name='Trial'))
+
+    def test_index_maintenance(self):
+        self.storage.update({'experiment': 2}, {'experiment': 1, 'number': 3}, table_name='Trial')
+        self.assertIsNone(self.storage.get({'experiment': 1, 'number': 3}, table_name='Trial'))
+        self.assertEqual(self.storage.get({'experiment': 2}, table_name='Trial').eid, 8)
+        self.storage.unset(['number'], 8, table_name='Trial')
+        self.assertFalse(self.storage.contains({'experiment': 2, 'number': 3}, table_name='Trial'))
+        self.storage.remove({'experiment': 0}, table_name='Trial')
+        self.assertEqual(self.storage.search({'number': 0}, table_name='Trial'), [{'experiment': 1, 'number': 0, 'tags': [1]}])
+        with self.assertRaises(RuntimeError):
+            with self.storage:
+                self.storage.remove({'experiment': 1}, table_name='Trial')
+                raise RuntimeError
+        self.assertEqual(len(self.storage.search({'experiment': 1}, table_name='Trial')), 4)
+
+    def test_composite_index(self):
+        self.storage.add_index('Trial', [('experiment', 'number')])
+        self.assertEqual(self.storage.get({'experiment': 1, 'number': 3}, table_name='Trial').eid, 8)
+        self.storage.update({'number': 7}, 8, table_name='Trial')
+        self.assertFalse(self.storage.contains({'experiment': 1, 'number': 3}, table_name='Trial'))
+        self.assertEqual(self.storage.get({'experiment': 1, 'number': 7}, table_name='Trial').eid, 8)
+        self.assertEqual(len(self.storage.search({'experiment': 1, 'number': 7, 'tags': [7]}, table_name='Trial')), 1)
+
+    def test_transaction_writes_once(self):
+        dbfile = self.storage.dbfile
+        with open(dbfile) as fin:
+            before = fin.read()
+        with self.storage:
+            for i in xrange(5):
+                self.storage.insert({'experiment': 2, 'number': i}, table_name='Trial')
+            self.storage.update({'tags': []}, {'experiment': 2}, table_name='Trial')
+            with open(dbfile) as fin:
+                self.assertEqual(fin.read(), before)
+        self.assertEqual(LocalFileStorage('test', self.prefix).count('Trial'), 15)
+        self.assertItemsEqual(os.listdir(self.prefix), ['test.json', 'test.json.cache', 'test.json.index'])
+
+    def test_table_locks(self):
+        # Every write rewrites the whole file so writers to different tables must exclude each other
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if not pid:
+            os.close(write_fd)
+            os.read(read_fd, 1)
+            try:
+                other = LocalFileStorage('test', self.prefix)
+                with other.lock('Experiment'), other:
+                    other.insert({'name': 'expr'}, table_name='Experiment')
+            except Exception:  # pylint: disable=broad-except
+                os._exit(1)
+            os._exit(0)
+        os.close(read_fd)
+        with self.storage.lock('Trial'), self.storage:
+            self.storage.insert({'experiment': 2, 'number': 0}, table_name='Trial')
+            os.write(write_fd, 'x')
+            time.sleep(0.2)
+        os.close(write_fd)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        reopened = LocalFileStorage('test', self.prefix)
+        self.assertEqual(reopened.count('Trial'), 11)
+        self.assertEqual(reopened.count('Experiment'), 1)
+
+    def test_external_change(self):
+        other = LocalFileStorage('test', self.prefix)
+        other.update({'number': 10}, 1, table_name='Trial')
+        self.assertEqual(self.storage.get({'number': 10}, table_name='Trial').eid, 1)
+        self.assertEqual(self.storage.count('Trial'), 10)
+
+    def test_snapshot(self):
+        other = LocalFileStorage('test', self.prefix)
+        with self.storage.snapshot():
+            other.update({'number': 10}, 1, table_name='Trial')
+            self.assertIsNone(self.storage.get({'number': 10}, table_name='Trial'))
+            with self.assertRaises(StorageError):
+                self.storage.remove(2, table_name='Trial')
+        self.assertEqual(self.storage.get({'number': 10}, table_name='Trial').eid, 1)
+        with self.storage.snapshot():
+            self.storage.remove(2, table_name='Trial')
+        self.assertEqual(other.count('Trial'), 9)
+
+    def test_parse_cache(self):
+        stats = local_file.CACHE_STATISTICS
+        hits, misses = stats['hits'], stats['misses']
+        self.assertEqual(LocalFileStorage('test', self.prefix).count('Trial'), 10)
+        self.assertEqual((stats['hits'], stats['misses']), (hits, misses + 1))
+        self.assertEqual(LocalFileStorage('test', self.prefix).count('Trial'), 10)
+        self.assertEqual((stats['hits'], stats['misses']), (hits + 1, misses + 1))
+        self.storage.remove(1, table_name='Trial')
+        self.assertEqual(LocalFileStorage('test', self.prefix).count('Trial'), 9)
+        self.assertEqual((stats['hits'], stats['misses']), (hits + 1, misses + 2))
+
+    def test_kvstore(self):
+        self.storage.kvstore.update({'a': 1, 'b': 2})
+        self.assertEqual(self.storage.kvstore.get_many(['a', 'b', 'c']), [1, 2, None])
+        with self.assertRaises(RuntimeError):
+            with self.storage:
+                self.storage['a'] = 3
+                del self.storage['b']
+                raise RuntimeError
+        reopened = LocalFileStorage('test', self.prefix)
+        self.assertEqual(dict(reopened.iteritems()), {'a': 1, 'b': 2})
+        self.assertEqual(reopened.count(), 0)
+
+    def test_kvstore_migration(self):
+        self.storage.insert({'key': 'selected_project', 'value': 1})
+        self.assertEqual(self.storage['selected_project'], 1)
+        self.assertEqual(self.storage.count(), 0)
+        self.assertIn('selected_project', LocalFileStorage('test', self.prefix))
+
+    def test_bulk_operations(self):
+        records = self.storage.insert_many([{'experiment': 3, 'number': i} for i in xrange(3)], table_name='Trial')
+        self.assertEqual([record.eid for record in records], [11, 12, 13])
+        self.storage.update_many([({'number': 5}, {'experiment': 3, 'number': 0}),
+                                  ({'experiment': 4}, [12, 13])], table_name='Trial')
+        self.assertEqual(self.storage.get({'experiment': 3}, table_name='Trial').eid, 11)
+        self.assertEqual(len(self.storage.search({'experiment': 4}, table_name='Trial')), 2)
+        found = self.storage.get_many([12, 99, {'number': 5}], table_name='Trial')
+        self.assertEqual([record and record.eid for record in found], [12, None, 11])
+        with self.assertRaises(KeyError):
+            self.storage.update_many([({'number': 0}, 99)], table_name='Trial')
+
+    def test_reference_index(self):
+        self.storage.add_reference_index('Trial', ['tags'])
+        found = self.storage.search_references('tags', [3, 4], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [4, 5])
+        self.storage.update({'tags': [3, 7]}, 1, table_name='Trial')
+        self.storage.remove(4, table_name='Trial')
+        found = self.storage.search_references('tags', [3], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [1])
+        found = self.storage.search_references('experiment', [1], table_name='Trial')
+        self.assertEqual(len(found), 4)
+
+    def _reference_storage(self):
+        storage = LocalFileStorage('test', self.prefix)
+        storage.add_index('Trial', ['experiment', 'number'])
+        storage.add_reference_index('Trial', ['tags'])
+        return storage
+
+    def test_index_cache(self):
+        stats = local_file.CACHE_STATISTICS
+        hits, misses = stats['index_hits'], stats['index_misses']
+        found = self._reference_storage().search_references('tags', [3], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [4])
+        self.assertEqual((stats['index_hits'], stats['index_misses']), (hits, misses + 1))
+        reopened = self._reference_storage()
+        found = reopened.search_references('tags', [3, 4], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [4, 5])
+        self.assertEqual(reopened.get({'experiment': 1, 'number': 3}, table_name='Trial').eid, 8)
+        self.assertEqual((stats['index_hits'], stats['index_misses']), (hits + 1, misses + 1))
+        reopened.update({'tags': [3]}, 1, table_name='Trial')
+        found = self._reference_storage().search_references('tags', [3], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [1, 4])
+        self.assertEqual((stats['index_hits'], stats['index_misses']), (hits + 1, misses + 2))
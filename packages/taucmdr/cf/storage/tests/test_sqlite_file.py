@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of sqlite_file.py.
+"""
+
+import os
+import json
+from taucmdr import tests
+from taucmdr.cf.storage.sqlite_file import SqliteStorage
+
+
+class SqliteFileTest(tests.TestCase):
+    """Unit tests for SqliteStorage."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        self.storage = SqliteStorage('test', self.prefix)
+
+    def tearDown(self):
+        self.storage.disconnect_database()
+
+    def test_insert_search(self):
+        first = self.storage.insert({'name': 'a', 'value': 1}, table_name='Foo')
+        second = self.storage.insert({'name': 'b', 'value': 2}, table_name='Foo')
+        self.assertNotEqual(first.eid, second.eid)
+        self.assertEqual(self.storage.get(second.eid, table_name='Foo')['name'], 'b')
+        self.assertEqual(self.storage.get({'value': 1}, table_name='Foo').eid, first.eid)
+        self.assertEqual(len(self.storage.search({'name': 'a', 'value': 2}, table_name='Foo', match_any=True)), 2)
+        self.assertTrue(self.storage.contains({'name': 'b'}, table_name='Foo'))
+        self.assertEqual(self.storage.count(table_name='Foo'), 2)
+
+    def test_reopen(self):
+        record = self.storage.insert({'name': 'a', 'value': 1}, table_name='Foo')
+        self.storage.update({'value': 2}, record.eid, table_name='Foo')
+        self.storage.unset(['name'], record.eid, table_name='Foo')
+        self.storage['key'] = 'value'
+        reopened = SqliteStorage('test', self.prefix)
+        self.assertEqual(dict(reopened.get(record.eid, table_name='Foo')), {'value': 2})
+        self.assertEqual(reopened['key'], 'value')
+        reopened.remove(record.eid, table_name='Foo')
+        self.assertFalse(self.storage.contains(record.eid, table_name='Foo'))
+
+    def test_snapshot(self):
+        record = self.storage.insert({'name': 'a', 'value': 1}, table_name='Foo')
+        other = SqliteStorage('test', self.prefix)
+        with self.storage.snapshot():
+            other.update({'value': 2}, record.eid, table_name='Foo')
+            self.assertEqual(self.storage.get(record.eid, table_name='Foo')['value'], 1)
+        self.assertEqual(self.storage.get(record.eid, table_name='Foo')['value'], 2)
+
+    def test_rollback(self):
+        record = self.storage.insert({'name': 'a'}, table_name='Foo')
+        with self.assertRaises(RuntimeError):
+            with self.storage:
+                self.storage.update({'name': 'b'}, record.eid, table_name='Foo')
+                self.storage.insert({'name': 'c'}, table_name='Foo')
+                raise RuntimeError
+        self.assertEqual(self.storage.search(table_name='Foo'), [{'name': 'a'}])
+        self.assertEqual(SqliteStorage('test', self.prefix).search(table_name='Foo'), [{'name': 'a'}])
+
+    def test_indexed_search(self):
+        for i in xrange(10):
+            self.storage.insert({'experiment': i % 2, 'number': i // 2, 'name': str(i)}, table_name='Trial')
+        found = self.storage.get({'experiment': 1, 'number': 3}, table_name='Trial')
+        self.assertEqual(found['name'], '7')
+        self.assertEqual(len(self.storage.search({'experiment': 0, 'name': '4'}, table_name='Trial')), 1)
+        self.assertEqual(len(self.storage.search({'number': 0, 'name': '9'}, table_name='Trial', match_any=True)), 3)
+        self.storage.update({'experiment': 5}, found.eid, table_name='Trial')
+        self.assertIsNone(self.storage.get({'experiment': 1, 'number': 3}, table_name='Trial'))
+        self.assertTrue(self.storage.contains({'experiment': 5}, table_name='Trial'))
+
+    def test_composite_index(self):
+        # pylint: disable=protected-access
+        for i in xrange(10):
+            self.storage.insert({'experiment': i % 2, 'number': i // 2, 'name': str(i)}, table_name='Trial')
+        index = self.storage._execute('PRAGMA index_info(%s)' % '"Trial.experiment.number"').fetchall()
+        self.assertEqual([row[2] for row in index], ['experiment', 'number'])
+        plan = self.storage._execute('EXPLAIN QUERY PLAN SELECT eid, data FROM "Trial" '
+                                     'WHERE "experiment" = ? AND "number" = ?', ('1', '3')).fetchall()
+        self.assertIn('Trial.experiment.number', ' '.join(str(row[-1]) for row in plan))
+        self.assertEqual(self.storage.get({'experiment': 1, 'number': 3}, table_name='Trial')['name'], '7')
+        self.storage.update({'number': 8}, {'experiment': 1, 'number': 3}, table_name='Trial')
+        self.assertIsNone(self.storage.get({'experiment': 1, 'number': 3}, table_name='Trial'))
+        self.assertEqual(self.storage.get({'experiment': 1, 'number': 8}, table_name='Trial')['name'], '7')
+
+    def test_migrate(self):
+        os.makedirs(self.prefix)
+        with open(os.path.join(self.prefix, 'test.json'), 'w') as fout:
+            json.dump({'_default': {'1': {'key': 'selected', 'value': 3}},
+                       'Foo': {'3': {'name': 'a'}, '7': {'name': 'b'}}}, fout)
+        self.assertEqual(self.storage['selected'], 3)
+        self.assertEqual(self.storage.get(7, table_name='Foo')['name'], 'b')
+        self.assertEqual(self.storage.insert({'name': 'c'}, table_name='Foo').eid, 8)
+
+    def test_bulk_operations(self):
+        records = self.storage.insert_many([{'name': 'a'}, {'name': 'b'}, {'name': 'c'}], table_name='Foo')
+        self.assertEqual([record.eid for record in records], [1, 2, 3])
+        self.assertEqual(self.storage.get(3, table_name='Foo')['name'], 'c')
+        self.storage.update_many([({'name': 'd'}, {'name': 'a'}), ({'name': 'a'}, 2)], table_name='Foo')
+        found = self.storage.get_many([1, 2, 9], table_name='Foo')
+        self.assertEqual([record and record['name'] for record in found], ['d', 'a', None])
+
+    def test_reference_index(self):
+        for i in xrange(10):
+            self.storage.insert({'experiment': i % 2, 'tags': [i, i + 1]}, table_name='Trial')
+        self.storage.add_reference_index('Trial', ['tags', 'experiment'])
+        found = self.storage.search_references('tags', [3, 4], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [3, 4, 5])
+        # Processes that never declared the index still maintain it
+        other = SqliteStorage('test', self.prefix)
+        other.update({'tags': [3]}, 1, table_name='Trial')
+        other.remove(4, table_name='Trial')
+        other.insert({'experiment': 1, 'tags': [4]}, table_name='Trial')
+        found = self.storage.search_references('tags', [3, 4], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [1, 3, 5, 11])
+        self.assertEqual(len(self.storage.search_references('experiment', [1], table_name='Trial')), 5)
+        reopened = SqliteStorage('test', self.prefix)
+        found = reopened.search_references('tags', [3], table_name='Trial')
+        self.assertEqual([record.eid for record in found], [1, 3])
+        self.assertIn('Trial', reopened._reference_fields)  # pylint: disable=protected-access
+        reopened.purge('Trial')
+        self.assertEqual(self.storage.search_references('tags', [3], table_name='Trial'), [])
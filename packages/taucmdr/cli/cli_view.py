@@ -35,7 +35,7 @@ from taucmdr import EXIT_SUCCESS
 from taucmdr import logger, util, cli
 from taucmdr.error import UniqueAttributeError, InternalError, ModelError, ProjectSelectionError
 from taucmdr.cf.storage import StorageError
-from taucmdr.cf.storage.levels import SYSTEM_STORAGE, USER_STORAGE, PROJECT_STORAGE
+from taucmdr.cf.storage.levels import SYSTEM_STORAGE, USER_STORAGE, PROJECT_STORAGE, snapshot
 from taucmdr.model.project import Project
 from taucmdr.cli import arguments
 from taucmdr.cli.command import AbstractCommand
@@ -269,8 +269,8 @@ class ListCommand(AbstractCliView):
                                              'storage_path': records[0].storage}, 'cyan')
         header_row = [col['header'] for col in self.dashboard_columns]
         rows = [header_row]
-        for record in records:
-            populated = record.populate()
+        populated_records = self.model.controller(records[0].storage).populate_many(records)
+        for populated in populated_records:
             row = []
             for col in self.dashboard_columns:
                 if 'value' in col:
@@ -334,9 +334,9 @@ class ListCommand(AbstractCliView):
         title = util.hline(self.title_fmt % {'model_name': records[0].name.capitalize(), 
                                              'storage_path': records[0].storage}, 'cyan')
         retval = [title]
-        for record in records:
+        populated_records = self.model.controller(records[0].storage).populate_many(records)
+        for populated in populated_records:
             rows = [['Attribute', 'Value', 'Command Flag', 'Description']]
-            populated = record.populate()
             for key, val in sorted(populated.iteritems()):
                 if key != self.model.key_attribute:
                     rows.append(self._format_long_item(key, val))
@@ -421,7 +421,8 @@ class ListCommand(AbstractCliView):
         keys = getattr(args, 'keys', None)
         style = getattr(args, 'style', None) or self.default_style
         storage_levels = arguments.parse_storage_flag(args)
-        return self._list_records(storage_levels, keys, style)
+        with snapshot():
+            return self._list_records(storage_levels, keys, style)
     
     def _retrieve_records(self, ctrl, keys):
         """Retrieve modeled data from the controller.
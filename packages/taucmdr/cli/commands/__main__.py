@@ -39,6 +39,8 @@ from taucmdr.cli import UnknownCommandError, arguments
 from taucmdr.cli.command import AbstractCommand
 from taucmdr.cli.commands.build import COMMAND as build_command
 from taucmdr.cli.commands.trial.create import COMMAND as trial_create_command
+from taucmdr.cf.compiler.probe_cache import PROBE_CACHE
+from taucmdr.cf.software.verification import VERIFICATION_MANIFESTS
 from taucmdr.model.project import Project
 
 LOGGER = logger.get_logger(__name__)
@@ -96,6 +98,14 @@ class MainCommand(AbstractCommand):
                             metavar='[options]',
                             nargs=arguments.REMAINDER)
         parser.add_argument('-V', '--version', action='version', version=taucmdr.version_banner())
+        parser.add_argument('--refresh-compilers',
+                            help="probe compilers again instead of using cached probe results",
+                            default=arguments.SUPPRESS,
+                            action='store_true')
+        parser.add_argument('--deep-verify',
+                            help="fully verify software packages instead of trusting verification manifests",
+                            default=arguments.SUPPRESS,
+                            action='store_true')
         group = parser.add_mutually_exclusive_group()
         group.add_argument('-v', '--verbose',
                            help="show debugging messages",
@@ -126,6 +136,11 @@ class MainCommand(AbstractCommand):
         logger.set_log_level(log_level)
         LOGGER.debug('Arguments: %s', args)
         LOGGER.debug('Verbosity level: %s', logger.LOG_LEVEL)
+        
+        if getattr(args, 'refresh_compilers', False):
+            PROBE_CACHE.refresh = True
+        if getattr(args, 'deep_verify', False):
+            VERIFICATION_MANIFESTS.deep = True
 
         # Try to execute as a TAU command
         try:
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""``project compact`` subcommand."""
+
+import os
+import time
+from datetime import datetime, timedelta
+from taucmdr import EXIT_SUCCESS, util
+from taucmdr.cli import arguments
+from taucmdr.cli.command import AbstractCommand
+from taucmdr.model.trial import Trial
+from taucmdr.cf.storage.levels import PROJECT_STORAGE
+
+
+def _parse_time(timestamp):
+    """Parse a timestamp recorded by :any:`TrialController.perform`."""
+    for fmt in '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S':
+        try:
+            return datetime.strptime(timestamp, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+class ProjectCompactCommand(AbstractCommand):
+    """``project compact`` subcommand."""
+
+    def _construct_parser(self):
+        usage = "%s [arguments]" % self.command
+        parser = arguments.get_parser(prog=self.command, usage=usage, description=self.summary)
+        parser.add_argument('--days',
+                            help="archive trials that began more than this many days ago",
+                            metavar='<days>',
+                            type=int,
+                            default=arguments.SUPPRESS)
+        parser.add_argument('--keep',
+                            help="archive all but the most recent <count> trials of each experiment",
+                            metavar='<count>',
+                            type=int,
+                            default=arguments.SUPPRESS)
+        return parser
+
+    @staticmethod
+    def _measure():
+        """Measure the project database.
+
+        The database is loaded twice and the second load is timed since that is the cost
+        paid by each following command once any parse caches are up to date.
+
+        Returns:
+            tuple: (Size of the database files in bytes, seconds to load the database).
+        """
+        size = sum(os.path.getsize(path) for path in PROJECT_STORAGE.database_files if os.path.exists(path))
+        elapsed = 0
+        for _ in xrange(2):
+            PROJECT_STORAGE.disconnect_database()
+            start = time.time()
+            PROJECT_STORAGE.count()
+            elapsed = time.time() - start
+        return size, elapsed
+
+    @staticmethod
+    def _cold_trials(trials, days, keep):
+        """Select trials to archive.
+
+        Args:
+            trials (list): Trials to choose from.
+            days (int): Select trials that began more than this many days ago, or None.
+            keep (int): Select all but the `keep` highest numbered trials of each experiment, or None.
+
+        Returns:
+            list: Trials to archive.  Trials that are still being performed are never selected.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=days) if days is not None else None
+        by_experiment = {}
+        for trial in trials:
+            by_experiment.setdefault(trial['experiment'], []).append(trial)
+        cold = []
+        for expr_trials in by_experiment.itervalues():
+            expr_trials.sort(key=lambda trial: trial['number'])
+            recent = set(trial['number'] for trial in expr_trials[len(expr_trials)-keep:]) if keep else set()
+            for trial in expr_trials:
+                if trial.get('phase') in ('initializing', 'executing'):
+                    continue
+                if keep is not None and trial['number'] not in recent:
+                    cold.append(trial)
+                elif cutoff is not None:
+                    begin_time = _parse_time(trial.get('begin_time', ''))
+                    if begin_time is not None and begin_time < cutoff:
+                        cold.append(trial)
+        return cold
+
+    def main(self, argv):
+        args = self._parse_args(argv)
+        days = getattr(args, 'days', None)
+        keep = getattr(args, 'keep', None)
+        for flag, value in ('--days', days), ('--keep', keep):
+            if value is not None and value < 0:
+                self.parser.error("%s must not be negative" % flag)
+        size_before, load_before = self._measure()
+        with PROJECT_STORAGE.lock(Trial.name):
+            if days is not None or keep is not None:
+                trial_ctrl = Trial.controller(PROJECT_STORAGE)
+                cold = self._cold_trials(trial_ctrl.all(), days, keep)
+                if cold:
+                    archive = PROJECT_STORAGE.archive_storage(create=True)
+                    trial_ctrl.archive(cold, archive)
+                    self.logger.info("Archived %d trials to '%s'", len(cold), archive.dbfile)
+            PROJECT_STORAGE.compact()
+        size_after, load_after = self._measure()
+        self.logger.info("Project database size: %s -> %s (saved %s)", util.human_size(size_before),
+                         util.human_size(size_after), util.human_size(max(size_before - size_after, 0)))
+        self.logger.info("Project database load time: %.3f -> %.3f seconds", load_before, load_after)
+        return EXIT_SUCCESS
+
+
+COMMAND = ProjectCompactCommand(__name__, summary_fmt=("Compact the project database.\n"
+                                                       "Use --days or --keep to archive old trials.  Archiving "
+                                                       "moves trial records to archive.json in the project "
+                                                       "directory: archived trials no longer appear in trial "
+                                                       "commands and cannot be restored, but their data files "
+                                                       "stay in the experiment directory and their trial numbers "
+                                                       "are not reused."))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, ParaTools, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# (1) Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# (2) Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# (3) Neither the name of ParaTools, Inc. nor the names of its contributors may
+#     be used to endorse or promote products derived from this software without
+#     specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""Test functions.
+
+Functions used for unit tests of compact.py.
+"""
+
+
+import os
+from datetime import datetime, timedelta
+from taucmdr import tests
+from taucmdr.cf.storage.levels import PROJECT_STORAGE
+from taucmdr.cli.commands.project.compact import COMMAND as compact_cmd
+from taucmdr.model.experiment import Experiment
+from taucmdr.model.project import Project
+from taucmdr.model.trial import Trial
+
+class CompactTest(tests.TestCase):
+    """Tests for :any:`project.compact`."""
+
+    @staticmethod
+    def _create_trials(phases_and_ages):
+        """Create trials of the selected experiment without performing them.
+
+        Args:
+            phases_and_ages (list): (phase, age in days) of each trial, in trial number order.
+
+        Returns:
+            Experiment: The selected experiment.
+        """
+        expr = Project.selected().experiment()
+        trial_ctrl = Trial.controller(PROJECT_STORAGE)
+        for phase, age in phases_and_ages:
+            with PROJECT_STORAGE.lock(Trial.name), PROJECT_STORAGE.lock(Experiment.name), PROJECT_STORAGE:
+                trial_ctrl.create({'number': expr.next_trial_number(),
+                                   'experiment': expr.eid,
+                                   'command': './a.out',
+                                   'cwd': os.getcwd(),
+                                   'phase': phase,
+                                   'begin_time': str(datetime.utcnow() - timedelta(days=age))})
+        return expr
+
+    @staticmethod
+    def _numbers(trials):
+        return sorted(trial['number'] for trial in trials)
+
+    def _check_archived(self, expr, archived, remaining):
+        archive = PROJECT_STORAGE.archive_storage()
+        self.assertIsNotNone(archive)
+        self.assertEqual(self._numbers(archive.search({'experiment': expr.eid}, table_name=Trial.name)), archived)
+        expr = Experiment.controller(PROJECT_STORAGE).one(expr.eid)
+        self.assertEqual(self._numbers(expr.populate('trials')), remaining)
+        self.assertEqual(self._numbers(Trial.controller(PROJECT_STORAGE).search({'experiment': expr.eid})),
+                         remaining)
+
+    def test_archive_keep(self):
+        self.reset_project_storage()
+        expr = self._create_trials([('executing', 4), ('completed', 3), ('completed', 2), ('completed', 1)])
+        stdout, stderr = self.assertCommandReturnValue(0, compact_cmd, ['--keep', '1'])
+        self.assertIn('Archived 2 trials', stdout)
+        self.assertFalse(stderr)
+        # The running trial stays even though it is one of the oldest
+        self._check_archived(expr, [1, 2], [0, 3])
+
+    def test_archive_days(self):
+        self.reset_project_storage()
+        expr = self._create_trials([('completed', 10), ('executing', 10), ('completed', 5), ('completed', 0)])
+        stdout, stderr = self.assertCommandReturnValue(0, compact_cmd, ['--days', '7'])
+        self.assertIn('Archived 1 trials', stdout)
+        self.assertFalse(stderr)
+        self._check_archived(expr, [0], [1, 2, 3])
+        stdout, _ = self.assertCommandReturnValue(0, compact_cmd, ['--days', '1'])
+        self.assertIn('Archived 1 trials', stdout)
+        self._check_archived(expr, [0, 2], [1, 3])
+
+    def test_archived_numbers_not_reused(self):
+        self.reset_project_storage()
+        expr = self._create_trials([('completed', 3), ('completed', 2), ('completed', 1)])
+        self.assertCommandReturnValue(0, compact_cmd, ['--keep', '1'])
+        self._check_archived(expr, [0, 1], [2])
+        expr_ctrl = Experiment.controller(PROJECT_STORAGE)
+        # Experiments created by earlier versions find free numbers by scanning their trials and the archive
+        expr_ctrl.unset(['trial_counter', 'free_trial_numbers'], expr.eid)
+        with PROJECT_STORAGE.lock(Trial.name), PROJECT_STORAGE.lock(Experiment.name), PROJECT_STORAGE:
+            self.assertEqual(expr_ctrl.one(expr.eid).next_trial_number(), 3)
+
+    def test_compact(self):
+        self.reset_project_storage()
+        stdout, stderr = self.assertCommandReturnValue(0, compact_cmd, ['--keep', '1'])
+        self.assertIn('Project database size', stdout)
+        self.assertFalse(stderr)
+
+    def test_negative_keep(self):
+        self.reset_project_storage()
+        _, stderr = self.assertNotCommandReturnValue(0, compact_cmd, ['--keep', '-1'])
+        self.assertIn('--keep must not be negative', stderr)
@@ -168,15 +168,8 @@ class TargetCreateCommand(CreateCommand):
 
     def _get_compiler_from_sibling(self, role, sibling):
         """If we know a compiler sibling then use its family information to fill this role."""
-        for info in sibling.info.family.members.get(role, []):
-            try:
-                comp = InstalledCompiler.probe(info.command, family=sibling.info.family, role=role)
-            except ConfigurationError as err:
-                self.logger.debug(err)
-                continue
-            else:
-                return comp
-        return None
+        family = sibling.info.family
+        return InstalledCompiler.probe_any([(info.command, family, role) for info in family.members.get(role, [])])
 
     def _get_compiler_from_defaults(self, kbase, role):
         """Use model defaults and preferred family to fill this role."""
@@ -191,16 +184,8 @@ class TargetCreateCommand(CreateCommand):
         else:
             return comp
         # If no model default use check all compiler families starting with the host's preferred family
-        for family in kbase.iterfamilies():
-            for info in family.members.get(role, []):
-                try:
-                    comp = InstalledCompiler.probe(info.command, family=family, role=role)
-                except ConfigurationError as err:
-                    self.logger.debug(err)
-                    continue
-                else:
-                    return comp
-        return None
+        return InstalledCompiler.probe_any([(info.command, family, role) for family in kbase.iterfamilies() 
+                                            for info in family.members.get(role, [])])
 
     def _configure_argument_group(self, group, kbase, family_flag, family_attr, hint):
         # Check environment variables for default compilers.
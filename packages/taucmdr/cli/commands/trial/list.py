@@ -33,6 +33,7 @@ from taucmdr.error import InternalError
 from taucmdr.cli.cli_view import ListCommand
 from taucmdr.model.project import Project
 from taucmdr.model.trial import Trial
+from taucmdr.cf.storage.blob_store import BlobStore
 
 
 DASHBOARD_COLUMNS = [{'header': 'Number', 'value': 'number'},
@@ -58,7 +59,10 @@ class TrialListCommand(ListCommand):
     def _format_long_item(self, key, val):
         key, val, flags, description = super(TrialListCommand, self)._format_long_item(key, val)
         if key == 'environment':
-            val = '(base64 encoded, %d bytes)' % len(val)
+            if BlobStore.is_key(val):
+                val = '(blob %s)' % val[:12]
+            else:
+                val = '(base64 encoded, %d bytes)' % len(val)
         return [key, val, flags, description]
 
     def dashboard_format(self, records):
@@ -77,8 +81,8 @@ class TrialListCommand(ListCommand):
         subtitle = util.color_text("Selected experiment: ", 'cyan') + expr['name']
         header_row = [col['header'] for col in self.dashboard_columns]
         rows = [header_row]
-        for record in records:
-            populated = record.populate()
+        populated_records = self.model.controller(records[0].storage).populate_many(records)
+        for populated in populated_records:
             row = []
             for col in self.dashboard_columns:
                 if 'value' in col:
@@ -33,7 +33,6 @@ The selected experiment will be used for application compilation and trial visua
 """
 
 import os
-import fasteners
 from taucmdr import logger, util
 from taucmdr.error import ConfigurationError, InternalError, IncompatibleRecordError, ProjectSelectionError
 from taucmdr.error import ExperimentSelectionError
@@ -41,6 +40,7 @@ from taucmdr.mvc.model import Model
 from taucmdr.mvc.controller import Controller
 from taucmdr.model.trial import Trial
 from taucmdr.model.project import Project
+from taucmdr.cf.software import SoftwarePackageError
 from taucmdr.cf.storage.levels import PROJECT_STORAGE, highest_writable_storage
 
 
@@ -93,6 +93,14 @@ def attributes():
         'tau_makefile': {
             'type': 'string',
             'description': 'TAU Makefile used during this experiment, if any.'
+        },
+        'trial_counter': {
+            'type': 'integer',
+            'description': "number of the next new trial if no free trial number can be reused"
+        },
+        'free_trial_numbers': {
+            'type': 'array',
+            'description': "numbers of deleted trials that may be reused, in ascending order"
         }
     }
 
@@ -126,7 +134,7 @@ class ExperimentController(Controller):
      
     def all(self):
         keys = {'project': self._project_eid}
-        return [self.model(record) for record in self.storage.search(keys=keys, table_name=self.model.name)]
+        return [self._model(record) for record in self.storage.search(keys=keys, table_name=self.model.name)]
     
     def count(self):
         try:
@@ -144,9 +152,10 @@ class ExperimentController(Controller):
         """Default match_any to False to prevent matches outside the selected project."""
         return super(ExperimentController, self)._check_unique(data, match_any)
  
-    def create(self, data):
-        data['project'] = self._project_eid
-        return super(ExperimentController, self).create(data)
+    def create_many(self, data_list):
+        for data in data_list:
+            data['project'] = self._project_eid
+        return super(ExperimentController, self).create_many(data_list)
  
     def update(self, data, keys):
         return super(ExperimentController, self).update(data, self._restrict_project(keys))
@@ -157,6 +166,24 @@ class ExperimentController(Controller):
     def delete(self, keys):
         return super(ExperimentController, self).delete(self._restrict_project(keys))
 
+    def release_trial_numbers(self, released):
+        """Allow the numbers of deleted trials to be reused.
+        
+        Args:
+            released (dict): Sets of trial numbers keyed by experiment element identifier.
+        """
+        # Trials may be deleted along with their project so don't restrict lookups to the selected project
+        with self.storage.lock(self.model.name):
+            updates = []
+            for eid, numbers in released.iteritems():
+                expr = super(ExperimentController, self).one(eid)
+                # Experiments without a trial counter find free numbers by scanning their trials
+                if expr is not None and 'trial_counter' in expr:
+                    free = sorted(set(expr.get('free_trial_numbers', [])).union(numbers))
+                    updates.append(({'free_trial_numbers': free}, eid))
+            if updates:
+                self.update_many(updates)
+
 
 class Experiment(Model):
     """Experiment data model."""
@@ -225,7 +252,7 @@ class Experiment(Model):
 
     @property
     def prefix(self):
-        with fasteners.InterProcessLock(os.path.join(PROJECT_STORAGE.prefix, '.lock')):
+        with PROJECT_STORAGE.lock(Project.name, shared=True):
             return os.path.join(self.populate('project').prefix, self['name'])
 
     def verify(self):
@@ -261,14 +288,46 @@ class Experiment(Model):
     def data_size(self):
         return sum([int(trial.get('data_size', 0)) for trial in self.populate('trials')])
 
+    def _scan_trial_numbers(self):
+        """Find the trial counter and free trial numbers of an experiment created without a trial counter.
+        
+        Returns:
+            tuple: (counter, free) where `counter` is one more than the largest trial number in use
+                   and `free` is a list of unused numbers less than `counter`. 
+        """
+        numbers = set(trial['number'] for trial in self.populate(attribute='trials', defaults=True))
+        # Don't reuse the numbers (and data directories) of archived trials
+        archive = PROJECT_STORAGE.archive_storage()
+        if archive is not None:
+            numbers.update(record['number'] for record in archive.search({'experiment': self.eid}, 
+                                                                         table_name=Trial.name))
+        counter = max(numbers) + 1 if numbers else 0
+        return counter, sorted(set(xrange(counter)) - numbers)
+
     def next_trial_number(self):
-        trials = self.populate(attribute='trials', defaults=True)
-        for i, j in enumerate(sorted([trial['number'] for trial in trials])):
-            if i != j:
-                return i
-        return len(trials)
+        """Claim a number for a new trial of this experiment.
+        
+        The smallest number of a deleted trial is reused if there is one, otherwise the experiment's 
+        trial counter is advanced.  The caller must hold the exclusive locks on the Trial and Experiment 
+        tables and should create the trial in the same transaction so that a failure releases the number.
+        
+        Returns:
+            int: The new trial number.
+        """
+        ctrl = self.controller(self.storage)
+        expr = ctrl.one(self.eid)
+        if 'trial_counter' in expr:
+            counter, free = expr['trial_counter'], list(expr.get('free_trial_numbers', []))
+        else:
+            counter, free = self._scan_trial_numbers()
+        if free:
+            number = free.pop(0)
+        else:
+            number = counter
+            counter += 1
+        ctrl.update({'trial_counter': counter, 'free_trial_numbers': free}, self.eid)
+        return number
 
-    @fasteners.interprocess_locked(os.path.join(highest_writable_storage().prefix, '.lock'))
     def configure(self):
         """Sets up the Experiment for a new trial.
 
@@ -280,7 +339,7 @@ class Experiment(Model):
         """
         from taucmdr.cf.software.tau_installation import TauInstallation
         LOGGER.debug("Configuring experiment %s", self['name'])
-        with fasteners.InterProcessLock(os.path.join(PROJECT_STORAGE.prefix, '.lock')):
+        with self.storage.lock(self.name, shared=True):
             populated = self.populate(defaults=True)
         target = populated['target']
         application = populated['application']
@@ -336,9 +395,32 @@ class Experiment(Model):
                     throttle_per_call=measurement.get_or_default('throttle_per_call'),
                     throttle_num_calls=measurement.get_or_default('throttle_num_calls'),
                     forced_makefile=target.get('forced_makefile', None))
-        tau.install()
+        # Verify an existing installation under a shared lock so concurrent builds don't wait on each other.
+        # Only take the exclusive lock when TAU (or a dependency) must actually be installed.
+        storage = highest_writable_storage()
+        with storage.lock(shared=True):
+            try:
+                tau.verify()
+            except SoftwarePackageError as err:
+                LOGGER.debug(err)
+                installed = False
+            else:
+                tau.install()
+                installed = True
+        if not installed:
+            with storage.lock():
+                # Another process may have installed TAU while this process waited for the exclusive lock
+                try:
+                    tau.verify()
+                except SoftwarePackageError:
+                    tau.install()
+                else:
+                    tau.check_env_compat()
         if not baseline:
-            self.controller(self.storage).update({'tau_makefile': os.path.basename(tau.get_makefile())}, self.eid)
+            makefile = os.path.basename(tau.get_makefile())
+            if self.get('tau_makefile') != makefile:
+                with self.storage.lock(self.name):
+                    self.controller(self.storage).update({'tau_makefile': makefile}, self.eid)
         return tau
 
     def managed_build(self, compiler_cmd, compiler_args):
@@ -428,9 +510,10 @@ class Experiment(Model):
             ConfigurationError: Invalid trial number or no trials in selected experiment.
         """
         if trial_numbers:
+            trials = []
+            ctrl = Trial.controller(self.storage)
             for num in trial_numbers:
-                trials = []
-                found = Trial.controller(self.storage).one({'experiment': self.eid, 'number': num})
+                found = ctrl.one({'experiment': self.eid, 'number': num})
                 if not found:
                     raise ConfigurationError("Experiment '%s' has no trial with number %s" % (self.name, num))
                 trials.append(found)
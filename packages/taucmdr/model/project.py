@@ -86,13 +86,13 @@ def attributes():
 class ProjectController(Controller):
     """Project data controller."""
     
-    def create(self, data):
+    def create_many(self, data_list):
         if self.storage is not PROJECT_STORAGE:
             raise InternalError("Projects may only be created in project-level storage")
-        return super(ProjectController, self).create(data)
+        return super(ProjectController, self).create_many(data_list)
     
-    def delete(self, keys):
-        super(ProjectController, self).delete(keys)
+    def delete_many(self, keys_list):
+        super(ProjectController, self).delete_many(keys_list)
         try:
             selected = self.selected()
         except ProjectSelectionError:
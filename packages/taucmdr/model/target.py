@@ -37,17 +37,17 @@ compilers are installed then there will target configurations for each compiler
 
 import os
 import glob
-import fasteners
 from taucmdr import logger, util
 from taucmdr.error import ConfigurationError, IncompatibleRecordError 
 from taucmdr.error import ProjectSelectionError, ExperimentSelectionError
 from taucmdr.mvc.model import Model
 from taucmdr.model.compiler import Compiler
 from taucmdr.cf import software
+from taucmdr.cf.software.prefetch import prefetch
 from taucmdr.cf.platforms import Architecture, OperatingSystem 
 from taucmdr.cf.platforms import HOST_ARCH, INTEL_KNC, HOST_OS, DARWIN, CRAY_CNL
 from taucmdr.cf.compiler import Knowledgebase, InstalledCompilerSet
-from taucmdr.cf.storage.levels import PROJECT_STORAGE, SYSTEM_STORAGE
+from taucmdr.cf.storage.levels import SYSTEM_STORAGE
 
 
 LOGGER = logger.get_logger(__name__)
@@ -528,16 +528,11 @@ class Target(Model):
         return cls(self.sources(), self.architecture(), self.operating_system(), self.compilers())
     
     def acquire_sources(self):
-        """Acquire all source code packages known to this target."""
-        for attr, val in self.iteritems():
-            if val and attr.endswith('_source'):
-                inst = self.get_installation(attr.replace('_source', ''))
-                try:
-                    inst.acquire_source()
-                except ConfigurationError as err:
-                    # Not a warning since using an existing installation is OK and in that case
-                    # there is no source code package to acquire. 
-                    LOGGER.info(err)
+        """Acquire all source code packages known to this target concurrently.
+        
+        Packages using an existing installation have no source code package to acquire and are skipped.
+        """
+        prefetch([self.get_installation(name) for name in self.sources()])
 
     def compilers(self):
         """Get information about the compilers used by this target configuration.
@@ -550,7 +545,7 @@ class Target(Model):
             compilers = {}
             for role in Knowledgebase.all_roles():
                 try:
-                    with fasteners.InterProcessLock(os.path.join(PROJECT_STORAGE.prefix, '.lock')):
+                    with self.storage.lock(Compiler.name, shared=True):
                         compiler_record = self.populate(role.keyword)
                 except KeyError:
                     continue
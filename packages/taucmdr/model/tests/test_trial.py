@@ -36,3 +36,43 @@ from taucmdr import tests
 @tests.not_implemented
 class TrialTest(tests.TestCase):
     pass
+
+
+class EnvironmentTest(tests.TestCase):
+    """Tests for storing trial environments as blobs."""
+
+    def test_delta(self):
+        from taucmdr.model import trial
+        from taucmdr.cf.storage.blob_store import BlobStore
+        blobs = BlobStore(tests.get_test_workdir())
+        env = {'VAR%d' % i: 'value%d' % i for i in xrange(100)}
+        first = trial._store_environment(blobs, env)
+        self.assertEqual(trial._store_environment(blobs, dict(env), first), first)
+        changed = dict(env, VAR0='changed')
+        del changed['VAR1']
+        second = trial._store_environment(blobs, changed, first)
+        self.assertNotEqual(second, first)
+        self.assertLess(len(blobs.get(second)), len(blobs.get(first)))
+        self.assertEqual(trial._load_environment(blobs, second), (changed, 1))
+
+    def test_encoding(self):
+        from taucmdr.model import trial
+        from taucmdr.cf.storage.blob_store import BlobStore
+        blobs = BlobStore(tests.get_test_workdir())
+        env = {'LATIN': 'caf\xe9', 'BINARY': '\xff\xfe\x80', 'UTF8': u'caf\xe9'.encode('utf-8')}
+        first = trial._store_environment(blobs, env)
+        self.assertEqual(trial._load_environment(blobs, first), (env, 0))
+        changed = dict(env)
+        changed.update({'BINARY': '\x81', 'NAME_\xe9': 'x'})
+        second = trial._store_environment(blobs, changed, first)
+        loaded = trial._load_environment(blobs, second)[0]
+        self.assertEqual(loaded, changed)
+        self.assertTrue(all(isinstance(value, str) for value in loaded.itervalues()))
+
+    def test_legacy_encoding(self):
+        import json
+        from taucmdr.model import trial
+        from taucmdr.cf.storage.blob_store import BlobStore
+        blobs = BlobStore(tests.get_test_workdir())
+        legacy = blobs.put(json.dumps({'environment': {'VAR': u'caf\xe9'}}))
+        self.assertEqual(trial._load_environment(blobs, legacy), ({'VAR': 'caf\xc3\xa9'}, 0))
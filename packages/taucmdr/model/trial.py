@@ -33,23 +33,110 @@ the performance data.
 """
 
 import os
+import ast
 import glob
+import json
 import errno
 import base64
 import time
 from datetime import datetime
-import fasteners
 from taucmdr import logger, util
 from taucmdr.error import ConfigurationError, InternalError
+from taucmdr.cf.storage import StorageError
 from taucmdr.progress import ProgressIndicator
 from taucmdr.mvc.controller import Controller
 from taucmdr.mvc.model import Model
 from taucmdr.cf.software.tau_installation import TauInstallation, PROGRAM_LAUNCHERS
-from taucmdr.cf.storage.levels import PROJECT_STORAGE
+from taucmdr.cf.storage.blob_store import BlobStore
 
 
 LOGGER = logger.get_logger(__name__)
 
+ENVIRONMENT_DELTA_DEPTH = 16
+"""int: Maximum number of deltas to apply when decoding a trial environment."""
+
+_LAST_ENVIRONMENT_KEY = 'last_trial_environment'
+
+_ENVIRONMENT_ENCODING = 'latin-1'
+
+
+def _environment_blobs(storage):
+    return BlobStore(os.path.join(storage.prefix, 'blobs'))
+
+
+def _environment_bytes(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else str(value)
+
+
+def _encode_strings(strings):
+    """Convert environment byte strings to JSON strings.
+
+    Environments are byte strings in any encoding so they are stored as latin-1, which maps each
+    byte to one character and back.
+    """
+    if isinstance(strings, dict):
+        return {name.decode(_ENVIRONMENT_ENCODING): value.decode(_ENVIRONMENT_ENCODING)
+                for name, value in strings.iteritems()}
+    return [name.decode(_ENVIRONMENT_ENCODING) for name in strings]
+
+
+def _decode_strings(doc, strings):
+    """Convert JSON strings back to the byte strings stored by :any:`_encode_strings`.
+
+    Environments stored by earlier versions are UTF-8.
+    """
+    encoding = doc.get('encoding', 'utf-8')
+    if isinstance(strings, dict):
+        return {name.encode(encoding): value.encode(encoding) for name, value in strings.iteritems()}
+    return [name.encode(encoding) for name in strings]
+
+
+def _load_environment(blobs, key):
+    """Decode an environment stored by :any:`_store_environment`.
+
+    Returns:
+        tuple: (Environment variables as a dictionary, number of deltas applied).
+    """
+    doc = json.loads(blobs.get(key))
+    if 'base' not in doc:
+        return _decode_strings(doc, doc['environment']), 0
+    env, depth = _load_environment(blobs, doc['base'])
+    env.update(_decode_strings(doc, doc['set']))
+    for name in _decode_strings(doc, doc['unset']):
+        env.pop(name, None)
+    return env, depth + 1
+
+
+def _store_environment(blobs, env, base_key=None):
+    """Store an environment in a blob store.
+
+    If `base_key` names a stored environment then the environment may be stored as the 
+    difference from that environment.  An environment equal to the base environment is 
+    not stored again.
+
+    Returns:
+        str: The key of the stored environment.
+    """
+    env = {_environment_bytes(name): _environment_bytes(val) for name, val in env.iteritems()}
+    full = json.dumps({'encoding': _ENVIRONMENT_ENCODING, 'environment': _encode_strings(env)}, sort_keys=True)
+    if base_key:
+        try:
+            base_env, depth = _load_environment(blobs, base_key)
+        except (StorageError, ValueError, KeyError) as err:
+            LOGGER.debug("Not encoding environment as a delta: %s", err)
+        else:
+            if base_env == env:
+                return base_key
+            if depth < ENVIRONMENT_DELTA_DEPTH:
+                delta = json.dumps({'base': base_key,
+                                    'encoding': _ENVIRONMENT_ENCODING,
+                                    'set': _encode_strings({name: val for name, val in env.iteritems()
+                                                            if base_env.get(name) != val}),
+                                    'unset': _encode_strings(sorted(set(base_env) - set(env)))}, sort_keys=True)
+                if len(delta) < len(full):
+                    return blobs.put(delta)
+    return blobs.put(full)
+
 
 def attributes():
     from taucmdr.model.experiment import Experiment
@@ -63,6 +150,7 @@ def attributes():
         'experiment': {
             'model': Experiment,
             'required': True,
+            'indexed': True,
             'description': "this trial's experiment"
         },
         'command': {
@@ -77,7 +165,7 @@ def attributes():
         },
         'environment': {
             'type': 'string',
-            'description': "shell environment in which the trial was performed, encoded as a base64 string"
+            'description': "key of the shell environment in which the trial was performed in the project's blob store"
         },
         'begin_time': {
             'type': 'datetime',
@@ -131,6 +219,23 @@ class TrialController(Controller):
         LOGGER.info(headline)
         return timestamp
 
+    def delete_many(self, keys_list):
+        """Delete trials and allow their numbers to be reused by new trials of the same experiment.
+        
+        Args:
+            keys_list (list): Fields or element identifiers to match, see :any:`Controller.delete`.
+        """
+        from taucmdr.model.experiment import Experiment
+        # Hold the Experiment lock until the released numbers are committed
+        with self.storage.lock(Experiment.name), self._modifying():
+            released = {}
+            for keys in keys_list:
+                if keys:
+                    for trial in self.search(keys):
+                        released.setdefault(trial['experiment'], set()).add(trial['number'])
+            super(TrialController, self).delete_many(keys_list)
+            Experiment.controller(self.storage).release_trial_numbers(released)
+
     def _perform_bluegene(self, expr, trial, cmd, cwd, env):
         if os.path.basename(cmd[0]) != 'qsub':
             raise TrialError("At the moment, TAU Commander requires qsub to launch on BlueGene")
@@ -196,6 +301,21 @@ class TrialController(Controller):
         LOGGER.info('Elapsed seconds: %s', elapsed)
         return retval
 
+    def _store_environment(self, env):
+        """Store a trial environment in the blob store, encoded against the previous trial environment.
+
+        Returns:
+            str: The environment's blob key.
+        """
+        try:
+            base_key = self.storage[_LAST_ENVIRONMENT_KEY]
+        except KeyError:
+            base_key = None
+        key = _store_environment(_environment_blobs(self.storage), env, base_key)
+        if key != base_key:
+            self.storage[_LAST_ENVIRONMENT_KEY] = key
+        return key
+
     def perform(self, proj, cmd, cwd, env, description):
         """Performs a trial of an experiment.
 
@@ -207,7 +327,9 @@ class TrialController(Controller):
             env (dict): Environment variables to set before performing the trial.
             description (str): Description of this trial.
         """
-        with fasteners.InterProcessLock(os.path.join(PROJECT_STORAGE.prefix, '.lock')):
+        from taucmdr.model.experiment import Experiment
+        # Claiming a trial number rewrites the Experiment record
+        with self.storage.lock(self.model.name), self.storage.lock(Experiment.name), self._modifying():
             expr = proj.populate('experiment')
             trial_number = expr.next_trial_number()
             LOGGER.debug("New trial number is %d", trial_number)
@@ -225,7 +347,7 @@ class TrialController(Controller):
         measurement = expr.populate('measurement')
         if measurement['trace'] == 'otf2' or measurement['profile'] == 'cubex':
             env['SCOREP_EXPERIMENT_DIRECTORY'] = trial.prefix
-        b64env = base64.b64encode(repr(env))
+        env_key = self._store_environment(env)
         is_bluegene = expr.populate('target').architecture().is_bluegene()
         try:
             if is_bluegene:
@@ -234,15 +356,37 @@ class TrialController(Controller):
                 retval = self._perform_interactive(expr, trial, cmd, cwd, env)
         except Exception as err:
             try:
-                self.update({'phase': 'failed', 'environment': b64env}, trial.eid)
+                self.update({'phase': 'failed', 'environment': env_key}, trial.eid)
             except KeyError:
                 # Trial record was deleted
                 pass
             raise err
         else:
-            self.update({'phase': 'completed', 'environment': b64env}, trial.eid)
+            self.update({'phase': 'completed', 'environment': env_key}, trial.eid)
             return retval
 
+    def archive(self, trials, archive):
+        """Move trial records to another storage container.
+
+        The records are removed from their experiments but `on_delete` is not invoked,
+        so trial data remains in the experiment's directory.  The archive is written first
+        so that a failure leaves records duplicated rather than lost.
+
+        Args:
+            trials (list): Trials to move.
+            archive (AbstractStorage): Storage container to move the trial records to.
+        """
+        from taucmdr.model.experiment import Experiment
+        if not trials:
+            return
+        affected = {}
+        for trial in trials:
+            affected.setdefault(trial['experiment'], []).append(trial.eid)
+        with self._modifying() as database, archive:
+            archive.insert_many([dict(trial) for trial in trials], table_name=self.model.name)
+            self._disassociate_many(Experiment, affected, 'trials')
+            database.remove([trial.eid for trial in trials], table_name=self.model.name)
+
 
 class Trial(Model):
     """Trial data model."""
@@ -250,6 +394,8 @@ class Trial(Model):
     __attributes__ = attributes
 
     __controller__ = TrialController
+
+    composite_indexes = (('experiment', 'number'),)
     
     @classmethod
     def _separate_launcher_cmd(cls, cmd):
@@ -351,6 +497,23 @@ class Trial(Model):
         experiment = self.populate('experiment')
         return os.path.join(experiment.prefix, str(self['number']))
 
+    def environment(self):
+        """Get the shell environment in which the trial was performed.
+
+        The environment is decoded each time this method is called so callers that only
+        display the record don't pay to decode it.  Earlier versions stored the environment
+        in the trial record as a base64 string.
+
+        Returns:
+            dict: Environment variables, or None if the trial's environment was not recorded.
+        """
+        value = self.get('environment', None)
+        if not value:
+            return None
+        if BlobStore.is_key(value):
+            return _load_environment(_environment_blobs(self.storage), value)[0]
+        return ast.literal_eval(base64.b64decode(value))
+
     def on_create(self):
         try:
             util.mkdirp(self.prefix)
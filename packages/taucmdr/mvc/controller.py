@@ -27,11 +27,25 @@
 #
 """TODO: FIXME: Docs"""
 
+import json
+import atexit
+import weakref
+from contextlib import contextmanager
 from taucmdr import logger
 from taucmdr.error import InternalError, UniqueAttributeError, ModelError
 
 LOGGER = logger.get_logger(__name__)
 
+IDENTITY_MAP_STATISTICS = {'hits': 0, 'misses': 0}
+"""dict: Number of times a controller reused a cached model (hits) or constructed a new model (misses)."""
+
+
+def _log_identity_map_statistics():
+    if IDENTITY_MAP_STATISTICS['hits'] + IDENTITY_MAP_STATISTICS['misses']:
+        LOGGER.debug("Model identity map: %(hits)d hits, %(misses)d misses", IDENTITY_MAP_STATISTICS)
+
+atexit.register(_log_identity_map_statistics)
+
 # Suppress debugging messages in optimized code
 if __debug__:
     _heavy_debug = LOGGER.debug   # pylint: disable=invalid-name
@@ -41,6 +55,49 @@ else:
         pass
 
 
+class _IdentityMap(object):
+    """Shares one model instance per record among all controllers of a storage container.
+    
+    Sharing model instances lets data cached in a model, e.g. its populated associations, be reused
+    every time the record is retrieved.  Models are weakly referenced so they are discarded when no 
+    longer in use, and a cached model is only reused if its data still equals the retrieved record
+    less any deprecated attributes, which models ignore.  Controllers clear the map whenever they
+    modify records since any model's populated data may change.
+    Clearing the map also discards the populated data cached in models that are still in use.
+    """
+    
+    _maps = weakref.WeakKeyDictionary()
+    
+    def __init__(self):
+        self._models = weakref.WeakValueDictionary()
+
+    @classmethod
+    def get(cls, storage):
+        """Return the identity map of a storage container."""
+        try:
+            return cls._maps[storage]
+        except KeyError:
+            return cls._maps.setdefault(storage, cls())
+
+    def model(self, model_cls, record):
+        """Return the shared model of `record`, constructing it if necessary."""
+        key = (model_cls, record.eid)
+        model = self._models.get(key, None)
+        if model is not None and model == dict(item for item in record.iteritems() 
+                                               if item[0] in model_cls.attributes):
+            IDENTITY_MAP_STATISTICS['hits'] += 1
+            return model
+        IDENTITY_MAP_STATISTICS['misses'] += 1
+        model = model_cls(record)
+        self._models[key] = model
+        return model
+
+    def clear(self):
+        for model in self._models.values():
+            model._populated = None  # pylint: disable=protected-access
+        self._models.clear()
+
+
 class Controller(object):
     """The "C" in `MVC`_.
 
@@ -53,9 +110,12 @@ class Controller(object):
     
     messages = {}
     
+    _EXPORT_BATCH_SIZE = 1000
+    
     def __init__(self, model_cls, storage):
         self.model = model_cls
         self.storage = storage
+        storage.add_index(model_cls.name, model_cls.indexed_attributes)
         
     @classmethod
     def push_to_topic(cls, topic, message):
@@ -65,6 +125,18 @@ class Controller(object):
     def pop_topic(cls, topic):
         return cls.messages.pop(topic, [])
 
+    def _model(self, record):
+        return _IdentityMap.get(self.storage).model(self.model, record)
+
+    @contextmanager
+    def _modifying(self):
+        """Open a storage transaction that invalidates shared models on completion."""
+        with self.storage as database:
+            try:
+                yield database
+            finally:
+                _IdentityMap.get(self.storage).clear()
+
     def one(self, key):
         """Get a record.
         
@@ -75,7 +147,7 @@ class Controller(object):
             Model: The model for the matching record or None if no such record exists.
         """
         record = self.storage.get(key, table_name=self.model.name)
-        return self.model(record) if record else None
+        return self._model(record) if record else None
 
     def all(self):
         """Get all records.
@@ -83,7 +155,7 @@ class Controller(object):
         Returns:
             list: Models for all records or an empty lists if no records exist.
         """
-        return [self.model(record) for record in self.storage.search(table_name=self.model.name)]
+        return [self._model(record) for record in self.storage.search(table_name=self.model.name)]
     
     def count(self):
         """Return the number of records.
@@ -102,7 +174,7 @@ class Controller(object):
         Returns:
             list: Models for records with the given keys or an empty lists if no records have all keys.
         """
-        return [self.model(record) for record in self.storage.search(keys=keys, table_name=self.model.name)]
+        return [self._model(record) for record in self.storage.search(keys=keys, table_name=self.model.name)]
 
     def match(self, field, regex=None, test=None):
         """Return records that have a field matching a regular expression or test function.
@@ -115,7 +187,7 @@ class Controller(object):
         Returns:
             list: Models for records that have a matching field.
         """
-        return [self.model(record) 
+        return [self._model(record) 
                 for record in self.storage.match(field, table_name=self.model.name, regex=regex, test=test)]
 
     def exists(self, keys):
@@ -163,7 +235,58 @@ class Controller(object):
             _heavy_debug("Populating %s(%s)", model.name, model.eid)
             return {attr: self._populate_attribute(model, attr, defaults) for attr in model}
 
-    def _populate_attribute(self, model, attr, defaults):
+    def populate_many(self, models, attributes=None, depth=1, defaults=False):
+        """Merges associated data into many model records.
+        
+        Like :any:`populate`, but the foreign records of all `models` are gathered first and looked 
+        up with one :any:`AbstractStorage.get_many` call per foreign model instead of one lookup per
+        model and attribute.  If `attributes` is None and `defaults` is False then the result is 
+        cached in each model so later calls to :any:`Model.populate` don't access storage.
+        
+        Args:
+            models (list): Models to populate.
+            attributes (Optional[list]): If given, populate only these attributes.
+            depth (Optional[int]): Number of association levels to populate.  If greater than 1 then 
+                                   foreign records are also populated up to ``depth - 1`` levels deep.
+            defaults (Optional[bool]): If given, set undefined attributes to their default values.
+        
+        Returns:
+            list: A dictionary of controlled data merged with associated records for each model.
+            
+        Raises:
+            KeyError: An attribute in `attributes` is undefined in a record. 
+        """
+        _heavy_debug("Populating %d %s records", len(models), self.model.name)
+        eid_type = self.storage.Record.eid_type
+        wanted = {}
+        for model in models:
+            for attr in attributes or model:
+                props, value = self._attribute_value(model, attr, defaults)
+                foreign = props.get('model', props.get('collection', None))
+                if foreign is None:
+                    continue
+                elif isinstance(value, list):
+                    wanted.setdefault(foreign, set()).update(value)
+                elif isinstance(value, eid_type):
+                    wanted.setdefault(foreign, set()).add(value)
+        resolved = {}
+        for foreign, eids in wanted.iteritems():
+            eids = sorted(eids)
+            records = self.storage.get_many(eids, table_name=foreign.name)
+            ctrl = foreign.controller(self.storage)
+            found = resolved[foreign] = {eid: ctrl._model(record) for eid, record in zip(eids, records) if record}
+            if depth > 1:
+                ctrl.populate_many(found.values(), depth=depth-1)
+        populated = []
+        for model in models:
+            data = {attr: self._populate_attribute(model, attr, defaults, resolved) for attr in attributes or model}
+            if attributes is None and not defaults:
+                model._populated = data  # pylint: disable=protected-access
+            populated.append(data)
+        return populated
+
+    @staticmethod
+    def _attribute_value(model, attr, defaults):
         try:
             props = model.attributes[attr]
         except KeyError:
@@ -172,6 +295,10 @@ class Controller(object):
             value = model[attr]
         else:
             value = model.get(attr, props['default'])
+        return props, value
+
+    def _populate_attribute(self, model, attr, defaults, resolved=None):
+        props, value = self._attribute_value(model, attr, defaults)
         try:
             foreign = props['model']
         except KeyError:
@@ -180,15 +307,43 @@ class Controller(object):
             except KeyError:
                 return value
             else:
+                if resolved is not None and isinstance(value, list):
+                    found = resolved.get(foreign, {})
+                    return [found[eid] for eid in value if eid in found]
                 return foreign.controller(self.storage).search(value)
         else:
+            if resolved is not None and isinstance(value, self.storage.Record.eid_type):
+                return resolved.get(foreign, {}).get(value, None)
             return foreign.controller(self.storage).one(value)
 
     def _check_unique(self, data, match_any=True):
         unique = {attr: data[attr] for attr, props in self.model.attributes.iteritems() if 'unique' in props}
         if unique and self.storage.contains(unique, match_any=match_any, table_name=self.model.name):
             raise UniqueAttributeError(self.model, unique)
-    
+
+    def _check_unique_many(self, data_list):
+        seen = []
+        for data in data_list:
+            self._check_unique(data)
+            unique = {attr: data[attr] for attr, props in self.model.attributes.iteritems() if 'unique' in props}
+            if not unique:
+                continue
+            if unique in seen:
+                raise UniqueAttributeError(self.model, unique)
+            seen.append(unique)
+
+    @staticmethod
+    def _foreign_keys(value):
+        """Return the identifiers in a 'model' or 'collection' attribute's value as a set."""
+        if value is None:
+            return set()
+        try:
+            # 'collection' attribute is iterable
+            return set(value)
+        except TypeError:
+            # 'model' attribute is not iterable, so make a tuple
+            return set((value,))
+
     def create(self, data):
         """Atomically store a new record and update associations.
         
@@ -201,20 +356,40 @@ class Controller(object):
         Returns:
             Model: The newly created data. 
         """
-        data = self.model.validate(data)
-        self._check_unique(data)
-        with self.storage as database:
-            record = database.insert(data, table_name=self.model.name)
-            for attr, foreign in self.model.associations.iteritems():
-                if 'model' or 'collection' in self.model.attributes[attr]:
-                    affected = record.get(attr, None)
-                    if affected:
-                        foreign_cls, via = foreign
-                        self._associate(record, foreign_cls, affected, via)
-            model = self.model(record)
-            model.check_compatibility(model)
-            model.on_create()
-            return model
+        return self.create_many([data])[0]
+
+    def create_many(self, data_list):
+        """Atomically store new records and update associations.
+        
+        All records are inserted with one storage write and each associated foreign record is 
+        updated once no matter how many of the new records refer to it.
+        
+        Invokes the `on_create` callback of each new record **after** all data is recorded.  
+        If a callback raises an exception then the whole operation is reverted.
+        
+        Args:
+            data_list (list): Data to record, one dictionary per record.
+            
+        Returns:
+            list: The newly created data in the same order as `data_list`.
+        """
+        data_list = [self.model.validate(data) for data in data_list]
+        self._check_unique_many(data_list)
+        with self._modifying() as database:
+            records = database.insert_many(data_list, table_name=self.model.name)
+            links = {}
+            for record in records:
+                for attr, foreign in self.model.associations.iteritems():
+                    for key in self._foreign_keys(record.get(attr, None)):
+                        links.setdefault(foreign, {}).setdefault(key, []).append(record.eid)
+            for foreign, affected in links.iteritems():
+                foreign_cls, via = foreign
+                self._associate_many(foreign_cls, affected, via)
+            models = [self._model(record) for record in records]
+            for model in models:
+                model.check_compatibility(model)
+                model.on_create()
+            return models
     
     def update(self, data, keys):
         """Change recorded data and update associations.
@@ -232,42 +407,56 @@ class Controller(object):
             data (dict): New data for existing records.
             keys: Fields or element identifiers to match.
         """
-        for attr in data:
-            if attr not in self.model.attributes:
-                raise ModelError(self.model, "no attribute named '%s'" % attr)
-        with self.storage as database:
+        self.update_many([(data, keys)])
+
+    def update_many(self, updates):
+        """Change recorded data and update associations.
+        
+        All updates are applied with one storage write and each associated foreign record is 
+        updated once no matter how many of the changed records refer to it.  Keys are matched 
+        against the records as they were before any update was applied.
+            
+        Invokes the `on_update` callback of each changed record **after** all data is modified.  
+        If a callback raises an exception then the whole operation is reverted.
+
+        Args:
+            updates (list): ``(data, keys)`` tuples, see :any:`update`.
+        """
+        for data, keys in updates:
+            if not keys:
+                raise ValueError(keys)
+            for attr in data:
+                if attr not in self.model.attributes:
+                    raise ModelError(self.model, "no attribute named '%s'" % attr)
+        with self._modifying() as database:
             # Get the list of affected records **before** updating the data so foreign keys are correct
-            old_records = self.search(keys)
-            database.update(data, keys, table_name=self.model.name)
+            matched = [(data, self.search(keys)) for data, keys in updates]
+            database.update_many([(data, [model.eid for model in old_records]) for data, old_records in matched], 
+                                 table_name=self.model.name)
             changes = {}
-            for model in old_records:
-                changes[model.eid] = {attr: (model.get(attr), new_value) for attr, new_value in data.iteritems()
-                                      if not (attr in model and model.get(attr) == new_value)}
-                for attr, foreign in self.model.associations.iteritems():
-                    try:
-                        # 'collection' attribute is iterable
-                        new_foreign_keys = set(data[attr])
-                    except TypeError:
-                        # 'model' attribute is not iterable, so make a tuple
-                        new_foreign_keys = set((data[attr],))
-                    except KeyError:
-                        continue
-                    try:
-                        # 'collection' attribute is iterable
-                        old_foreign_keys = set(model[attr])
-                    except TypeError:
-                        # 'model' attribute is not iterable, so make a tuple
-                        old_foreign_keys = set((model[attr],))
-                    except KeyError:
-                        old_foreign_keys = set()
-                    foreign_cls, via = foreign
-                    added = list(new_foreign_keys - old_foreign_keys)
-                    deled = list(old_foreign_keys - new_foreign_keys)
-                    if added:
-                        self._associate(model, foreign_cls, added, via)
-                    if deled:
-                        self._disassociate(model, foreign_cls, deled, via)
-            updated_records = self.search(keys)
+            added = {}
+            deled = {}
+            for data, old_records in matched:
+                for model in old_records:
+                    changes.setdefault(model.eid, {}).update({attr: (model.get(attr), new_value) 
+                                                              for attr, new_value in data.iteritems()
+                                                              if not (attr in model and model.get(attr) == new_value)})
+                    for attr, foreign in self.model.associations.iteritems():
+                        if attr not in data:
+                            continue
+                        new_foreign_keys = self._foreign_keys(data[attr])
+                        old_foreign_keys = self._foreign_keys(model.get(attr, None))
+                        for key in new_foreign_keys - old_foreign_keys:
+                            added.setdefault(foreign, {}).setdefault(key, []).append(model.eid)
+                        for key in old_foreign_keys - new_foreign_keys:
+                            deled.setdefault(foreign, {}).setdefault(key, []).append(model.eid)
+            for foreign, affected in added.iteritems():
+                foreign_cls, via = foreign
+                self._associate_many(foreign_cls, affected, via)
+            for foreign, affected in deled.iteritems():
+                foreign_cls, via = foreign
+                self._disassociate_many(foreign_cls, affected, via)
+            updated_records = self.search(sorted(changes))
             for model in updated_records:
                 model.check_compatibility(model)
                 model.on_update(changes[model.eid])
@@ -291,19 +480,21 @@ class Controller(object):
         for attr in fields:
             if attr not in self.model.attributes:
                 raise ModelError(self.model, "no attribute named '%s'" % attr)
-        with self.storage as database:
+        with self._modifying() as database:
             # Get the list of affected records **before** updating the data so foreign keys are correct
             old_records = self.search(keys)
             database.unset(fields, keys, table_name=self.model.name)
             changes = {}
+            links = {}
             for model in old_records:
                 changes[model.eid] = {attr: (model.get(attr), None) for attr in fields if attr in model}
                 for attr, foreign in self.model.associations.iteritems():
                     if attr in fields:
-                        foreign_cls, via = foreign
-                        old_foreign_keys = model.get(attr, None)
-                        if old_foreign_keys:
-                            self._disassociate(model, foreign_cls, old_foreign_keys, via)
+                        for key in self._foreign_keys(model.get(attr, None)):
+                            links.setdefault(foreign, {}).setdefault(key, []).append(model.eid)
+            for foreign, affected in links.iteritems():
+                foreign_cls, via = foreign
+                self._disassociate_many(foreign_cls, affected, via)
             updated_records = self.search(keys)
             for model in updated_records:
                 model.check_compatibility(model)
@@ -325,55 +516,183 @@ class Controller(object):
             keys (dict): Attributes to match.
             keys: Fields or element identifiers to match.
         """
-        with self.storage as database:
-            removed_data = []
-            changing = self.search(keys)
-            for model in changing:
+        self.delete_many([keys])
+
+    def delete_many(self, keys_list):
+        """Delete recorded data and update associations.
+        
+        Each associated foreign record is updated once no matter how many of the deleted 
+        records refer to it and each referencing table is searched once for all deleted records.
+
+        Invokes the `on_delete` callback of each deleted record **after** all data is deleted.  
+        If a callback raises an exception then the whole operation is reverted.
+
+        Args:
+            keys_list (list): Fields or element identifiers to match, see :any:`delete`.
+        """
+        for keys in keys_list:
+            if not keys:
+                raise ValueError(keys)
+        with self._modifying() as database:
+            changing = {}
+            for keys in keys_list:
+                for model in self.search(keys):
+                    changing.setdefault(model.eid, model)
+            if not changing:
+                return
+            links = {}
+            for model in changing.itervalues():
                 for attr, foreign in model.associations.iteritems():
-                    foreign_model, via = foreign
-                    affected_keys = model.get(attr, None)
-                    if affected_keys:
-                        _heavy_debug("Deleting %s(%s) affects '%s' in %s(%s)", 
-                                     self.model.name, model.eid, via, foreign_model.name, affected_keys)
-                        self._disassociate(model, foreign_model, affected_keys, via)
-                for foreign_model, via in model.references:
-                    # pylint complains because `model` is changing on every iteration so we'll have
-                    # a different lambda function `test` on each iteration.  This is exactly what
-                    # we want so we disble the warning. 
-                    # pylint: disable=cell-var-from-loop, undefined-loop-variable
-                    test = lambda x: model.eid in x if isinstance(x, list) else model.eid == x
-                    affected = database.match(via, test=test, table_name=foreign_model.name)
-                    affected_keys = [record.eid for record in affected]
-                    if affected_keys:
-                        _heavy_debug("Deleting %s(%s) affects '%s' in %s(%s)", 
-                                     self.model.name, model.eid, via, foreign_model.name, affected_keys)
-                        self._disassociate(model, foreign_model, affected_keys, via)
-                removed_data.append(dict(model))
-            database.remove(keys, table_name=self.model.name)
-            for model in changing:
+                    for key in self._foreign_keys(model.get(attr, None)):
+                        links.setdefault(foreign, {}).setdefault(key, []).append(model.eid)
+            deleted = set(changing)
+            for foreign in self.model.references:
+                foreign_model, via = foreign
+                database.add_reference_index(foreign_model.name, [via])
+                for record in database.search_references(via, deleted, table_name=foreign_model.name):
+                    for eid in deleted.intersection(self._foreign_keys(record[via])):
+                        links.setdefault(foreign, {}).setdefault(record.eid, []).append(eid)
+            for foreign, affected in links.iteritems():
+                foreign_model, via = foreign
+                _heavy_debug("Deleting %s(%s) affects '%s' in %s(%s)", 
+                             self.model.name, sorted(deleted), via, foreign_model.name, sorted(affected))
+                self._disassociate_many(foreign_model, affected, via)
+            # Disassociation may have deleted some records if associations are cyclic
+            remaining = [eid for eid in sorted(deleted) if database.contains(eid, table_name=self.model.name)]
+            if remaining:
+                database.remove(remaining, table_name=self.model.name)
+            for model in changing.itervalues():
                 model.on_delete()
 
-    @staticmethod
-    def import_records(data):
-        """Import data records.
+    def _foreign_attributes(self, model):
+        """Return (attribute, foreign model, is collection) tuples for each 'model' or 'collection' attribute."""
+        foreign = []
+        for attr, props in model.attributes.iteritems():
+            if 'model' in props:
+                foreign.append((attr, props['model'], False))
+            elif 'collection' in props:
+                foreign.append((attr, props['collection'], True))
+        return foreign
+
+    def _reachable_models(self):
+        """Return a dictionary mapping table names to all models reachable from this controller's model."""
+        models = {}
+        pending = [self.model]
+        while pending:
+            model = pending.pop()
+            if model.name not in models:
+                models[model.name] = model
+                pending.extend(foreign for _, foreign, _ in self._foreign_attributes(model))
+        return models
+
+    def import_records(self, stream):
+        """Import data records exported by :any:`export_records`.
         
-        TODO: Docs
+        Records are read from `stream` one line at a time and inserted in batches.  Imported records
+        are given new identifiers and their 'model' and 'collection' attributes are updated to the 
+        new identifiers of the records they refer to.  References to records that were not exported
+        are dropped from 'collection' attributes and optional 'model' attributes are unset.  Required 
+        'model' attributes must refer to an exported record.  The `on_create` callbacks are **not** 
+        invoked.  The import is atomic: if any record cannot be imported then no records are imported.
+
+        Args:
+            stream (file): File-like object to read newline-delimited JSON from.
+            
+        Returns:
+            dict: Dictionary mapping table names to dictionaries mapping exported record identifiers 
+                  to imported record identifiers.
+            
+        Raises:
+            ModelError: The data is not a valid export, refers to an unknown table, or a required 'model'
+                        attribute refers to a record that was not exported.
+            UniqueAttributeError: An imported record would conflict with an existing record.
         """
-        
-    @classmethod
-    def export_records(cls, keys=None, eids=None):
+        models = self._reachable_models()
+        eid_map = {}
+        with self._modifying() as database:
+            def flush(model, batch):
+                if batch:
+                    model.controller(database)._check_unique_many([data for _, data in batch])
+                    records = database.insert_many([data for _, data in batch], table_name=model.name)
+                    table_map = eid_map.setdefault(model.name, {})
+                    for (eid, _), record in zip(batch, records):
+                        table_map[eid] = record.eid
+                    del batch[:]
+            model, batch = None, []
+            for lineno, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    if 'table' in item:
+                        flush(model, batch)
+                        model = models[item['table']]
+                    else:
+                        batch.append((int(item['eid']), item['data']))
+                except (ValueError, TypeError) as err:
+                    raise ModelError(self.model, "Invalid export data at line %d: %s" % (lineno, err))
+                except KeyError as err:
+                    raise ModelError(self.model, "Invalid export data at line %d: unknown %s" % (lineno, err))
+                if len(batch) >= self._EXPORT_BATCH_SIZE:
+                    flush(model, batch)
+            flush(model, batch)
+            # Now that all records have new identifiers we can fix up their associations
+            for table_name, table_map in eid_map.iteritems():
+                model = models[table_name]
+                foreign_attrs = self._foreign_attributes(model)
+                if not foreign_attrs:
+                    continue
+                exported_eids = {new_eid: eid for eid, new_eid in table_map.iteritems()}
+                new_eids = sorted(table_map.itervalues())
+                for i in xrange(0, len(new_eids), self._EXPORT_BATCH_SIZE):
+                    keys = new_eids[i:i+self._EXPORT_BATCH_SIZE]
+                    updates = []
+                    unresolved = []
+                    for key, record in zip(keys, database.get_many(keys, table_name=table_name)):
+                        changes = {}
+                        dropped = []
+                        for attr, foreign, is_collection in foreign_attrs:
+                            value = record.get(attr, None)
+                            if value is None:
+                                continue
+                            foreign_map = eid_map.get(foreign.name, {})
+                            if is_collection:
+                                changes[attr] = [foreign_map[eid] for eid in value if eid in foreign_map]
+                            elif value in foreign_map:
+                                changes[attr] = foreign_map[value]
+                            elif model.attributes[attr].get('required', False):
+                                raise ModelError(model, "Exported record %s refers to %s record %s in required "
+                                                 "attribute '%s' but that record was not exported" % 
+                                                 (exported_eids[key], foreign.name, value, attr))
+                            else:
+                                dropped.append(attr)
+                        if changes:
+                            updates.append((changes, key))
+                        if dropped:
+                            unresolved.append((dropped, key))
+                    database.update_many(updates, table_name=table_name)
+                    for fields, key in unresolved:
+                        database.unset(fields, key, table_name=table_name)
+        return eid_map
+
+    def export_records(self, stream, keys=None, eids=None):
         """Export data records.
         
-        Constructs a dictionary containing records matching `keys` or `eids` and all their
-        associated records.  Association fields (`model` and `collection`) are **not** updated
-        and may contain eids of undefined records. 
+        Writes records matching `keys` or `eids` and all their associated records to `stream` as 
+        newline-delimited JSON.  Each group of records is preceded by a header line naming the 
+        table the records belong to, and each record line holds the record's identifier and data.  
+        Associations are followed breadth-first and records are written as they are retrieved, 
+        so the exported records are never all held in memory.  Records of this controller's model 
+        are only exported if they match `keys` or `eids`.  Association fields (`model` and 
+        `collection`) are **not** updated and may contain eids of records that were not exported.
 
         Args:
+            stream (file): File-like object to write newline-delimited JSON to.
             keys (dict): Attributes to match.
             eids (list): Record identifiers to match.
 
         Returns:
-            dict: Dictionary of tables containing records.
+            int: The number of exported records.
             
         Example:
         ::
@@ -386,81 +705,104 @@ class Controller(object):
                       14: {'origin': 100, 'color': 'pale', 'ibu': 30}}
             }
         
-            Beer.export_records(eids=[10])
+            Beer.controller(storage).export_records(stream, eids=[10])
             
-            {
-             'Brewery': {100: {'address': '4615 Hollins Ferry Rd, Halethorpe, MD 21227',
-                               'brews': [10, 12, 14]}},
-             'Beer': {10: {'origin': 100, 'color': 'gold', 'ibu': 45}}
-            }
-
+            {"table": "Beer"}
+            {"eid": 10, "data": {"origin": 100, "color": "gold", "ibu": 45}}
+            {"table": "Brewery"}
+            {"eid": 100, "data": {"address": "4615 Hollins Ferry Rd, Halethorpe, MD 21227",
+                                  "brews": [10, 12, 14]}}
         """
-        def export_record(record, root):
-            if isinstance(record, cls) and record is not root:
-                return
-            data = all_data.setdefault(record.model_name, {})
-            if record.eid not in data:
-                data[record.eid] = record.data
-                for attr, foreign in record.associations.iteritems():
-                    for foreign_record in foreign[0].search(eids=record[attr]):
-                        export_record(foreign_record, root)
-        all_data = {}
-        for record in cls.search(keys, eids):
-            export_record(record, record)
-        return all_data
-          
-    def _associate(self, record, foreign_model, affected, via):
-        """Associates a record with another record.
+        if eids is not None:
+            roots = sorted(record.eid for record in self.storage.get_many(eids, table_name=self.model.name) 
+                           if record)
+        else:
+            roots = sorted(record.eid for record in self.storage.search(keys=keys, table_name=self.model.name))
+        exported = {self.model.name: set(roots)}
+        pending = [(self.model, roots)]
+        count = 0
+        while pending:
+            model, model_eids = pending.pop(0)
+            foreign_attrs = self._foreign_attributes(model)
+            stream.write(json.dumps({'table': model.name}) + '\n')
+            for i in xrange(0, len(model_eids), self._EXPORT_BATCH_SIZE):
+                foreign_eids = {}
+                batch_eids = model_eids[i:i+self._EXPORT_BATCH_SIZE]
+                for record in self.storage.get_many(batch_eids, table_name=model.name):
+                    if not record:
+                        continue
+                    stream.write(json.dumps({'eid': record.eid, 'data': record}) + '\n')
+                    count += 1
+                    for attr, foreign, _ in foreign_attrs:
+                        foreign_eids.setdefault(foreign, set()).update(self._foreign_keys(record.get(attr, None)))
+                for foreign, new_eids in foreign_eids.iteritems():
+                    if foreign is self.model:
+                        continue
+                    new_eids -= exported.setdefault(foreign.name, set())
+                    if new_eids:
+                        exported[foreign.name].update(new_eids)
+                        pending.append((foreign, sorted(new_eids)))
+        return count
+
+    def _associate_many(self, foreign_model, affected, via):
+        """Associates records with other records.
         
         Args:
-            record (Record): Record to associate.
             foreign_model (Model): Foreign record's data model.
-            affected (list): Identifiers for the records that will be updated to associate with `record`.
+            affected (dict): Maps identifiers of the records that will be updated to lists of identifiers 
+                             of the records they will be associated with.
             via (str): The name of the associated foreign attribute.
         """ 
-        _heavy_debug("Adding %s to '%s' in %s(eids=%s)", record.eid, via, foreign_model.name, affected)
-        if not isinstance(affected, list):
-            affected = [affected]
-        with self.storage as database:
-            for key in affected:
-                foreign_record = database.get(key, table_name=foreign_model.name)
+        _heavy_debug("Adding %s to '%s' in %s", affected, via, foreign_model.name)
+        foreign_props = foreign_model.attributes[via]
+        keys = sorted(affected)
+        with self._modifying() as database:
+            updates = []
+            for key, foreign_record in zip(keys, database.get_many(keys, table_name=foreign_model.name)):
                 if not foreign_record:
                     raise ModelError(foreign_model, "No record with ID '%s'" % key)
-                if 'model' in foreign_model.attributes[via]:
-                    updated = record.eid
-                elif 'collection' in foreign_model.attributes[via]:
-                    updated = list(set(foreign_record[via] + [record.eid]))
+                if 'model' in foreign_props:
+                    updated = affected[key][-1]
+                elif 'collection' in foreign_props:
+                    updated = list(set(foreign_record[via] + affected[key]))
                 else:
                     raise InternalError("%s.%s has neither 'model' nor 'collection'" % (foreign_model.name, via))
-                foreign_model.controller(database).update({via: updated}, key)
+                updates.append(({via: updated}, key))
+            foreign_model.controller(database).update_many(updates)
 
-    def _disassociate(self, record, foreign_model, affected, via):
-        """Disassociates a record from another record.
+    def _disassociate_many(self, foreign_model, affected, via):
+        """Disassociates records from other records.
         
         Args:
-            record (Record): Record to disassociate.
             foreign_model (Model): Foreign record's data model.
-            affected (list): Identifiers for the records that will be updated to disassociate from `record`.
+            affected (dict): Maps identifiers of the records that will be updated to lists of identifiers 
+                             of the records they will be disassociated from.
             via (str): The name of the associated foreign attribute.
         """ 
-        _heavy_debug("Removing %s from '%s' in %s(eids=%s)", record.eid, via, foreign_model.name, affected)
-        if not isinstance(affected, list):
-            affected = [affected]
+        _heavy_debug("Removing %s from '%s' in %s", affected, via, foreign_model.name)
         foreign_props = foreign_model.attributes[via]
+        keys = sorted(affected)
         if 'model' in foreign_props:
             if 'required' in foreign_props:
-                _heavy_debug("Empty required attr '%s': deleting %s(keys=%s)", via, foreign_model.name, affected)
-                foreign_model.controller(self.storage).delete(affected)
+                _heavy_debug("Empty required attr '%s': deleting %s(keys=%s)", via, foreign_model.name, keys)
+                foreign_model.controller(self.storage).delete(keys)
             else:
-                with self.storage as database:
-                    database.unset([via], affected, table_name=foreign_model.name)
+                with self._modifying() as database:
+                    database.unset([via], keys, table_name=foreign_model.name)
         elif 'collection' in foreign_props:
-            with self.storage as database:
-                for key in affected:
-                    foreign_record = database.get(key, table_name=foreign_model.name)
-                    updated = list(set(foreign_record[via]) - set([record.eid]))
+            with self._modifying() as database:
+                updates = []
+                empty = []
+                for key, foreign_record in zip(keys, database.get_many(keys, table_name=foreign_model.name)):
+                    if foreign_record is None:
+                        # Already deleted by an earlier cascade in this operation
+                        continue
+                    updated = list(set(foreign_record[via]) - set(affected[key]))
                     if 'required' in foreign_props and len(updated) == 0:
                         _heavy_debug("Empty required attr '%s': deleting %s(key=%s)", via, foreign_model.name, key)
-                        foreign_model.controller(database).delete(key)
+                        empty.append(key)
                     else:
-                        database.update({via: updated}, key, table_name=foreign_model.name)
+                        updates.append(({via: updated}, key))
+                database.update_many(updates, table_name=foreign_model.name)
+                if empty:
+                    foreign_model.controller(database).delete(empty)
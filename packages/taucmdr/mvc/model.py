@@ -27,13 +27,35 @@
 #
 """TODO: FIXME: Docs"""
 
-from taucmdr import logger
-from taucmdr.error import IncompatibleRecordError, ModelError, InternalError
-from taucmdr.cf.storage import StorageRecord
+import json
+import hashlib
+from taucmdr import logger, TAUCMDR_VERSION
+from taucmdr.error import ConfigurationError, IncompatibleRecordError, ModelError, InternalError
+from taucmdr.cf.storage import StorageRecord, StorageError
 from taucmdr.mvc.controller import Controller
 
 LOGGER = logger.get_logger(__name__)
 
+COMPATIBILITY_MEMO_KEY = '_compatible'
+"""str: Key of the compatibility memo in the key/value store of a model's storage container."""
+
+COMPATIBILITY_MEMO_SIZE = 256
+"""int: Maximum number of compatibility verdicts remembered by a storage container."""
+
+_COMPATIBLE = {}
+"""dict: Recommendations made when record pairs were found compatible, indexed by content digest, 
+see :any:`Model.check_compatibility`."""
+
+_RECOMMENDATIONS = []
+"""list: Lists of recommendations made by the compatibility checks in progress."""
+
+
+def _recommend(message, *args):
+    """Emit a compatibility recommendation and remember it in the compatibility check in progress."""
+    LOGGER.warning(message, *args)
+    if _RECOMMENDATIONS:
+        _RECOMMENDATIONS[-1].append(message % args)
+
 
 class ModelMeta(type):
     """Constructs model attributes, configures defaults, and establishes relationships.""" 
@@ -41,7 +63,7 @@ class ModelMeta(type):
     def __new__(mcs, name, bases, dct):
         if dct['__module__'] != __name__:
             # Each Model subclass has its own relationships
-            dct.update({'associations': dict(), 'references': set()})
+            dct.update({'associations': dict(), 'references': set(), '_compat_dispatch': dict()})
             # The default model name is the class name
             if dct.get('name', None) is None:
                 dct['name'] = name
@@ -57,6 +79,7 @@ class ModelMeta(type):
             # Replace key_attribute with a callable property (defined below). This is to set
             # the key_attribute member after the model attributes have been constructed.
             dct['key_attribute'] = ModelMeta.key_attribute
+            dct['indexed_attributes'] = ModelMeta.indexed_attributes
         return type.__new__(mcs, name, bases, dct)
 
     @property
@@ -83,6 +106,18 @@ class ModelMeta(type):
                 raise ModelError(cls, "No attribute has the 'primary_key' property set to 'True'")
             return cls._key_attribute
 
+    @property
+    def indexed_attributes(cls):
+        # pylint: disable=attribute-defined-outside-init
+        try:
+            return cls._indexed_attributes
+        except AttributeError:
+            cls._indexed_attributes = frozenset([attr for attr, props in cls.attributes.iteritems()
+                                                 if any(props.get(prop, False)
+                                                        for prop in ('primary_key', 'unique', 'indexed'))] +
+                                                list(cls.composite_indexes))
+            return cls._indexed_attributes
+
 
 
 class Model(StorageRecord):
@@ -94,6 +129,10 @@ class Model(StorageRecord):
         references (set): (Controller, str) tuples listing foreign models referencing this model.  
         attributes (dict): Model attributes.
         key_attribute (str): Name of an attribute that serves as a unique identifier. 
+        indexed_attributes (frozenset): Names of attributes the storage container should index for
+                                        fast lookups, i.e. attributes with the 'primary_key', 'unique',
+                                        or 'indexed' property set to True, and :any:`composite_indexes`.
+        composite_indexes (tuple): Tuples of attribute names that are frequently matched together.
         
     .. _MVC: https://en.wikipedia.org/wiki/Model-view-controller
     """
@@ -107,6 +146,8 @@ class Model(StorageRecord):
     references = set()
     attributes = {}
     key_attribute = None
+    indexed_attributes = frozenset()
+    composite_indexes = ()
     
     def __init__(self, record):
         deprecated = [attr for attr in record if attr not in self.attributes]
@@ -195,6 +236,8 @@ class Model(StorageRecord):
                 raise ModelError(cls, "%s: defines 'via' property but not 'model' or 'collection'" % model_attr_name)
             if not isinstance(props.get('unique', False), bool):
                 raise ModelError(cls, "%s: invalid value for 'unique'" % model_attr_name)
+            if not isinstance(props.get('indexed', False), bool):
+                raise ModelError(cls, "%s: invalid value for 'indexed'" % model_attr_name)
             if not isinstance(props.get('description', ''), basestring):
                 raise ModelError(cls, "%s: invalid value for 'description'" % model_attr_name)
             if props.get('primary_key', False):
@@ -361,6 +404,8 @@ class Model(StorageRecord):
                                     attr_ne(lhs, lhs_attr, lhs_value, rhs, rhs_attr, checked_value)
                             elif attr_defined:
                                 attr_defined(lhs, lhs_attr, lhs_value, rhs, rhs_attr)
+        # Conditions only check records of this model so check_compatibility can skip them for other models
+        condition.model = cls
         return condition
 
     @classmethod
@@ -431,14 +476,14 @@ class Model(StorageRecord):
         def attr_undefined(lhs, lhs_attr, lhs_value, rhs, rhs_attr):
             lhs_name = lhs.name.lower()
             rhs_name = rhs.name.lower()
-            LOGGER.warning("%s = %s in %s recommends %s be defined in %s but it is undefined",
-                           lhs_attr, lhs_value, lhs_name, rhs_attr, rhs_name)
+            _recommend("%s = %s in %s recommends %s be defined in %s but it is undefined",
+                       lhs_attr, lhs_value, lhs_name, rhs_attr, rhs_name)
         def attr_ne(lhs, lhs_attr, lhs_value, rhs, rhs_attr, checked_value):
             lhs_name = lhs.name.lower()
             rhs_name = rhs.name.lower()
             rhs_value = rhs[rhs_attr]
-            LOGGER.warning("%s = %s in %s recommends %s = %s in %s but it is %s",
-                           lhs_attr, lhs_value, lhs_name, rhs_attr, checked_value, rhs_name, rhs_value)
+            _recommend("%s = %s in %s recommends %s = %s in %s but it is %s",
+                       lhs_attr, lhs_value, lhs_name, rhs_attr, checked_value, rhs_name, rhs_value)
         return cls.construct_condition(args, attr_undefined=attr_undefined, attr_ne=attr_ne)
 
     @classmethod
@@ -470,13 +515,13 @@ class Model(StorageRecord):
         def attr_defined(lhs, lhs_attr, lhs_value, rhs, rhs_attr):
             lhs_name = lhs.name.lower()
             rhs_name = rhs.name.lower()
-            LOGGER.warning("%s = %s in %s recommends %s be undefined in %s",
-                           lhs_attr, lhs_value, lhs_name, rhs_attr, rhs_name)
+            _recommend("%s = %s in %s recommends %s be undefined in %s",
+                       lhs_attr, lhs_value, lhs_name, rhs_attr, rhs_name)
         def attr_eq(lhs, lhs_attr, lhs_value, rhs, rhs_attr, checked_value):
             lhs_name = lhs.name.lower()
             rhs_name = rhs.name.lower()
-            LOGGER.warning("%s = %s in %s recommends against %s = %s in %s",
-                           lhs_attr, lhs_value, lhs_name, rhs_attr, checked_value, rhs_name)
+            _recommend("%s = %s in %s recommends against %s = %s in %s",
+                       lhs_attr, lhs_value, lhs_name, rhs_attr, checked_value, rhs_name)
         return cls.construct_condition(args, attr_defined=attr_defined, attr_eq=attr_eq)
 
     @classmethod
@@ -580,22 +625,127 @@ class Model(StorageRecord):
                 
             If ``bob['hungry'] == False`` or if the 'hungry' attribute were not set then all 
             the above expressions do nothing.
+
+        Pairs of records found to be compatible are remembered in the key/value store of this record's
+        storage container, keyed by a digest of both records, the records they refer to, and the 
+        TAU Commander version, so the check is skipped until one of them changes.  Recommendations made by the check are remembered 
+        with the verdict and repeated when the check is skipped.
         """
-        as_tuple = lambda x: x if isinstance(x, tuple) else (x,)
-        for attr, props in self.attributes.iteritems():
-            try:
-                compat = props['compat']
-            except KeyError:
-                continue
+        dispatch = self._compat_conditions(type(rhs))
+        if not dispatch:
+            return
+        lhs_key, rhs_key = self._content_key(), rhs._content_key()  # pylint: disable=protected-access
+        # Other versions may have other compatibility rules
+        key = hashlib.sha1(TAUCMDR_VERSION + lhs_key + rhs_key).hexdigest() if lhs_key and rhs_key else None
+        recommendations = self._remembered_compatibility(key)
+        if recommendations is not None:
+            for message in recommendations:
+                LOGGER.warning(message)
+            return
+        _RECOMMENDATIONS.append([])
+        try:
+            self._check_conditions(dispatch, rhs)
+        finally:
+            recommendations = _RECOMMENDATIONS.pop()
+        if key:
+            self._remember_compatibility(key, recommendations)
+
+    def _check_conditions(self, dispatch, rhs):
+        for attr, (literals, predicates) in dispatch.iteritems():
             try:
                 attr_value = self[attr]
             except KeyError:
                 continue
-            for value, conditions in compat.iteritems():
-                if (callable(value) and value(attr_value)) or attr_value == value: 
-                    for condition in as_tuple(conditions):
+            try:
+                conditions = literals.get(attr_value, ())
+            except TypeError:
+                # Unhashable attribute value
+                conditions = sum((conds for value, conds in literals.iteritems() if attr_value == value), ())
+            for condition in conditions:
+                condition(self, attr, attr_value, rhs)
+            for value, conds in predicates:
+                if value(attr_value) or attr_value == value:
+                    for condition in conds:
                         condition(self, attr, attr_value, rhs)
 
+    def _remembered_compatibility(self, key):
+        """Return the recommendations made when a record pair was found compatible, or None."""
+        if key is None:
+            return None
+        try:
+            return _COMPATIBLE[key]
+        except KeyError:
+            pass
+        try:
+            memo = dict(self.storage[COMPATIBILITY_MEMO_KEY])
+        except (KeyError, TypeError, ValueError, StorageError):
+            return None
+        recommendations = _COMPATIBLE[key] = memo.get(key, None)
+        if recommendations is None:
+            del _COMPATIBLE[key]
+        return recommendations
+
+    def _remember_compatibility(self, key, recommendations):
+        _COMPATIBLE[key] = recommendations
+        try:
+            memo = list(self.storage[COMPATIBILITY_MEMO_KEY])
+        except (KeyError, TypeError, ValueError, StorageError):
+            memo = []
+        memo = [item for item in memo if item[0] != key][-(COMPATIBILITY_MEMO_SIZE - 1):] + [[key, recommendations]]
+        try:
+            self.storage[COMPATIBILITY_MEMO_KEY] = memo
+        except (ConfigurationError, StorageError) as err:
+            LOGGER.debug("Failed to remember %s compatibility in %s storage: %s", self.name, self.storage.name, err)
+
+    @classmethod
+    def _compat_conditions(cls, rhs_cls):
+        """Compile the 'compat' properties of this model's attributes for checks against `rhs_cls` records.
+        
+        The compiled dispatch table maps attribute names to a dictionary of conditions keyed by literal 
+        attribute value and a list of (callable, conditions) tuples.  Conditions constructed by
+        :any:`construct_condition` for models other than `rhs_cls` are omitted.
+        
+        Returns:
+            dict: The dispatch table, empty if no attribute has conditions that apply to `rhs_cls` records.
+        """
+        try:
+            return cls._compat_dispatch[rhs_cls]
+        except KeyError:
+            pass
+        applies = lambda cond: not isinstance(getattr(cond, 'model', None), type) or issubclass(rhs_cls, cond.model)
+        dispatch = {}
+        for attr, props in cls.attributes.iteritems():
+            literals = {}
+            predicates = []
+            for value, conditions in props.get('compat', {}).iteritems():
+                conditions = tuple(cond for cond in (conditions if isinstance(conditions, tuple) else (conditions,))
+                                   if applies(cond))
+                if not conditions:
+                    continue
+                if callable(value):
+                    predicates.append((value, conditions))
+                else:
+                    literals[value] = conditions
+            if literals or predicates:
+                dispatch[attr] = (literals, predicates)
+        cls._compat_dispatch[rhs_cls] = dispatch
+        return dispatch
+
+    def _content_key(self):
+        """Return a digest of this record and the records its 'model' attributes refer to.
+        
+        Returns:
+            str: The digest, or None if the content can't be serialized.
+        """
+        content = dict(self)
+        for attr, props in self.attributes.iteritems():
+            if 'model' in props and attr in self:
+                content[attr] = self.populate(attr)
+        try:
+            return hashlib.sha1(json.dumps([self.name, self.eid, content], sort_keys=True)).hexdigest()
+        except (TypeError, ValueError):
+            return None
+
     @classmethod
     def filter_arguments(cls, args):
         from taucmdr.cli.arguments import ArgumentsNamespace
@@ -30,10 +30,136 @@
 Functions used for unit tests of controller.py.
 """
 
-
+import os
+import json
+import StringIO
 from taucmdr import tests
-#from taucmdr.mvc import controller
+from taucmdr.mvc import controller
+from taucmdr.model.compiler import Compiler
+from taucmdr.model.measurement import Measurement
+from taucmdr.model.project import Project
+from taucmdr.model.target import Target
+from taucmdr.cf.compiler.host import CC, CXX, FC
+from taucmdr.error import ModelError
+from taucmdr.cf.storage.local_file import LocalFileStorage
 
 class ControllerTest(tests.TestCase):
     def test_controller(self):
         self.assertEqual(1, 1) 
+
+    def test_identity_map(self):
+        storage = LocalFileStorage('test', os.path.join(tests.get_test_workdir(), self.id()))
+        ctrl = Compiler.controller(storage)
+        eid = storage.insert({'uid': '1', 'path': '/usr/bin/gcc', 'family': 'GNU', 'role': 'Host_CC'}, 
+                             table_name=Compiler.name).eid
+        stats = controller.IDENTITY_MAP_STATISTICS
+        hits = stats['hits']
+        comp = ctrl.one(eid)
+        self.assertIs(ctrl.search({'family': 'GNU'})[0], comp)
+        self.assertEqual(stats['hits'], hits + 1)
+        ctrl.update({'family': 'Intel'}, eid)
+        updated = ctrl.one(eid)
+        self.assertIsNot(updated, comp)
+        self.assertEqual(updated['family'], 'Intel')
+        self.assertEqual(comp['family'], 'GNU')
+        storage.disconnect_database()
+
+    def test_identity_map_deprecated(self):
+        storage = LocalFileStorage('test', os.path.join(tests.get_test_workdir(), self.id()))
+        ctrl = Compiler.controller(storage)
+        eid = storage.insert({'uid': '1', 'path': '/usr/bin/gcc', 'family': 'GNU', 'role': 'Host_CC',
+                              'obsolete': True}, table_name=Compiler.name).eid
+        stats = controller.IDENTITY_MAP_STATISTICS
+        hits = stats['hits']
+        comp = ctrl.one(eid)
+        self.assertNotIn('obsolete', comp)
+        self.assertIs(ctrl.one(eid), comp)
+        self.assertEqual(stats['hits'], hits + 1)
+        ctrl.update({'family': 'Intel'}, eid)
+        self.assertEqual(ctrl.one(eid)['family'], 'Intel')
+        storage.disconnect_database()
+
+    def _target_storage(self):
+        storage = LocalFileStorage('test', os.path.join(tests.get_test_workdir(), self.id()))
+        comps = storage.insert_many([{'uid': str(i), 'path': '/usr/bin/cc%d' % i, 'family': 'GNU', 'role': role}
+                                     for i, role in enumerate(('Host_CC', 'Host_CXX', 'Host_CC'))], 
+                                    table_name=Compiler.name)
+        storage.insert_many([{'name': 't1', CC.keyword: comps[0].eid, CXX.keyword: comps[1].eid},
+                             {'name': 't2', CC.keyword: comps[2].eid, CXX.keyword: comps[1].eid}], 
+                            table_name=Target.name)
+        return storage, comps
+
+    def test_populate_many(self):
+        storage, _ = self._target_storage()
+        ctrl = Target.controller(storage)
+        targets = ctrl.all()
+        expected = [ctrl.populate(target) for target in targets]
+        tables = []
+        get_many = storage.get_many
+        def _get_many(keys, table_name=None, match_any=False):
+            tables.append(table_name)
+            return get_many(keys, table_name=table_name, match_any=match_any)
+        storage.get_many = _get_many
+        self.assertEqual(ctrl.populate_many(targets), expected)
+        self.assertEqual(tables, [Compiler.name])
+        self.assertEqual(targets[1].populate(CC.keyword)['path'], '/usr/bin/cc2')
+        self.assertEqual(tables, [Compiler.name])
+        storage.disconnect_database()
+
+    def test_populate_invalidated(self):
+        storage, comps = self._target_storage()
+        ctrl = Target.controller(storage)
+        targets = ctrl.all()
+        ctrl.populate_many(targets)
+        self.assertEqual(targets[0].populate()[CC.keyword]['family'], 'GNU')
+        Compiler.controller(storage).update({'family': 'Intel'}, comps[0].eid)
+        self.assertEqual(targets[0].populate()[CC.keyword]['family'], 'Intel')
+        self.assertEqual(ctrl.one({'name': 't1'}).populate(CC.keyword)['family'], 'Intel')
+        storage.disconnect_database()
+
+    def test_create_many_without_unique_attributes(self):
+        storage = LocalFileStorage('test', os.path.join(tests.get_test_workdir(), self.id()))
+        comps = Compiler.controller(storage).create_many([{'uid': str(i), 'path': '/usr/bin/gcc', 'family': 'GNU', 
+                                                           'role': 'Host_CC'} for i in xrange(2)])
+        self.assertEqual(len(comps), 2)
+        storage.disconnect_database()
+
+    def test_export_import(self):
+        prefix = os.path.join(tests.get_test_workdir(), self.id())
+        src = LocalFileStorage('src', os.path.join(prefix, 'src'))
+        dst = LocalFileStorage('dst', os.path.join(prefix, 'dst'))
+        dst.insert_many([{'name': 'x'}, {'name': 'y'}], table_name=Measurement.name)
+        meas = src.insert_many([{'name': 'm%d' % i, 'projects': [1]} for i in xrange(3)], table_name=Measurement.name)
+        src.update({'projects': [1, 2]}, meas[2].eid, table_name=Measurement.name)
+        src.insert_many([{'name': 'p', 'measurements': [meas[0].eid, meas[2].eid]},
+                         {'name': 'q', 'measurements': [meas[2].eid]}], table_name=Project.name)
+        stream = StringIO.StringIO()
+        self.assertEqual(Project.controller(src).export_records(stream, keys={'name': 'p'}), 3)
+        stream.seek(0)
+        eid_map = Project.controller(dst).import_records(stream)
+        self.assertEqual(eid_map, {Project.name: {1: 1}, Measurement.name: {1: 3, 3: 4}})
+        self.assertEqual(dst.get({'name': 'p'}, table_name=Project.name)['measurements'], [3, 4])
+        self.assertEqual(dst.get({'name': 'm2'}, table_name=Measurement.name)['projects'], [1])
+        src.disconnect_database()
+        dst.disconnect_database()
+
+    def test_import_unresolved_reference(self):
+        dst = LocalFileStorage('dst', os.path.join(tests.get_test_workdir(), self.id()))
+        def _import(target):
+            lines = [{'table': Compiler.name}] 
+            lines += [{'eid': eid, 'data': {'uid': target['name'] + role, 'path': '/usr/bin/%s%s' % (target['name'], role),
+                                            'family': 'GNU', 'role': role}}
+                      for eid, role in ((5, 'Host_CC'), (6, 'Host_CXX'))]
+            lines += [{'table': Target.name}, {'eid': 1, 'data': target}]
+            stream = StringIO.StringIO(''.join(json.dumps(line) + '\n' for line in lines))
+            return Target.controller(dst).import_records(stream)
+        eid_map = _import({'name': 't', CC.keyword: 5, CXX.keyword: 6, FC.keyword: 7})
+        target = dst.get({'name': 't'}, table_name=Target.name)
+        self.assertEqual(target[CC.keyword], eid_map[Compiler.name][5])
+        self.assertNotIn(FC.keyword, target)
+        with self.assertRaises(ModelError) as context:
+            _import({'name': 'u', CC.keyword: 9, CXX.keyword: 6})
+        self.assertIn("%s record 9" % Compiler.name, context.exception.value)
+        self.assertIsNone(dst.get({'name': 'u'}, table_name=Target.name))
+        self.assertEqual(dst.count(table_name=Compiler.name), 2)
+        dst.disconnect_database()
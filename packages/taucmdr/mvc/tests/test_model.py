@@ -31,8 +31,113 @@ Functions used for unit tests of model.py.
 """
 
 
+import os
+import logging
 from taucmdr import tests
+from taucmdr.error import IncompatibleRecordError
+from taucmdr.mvc import model
+from taucmdr.mvc.model import Model
+from taucmdr.cf.storage.local_file import LocalFileStorage
+
+
+CHECKED = []
+
+
+def _check_cheese(lhs, lhs_attr, lhs_value, rhs, rhs_attr):
+    # pylint: disable=unused-argument
+    CHECKED.append(rhs[rhs_attr])
+    if rhs[rhs_attr] == 'none':
+        raise IncompatibleRecordError("%s has no cheese" % rhs['name'])
+
+
+def _shop_attributes():
+    return {
+        'name': {'type': 'string', 'primary_key': True},
+        'cheese': {'type': 'string'},
+    }
+
+
+def _customer_attributes():
+    return {
+        'name': {'type': 'string', 'primary_key': True},
+        'hungry': {'type': 'boolean',
+                   'compat': {True: (CheeseShop.require('cheese', _check_cheese), 
+                                     CheeseShop.encourage('cheese', 'cheddar'))}},
+    }
+
+
+class CheeseShop(Model):
+    __attributes__ = _shop_attributes
+
+
+class Customer(Model):
+    __attributes__ = _customer_attributes
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+    
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
 
-@tests.not_implemented
 class ModelTest(tests.TestCase):
-    pass 
+    """Unit tests for Model."""
+
+    def setUp(self):
+        self.storage = LocalFileStorage('test', os.path.join(tests.get_test_workdir(), self.id()))
+        self.shop = self.storage.insert({'name': 'shop', 'cheese': 'gouda'}, table_name=CheeseShop.name).eid
+        self.customer = self.storage.insert({'name': 'bob', 'hungry': True}, table_name=Customer.name).eid
+        self.handler = _ListHandler()
+        model.LOGGER.addHandler(self.handler)
+        del CHECKED[:]
+        model._COMPATIBLE.clear()  # pylint: disable=protected-access
+
+    def tearDown(self):
+        model.LOGGER.removeHandler(self.handler)
+        self.storage.disconnect_database()
+
+    def _check(self):
+        customer = Customer.controller(self.storage).one(self.customer)
+        customer.check_compatibility(CheeseShop.controller(self.storage).one(self.shop))
+
+    def test_compatibility_memo(self):
+        self._check()
+        self.assertEqual(CHECKED, ['gouda'])
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertIn('recommends cheese = cheddar', self.handler.messages[0])
+        # A new process reads the verdict from storage and repeats the recommendation
+        model._COMPATIBLE.clear()  # pylint: disable=protected-access
+        self.storage.disconnect_database()
+        self._check()
+        self.assertEqual(CHECKED, ['gouda'])
+        self.assertEqual(len(self.handler.messages), 2)
+        self.assertEqual(self.handler.messages[0], self.handler.messages[1])
+
+    def test_compatibility_memo_version(self):
+        self._check()
+        model._COMPATIBLE.clear()  # pylint: disable=protected-access
+        self.storage.disconnect_database()
+        saved_version = model.TAUCMDR_VERSION
+        model.TAUCMDR_VERSION = saved_version + '.1'
+        try:
+            self._check()
+        finally:
+            model.TAUCMDR_VERSION = saved_version
+        # Verdicts remembered by another version are not used
+        self.assertEqual(CHECKED, ['gouda', 'gouda'])
+
+    def test_compatibility_memo_invalidation(self):
+        self._check()
+        CheeseShop.controller(self.storage).update({'cheese': 'cheddar'}, self.shop)
+        self._check()
+        self.assertEqual(CHECKED, ['gouda', 'cheddar'])
+        self.assertEqual(len(self.handler.messages), 1)
+        CheeseShop.controller(self.storage).update({'cheese': 'none'}, self.shop)
+        with self.assertRaises(IncompatibleRecordError):
+            self._check()
+        with self.assertRaises(IncompatibleRecordError):
+            self._check()
+        self.assertEqual(CHECKED, ['gouda', 'cheddar', 'none', 'none'])
@@ -31,6 +31,11 @@ Functions used for unit tests of util.py.
 """
 
 
+import os
+import time
+import fcntl
+import threading
+import tarfile
 from taucmdr import util, tests
 
 
@@ -82,3 +87,155 @@ class CamelCaseTest(tests.TestCase):
 
     def test_camelcase(self):
         self.assertEqual(util.camelcase("abc_def_ghi"), "AbcDefGhi")
+
+
+class InterprocessLockTest(tests.TestCase):
+    """Class to test the interprocess_lock function in utils."""
+
+    @staticmethod
+    def _other_process_can_lock(path, operation):
+        pid = os.fork()
+        if not pid:
+            fd = os.open(path, os.O_RDWR)
+            try:
+                fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            except IOError:
+                os._exit(1)
+            os._exit(0)
+        return os.waitpid(pid, 0)[1] == 0
+
+    def test_shared(self):
+        path = os.path.join(tests.get_test_workdir(), 'shared.lock')
+        with util.interprocess_lock(path, shared=True):
+            self.assertTrue(self._other_process_can_lock(path, fcntl.LOCK_SH))
+            self.assertFalse(self._other_process_can_lock(path, fcntl.LOCK_EX))
+        self.assertTrue(self._other_process_can_lock(path, fcntl.LOCK_EX))
+
+    def test_exclusive(self):
+        path = os.path.join(tests.get_test_workdir(), 'exclusive.lock')
+        with util.interprocess_lock(path):
+            self.assertFalse(self._other_process_can_lock(path, fcntl.LOCK_SH))
+        self.assertTrue(self._other_process_can_lock(path, fcntl.LOCK_SH))
+
+    def test_reentrant_upgrade(self):
+        path = os.path.join(tests.get_test_workdir(), 'upgrade.lock')
+        with util.interprocess_lock(path, shared=True):
+            with util.interprocess_lock(path):
+                with util.interprocess_lock(path, shared=True):
+                    self.assertFalse(self._other_process_can_lock(path, fcntl.LOCK_SH))
+            self.assertTrue(self._other_process_can_lock(path, fcntl.LOCK_SH))
+            self.assertFalse(self._other_process_can_lock(path, fcntl.LOCK_EX))
+
+    def test_threads(self):
+        path = os.path.join(tests.get_test_workdir(), 'threads.lock')
+        acquired = threading.Event()
+        def worker():
+            with util.interprocess_lock(path, shared=True):
+                acquired.set()
+        with util.interprocess_lock(path):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            time.sleep(0.2)
+            # Another thread's lock is not a nested lock
+            self.assertFalse(acquired.is_set())
+        thread.join()
+        self.assertTrue(acquired.is_set())
+
+
+class GetCommandOutputTest(tests.TestCase):
+    """Class to test the get_command_output function in utils."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        util.mkdirp(self.prefix)
+        self.script = os.path.join(self.prefix, 'probe')
+        self.runs = os.path.join(self.prefix, 'runs')
+        self._write_script('hello')
+        self._saved_prefix = util.COMMAND_OUTPUT_CACHE_PREFIX
+        util.COMMAND_OUTPUT_CACHE_PREFIX = os.path.join(self.prefix, 'cache')
+        util.get_command_output.cache = {}
+
+    def tearDown(self):
+        util.COMMAND_OUTPUT_CACHE_PREFIX = self._saved_prefix
+        util.get_command_output.cache = {}
+
+    def _write_script(self, output):
+        with open(self.script, 'w') as fout:
+            fout.write('#!/bin/sh\necho run >> "%s"\necho %s\n' % (self.runs, output))
+        os.chmod(self.script, 0755)
+
+    def _run_count(self):
+        with open(self.runs) as fin:
+            return len(fin.readlines())
+
+    def test_disk_cache(self):
+        self.assertEqual(util.get_command_output([self.script], ttl=60), 'hello\n')
+        util.get_command_output.cache = {}
+        self.assertEqual(util.get_command_output([self.script], ttl=60), 'hello\n')
+        self.assertEqual(self._run_count(), 1)
+        util.get_command_output.cache = {}
+        self.assertEqual(util.get_command_output([self.script]), 'hello\n')
+        self.assertEqual(self._run_count(), 2)
+
+    def test_invalidation(self):
+        util.get_command_output([self.script], ttl=60)
+        util.get_command_output.cache = {}
+        util.get_command_output([self.script], ttl=0)
+        self.assertEqual(self._run_count(), 2)
+        util.get_command_output.cache = {}
+        self._write_script('goodbye')
+        self.assertEqual(util.get_command_output([self.script], ttl=60), 'goodbye\n')
+        self.assertEqual(self._run_count(), 3)
+
+    def test_download_size_not_cached(self):
+        curl = util.which('curl')
+        if not curl:
+            self.skipTest("curl not found")
+        dest = os.path.join(self.prefix, 'copy')
+        self.assertEqual(util._create_dl_subprocess(curl, 'file://' + self.script, dest, 8), 0)
+        self.assertFalse(util.get_command_output.cache)
+        self.assertFalse(os.path.isdir(util.COMMAND_OUTPUT_CACHE_PREFIX))
+
+
+class ExtractArchiveTest(tests.TestCase):
+    """Class to test the extract_archive function in utils."""
+
+    def setUp(self):
+        self.prefix = os.path.join(tests.get_test_workdir(), self.id())
+        util.mkdirp(os.path.join(self.prefix, 'src', 'foo-1.0', 'bar'))
+        for name in 'configure', os.path.join('bar', 'baz.c'):
+            with open(os.path.join(self.prefix, 'src', 'foo-1.0', name), 'w') as fout:
+                fout.write(name)
+        self.archive = os.path.join(self.prefix, 'foo-1.0.tgz')
+        with tarfile.open(self.archive, 'w:gz') as tar:
+            # Add a file first so the top-level directory isn't the first member
+            tar.add(os.path.join(self.prefix, 'src', 'foo-1.0', 'configure'), arcname='./foo-1.0/configure')
+            tar.add(os.path.join(self.prefix, 'src', 'foo-1.0', 'bar'), arcname='./foo-1.0/bar')
+        self._saved_decompressors = util.PARALLEL_DECOMPRESSORS
+
+    def tearDown(self):
+        util.PARALLEL_DECOMPRESSORS = self._saved_decompressors
+
+    def _check_extract(self):
+        dest = os.path.join(self.prefix, 'dest')
+        self.assertEqual(util.extract_archive(self.archive, dest, show_progress=False), 
+                         os.path.join(dest, 'foo-1.0'))
+        with open(os.path.join(dest, 'foo-1.0', 'bar', 'baz.c')) as fin:
+            self.assertEqual(fin.read(), os.path.join('bar', 'baz.c'))
+
+    def test_toplevel(self):
+        self.assertEqual(util.archive_toplevel(self.archive), 'foo-1.0')
+        with self.assertRaises(IOError):
+            util.archive_toplevel(os.path.join(self.prefix, 'src', 'foo-1.0', 'configure'))
+
+    def test_extract(self):
+        util.PARALLEL_DECOMPRESSORS = {}
+        self._check_extract()
+
+    def test_extract_external(self):
+        util.PARALLEL_DECOMPRESSORS = {'gz': (['gzip', '-d', '-c'],)}
+        self._check_extract()
+        with open(self.archive, 'r+b') as fout:
+            fout.truncate(os.path.getsize(self.archive) // 2)
+        with self.assertRaises(IOError):
+            util.extract_archive(self.archive, os.path.join(self.prefix, 'truncated'), show_progress=False)
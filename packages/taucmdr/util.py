@@ -37,21 +37,26 @@ import time
 import atexit
 import subprocess
 import errno
+import fcntl
 import shutil
 import urllib
 import pkgutil
 import tarfile
 import gzip
+import zlib
 import tempfile
 import urlparse
 import hashlib
+import json
+import socket
+import threading
 from collections import deque
 from contextlib import contextmanager
 from zipimport import zipimporter
 from zipfile import ZipFile
 from termcolor import termcolor
 from unidecode import unidecode
-from taucmdr import logger
+from taucmdr import logger, USER_PREFIX
 from taucmdr.error import InternalError
 from taucmdr.progress import ProgressIndicator, progress_spinner
 
@@ -73,6 +78,9 @@ _DTEMP_STACK = []
 
 _DTEMP_ERROR_STACK = []
 
+COMMAND_OUTPUT_CACHE_PREFIX = os.path.join(USER_PREFIX, 'command_output')
+"""str: Directory holding command output cached by :any:`get_command_output`."""
+
 # Don't make this a raw string!  \033 is unicode for '\x1b'.
 _COLOR_CONTROL_RE = re.compile('\033\\[([0-9]|3[0-8]|4[0-8])m')
 
@@ -137,6 +145,47 @@ def mkdirp(*args):
                 if not (exc.errno == errno.EEXIST and os.path.isdir(path)):
                     raise
 
+def atomic_write(path, data, fsync=True):
+    """Atomically replace the contents of a file.
+
+    Writes `data` to a temporary file in the same directory as `path` then renames the temporary
+    file over `path`.  Readers see either the old file contents or the new file contents, never a
+    partially written file.  The permissions of an existing file are preserved.
+
+    Args:
+        path (str): Path to the file to replace.
+        data (str): New file contents.
+        fsync (bool): If True then flush the new file contents to disk before renaming.
+
+    Returns:
+        posix.stat_result: Status of the new file.  The file may have been replaced again by the time
+                           this function returns, but its inode, size, and modification time are known.
+    """
+    dirname, basename = os.path.split(path)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mask = os.umask(0)
+        os.umask(mask)
+        mode = 0o666 & ~mask
+    fd, tmp_path = tempfile.mkstemp(prefix='.'+basename+'.', dir=dirname)
+    try:
+        with os.fdopen(fd, 'w') as fout:
+            fout.write(data)
+            fout.flush()
+            if fsync:
+                os.fsync(fout.fileno())
+            stat = os.fstat(fout.fileno())
+        os.chmod(tmp_path, mode)
+        os.rename(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return stat
+
 def add_error_stack(path):
     _DTEMP_ERROR_STACK.append(path)
 
@@ -176,6 +225,99 @@ def umask(new_mask):
     os.umask(old_mask)
 
 
+_INTERPROCESS_LOCKS = threading.local()
+
+_THREAD_LOCKS = {}
+
+_THREAD_LOCKS_LOCK = threading.Lock()
+
+
+def _thread_lock(path):
+    """Get the lock that serializes threads of this process using the interprocess lock on `path`."""
+    with _THREAD_LOCKS_LOCK:
+        return _THREAD_LOCKS.setdefault(path, threading.RLock())
+
+
+def _flock(fd, path, operation):
+    """Apply a file lock operation to `fd`, logging how long we waited for it."""
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+    except IOError as err:
+        if err.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+    else:
+        return
+    kind = 'shared' if operation == fcntl.LOCK_SH else 'exclusive'
+    LOGGER.debug("Waiting for %s lock on '%s'", kind, path)
+    start = time.time()
+    fcntl.flock(fd, operation)
+    LOGGER.debug("Acquired %s lock on '%s' after %.3f seconds", kind, path, time.time() - start)
+
+@contextmanager
+def interprocess_lock(path, shared=False):
+    """Context manager to hold a shared or exclusive lock on a file.
+
+    Any number of processes may hold shared locks on the same file at once, but an exclusive lock
+    excludes all other locks.  Only one thread of a process holds the lock on a file at a time.
+    Locks are reentrant within a thread: nested locks on the same file reuse the lock already held, 
+    and a nested exclusive lock temporarily upgrades a shared lock.  The upgrade is not atomic: 
+    another process may acquire the lock after the shared lock is released and before the exclusive 
+    lock is acquired, so state read under the shared lock must be checked again after the upgrade.
+
+    If the lock file cannot be created, e.g. because `path` is on a read-only filesystem,
+    shared locks proceed without locking since no other process can modify that filesystem either.
+
+    Args:
+        path (str): Path to the lock file.  The file is created if it doesn't exist.
+        shared (bool): If True acquire a shared (reader) lock, otherwise acquire an exclusive (writer) lock.
+    """
+    path = os.path.realpath(path)
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    try:
+        held_locks = _INTERPROCESS_LOCKS.held
+    except AttributeError:
+        held_locks = _INTERPROCESS_LOCKS.held = {}
+    held = held_locks.get(path)
+    if held:
+        fd, held_operation, depth = held
+        upgrade = held_operation == fcntl.LOCK_SH and operation == fcntl.LOCK_EX
+        if upgrade:
+            LOGGER.debug("Upgrading shared lock on '%s' to an exclusive lock", path)
+            _flock(fd, path, fcntl.LOCK_EX)
+            held[1] = fcntl.LOCK_EX
+        held[2] = depth + 1
+        try:
+            yield
+        finally:
+            held[2] = depth
+            if upgrade:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                held[1] = fcntl.LOCK_SH
+        return
+    with _thread_lock(path):
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError as err:
+            if err.errno not in (errno.EACCES, errno.EROFS, errno.ENOENT) or not shared:
+                raise
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                LOGGER.debug("Cannot create lock file '%s': %s", path, err)
+                yield
+                return
+        try:
+            _flock(fd, path, operation)
+            held_locks[path] = [fd, operation, 1]
+            try:
+                yield
+            finally:
+                del held_locks[path]
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
 _WHICH_CACHE = {}
 def which(program, use_cached=True):
     """Returns the full path to a program command.
@@ -220,7 +362,7 @@ def which(program, use_cached=True):
     return None
 
 
-def download(src, dest, timeout=8):
+def download(src, dest, timeout=8, show_progress=True, resume=False):
     """Downloads or copies files.
     
     `src` may be a file path or URL.  The destination folder will be created 
@@ -230,6 +372,8 @@ def download(src, dest, timeout=8):
         src (str): Path or URL to source file.
         dest (str): Path to file copy or download destination.
         timeout (int): Maximum time in seconds for the connection to the server.  0 for no timeout.
+        show_progress (bool): If True, show a progress bar while downloading.
+        resume (bool): If True and `dest` exists then `dest` is a partial download that curl or wget should continue.
         
     Raises:
         IOError: File copy or download failed.
@@ -247,13 +391,13 @@ def download(src, dest, timeout=8):
         mkdirp(os.path.dirname(dest))
         for cmd in "curl", "wget":
             abs_cmd = which(cmd)
-            if abs_cmd and _create_dl_subprocess(abs_cmd, src, dest, timeout) == 0:
+            if abs_cmd and _create_dl_subprocess(abs_cmd, src, dest, timeout, show_progress, resume) == 0:
                 return
             LOGGER.warning("%s failed to download '%s'. Retrying with a different method...", cmd, src)                    
         # Fallback: urllib is usually **much** slower than curl or wget and doesn't support timeout
         if timeout:
             raise IOError("Failed to download '%s'" % src)
-        with ProgressIndicator() as progress_bar:
+        with ProgressIndicator(mode=None if show_progress else 'disabled') as progress_bar:
             try:
                 urllib.urlretrieve(src, dest, reporthook=progress_bar.update)
             except Exception as err:
@@ -261,17 +405,28 @@ def download(src, dest, timeout=8):
                 raise IOError("Failed to download '%s'" % src)
 
 
-def _create_dl_subprocess(abs_cmd, src, dest, timeout):
+def _create_dl_subprocess(abs_cmd, src, dest, timeout, show_progress=True, resume=False):
     if "curl" in os.path.basename(abs_cmd):
         size_cmd = [abs_cmd, '-sI', src, '--location', '--max-time', str(timeout)]
         get_cmd = [abs_cmd, '-s', '-L', src, '-o', dest, '--connect-timeout', str(timeout)]
+        if resume:
+            get_cmd.extend(['-C', '-'])
     elif "wget" in os.path.basename(abs_cmd):
         size_cmd = [abs_cmd, src, '--spider', '--server-response', '--timeout=%d' % timeout, '--tries=1']
         get_cmd = [abs_cmd, '-q', src, '-O', dest, '--timeout=%d' % timeout]
+        if resume:
+            get_cmd.append('-c')
     else:
         raise InternalError("Invalid command parameter: %s" % abs_cmd)
+    if not show_progress:
+        # No progress bar to size so don't ask the server for the file size
+        with open(os.devnull, 'wb') as devnull:
+            retval = subprocess.call(get_cmd, stdout=devnull, stderr=subprocess.STDOUT)
+        LOGGER.debug("%s returned %d", get_cmd, retval)
+        return retval
+    # The server's response may change at any time so don't cache it
     try:
-        proc_output = get_command_output(size_cmd)
+        proc_output = subprocess.check_output(size_cmd, stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError as err:
         return err.returncode
     _heavy_debug(proc_output)
@@ -296,6 +451,74 @@ def _create_dl_subprocess(abs_cmd, src, dest, timeout):
             LOGGER.debug("%s returned %d", get_cmd, retval)
             return retval
 
+PARALLEL_DECOMPRESSORS = {'gz': (['unpigz', '-c'], ['pigz', '-d', '-c']),
+                          'bz2': (['lbzip2', '-d', '-c'], ['pbzip2', '-d', '-c'])}
+"""dict: Multi-threaded decompressor commands to try in order, indexed by compression format."""
+
+_COMPRESSION_MAGIC = (('gz', '\x1f\x8b'), ('bz2', 'BZh'))
+
+
+def _member_toplevel(name):
+    """Returns the first component of an archive member name, or None if the member is the archive root."""
+    parts = [part for part in os.path.normpath(name).split(os.sep) if part and part != '.']
+    return parts[0] if parts else None
+
+
+@contextmanager
+def _open_tar_stream(archive, parallel=True):
+    """Opens an archive file for a single sequential pass over its members.
+    
+    If `parallel` is True and the archive is compressed in a format with a multi-threaded
+    decompressor on PATH then the archive is decompressed by that command.  Otherwise
+    :any:`tarfile` decompresses the archive in stream mode.
+    
+    Args:
+        archive (str): Path to archive file.
+        parallel (bool): If True, try to decompress with a multi-threaded decompressor.
+        
+    Yields:
+        tuple: (tar, fin) where `tar` is a :any:`tarfile.TarFile` in stream mode and `fin` is the
+               archive file opened for reading.  ``fin`` is positioned at the next compressed 
+               byte to be read so it can be used to show progress.
+    
+    Raises:
+        IOError: `archive` could not be read.
+    """
+    with open(archive, 'rb') as fin:
+        magic = fin.read(3)
+        fin.seek(0)
+        decompressor = None
+        if parallel:
+            for fmt, prefix in _COMPRESSION_MAGIC:
+                if magic.startswith(prefix):
+                    for cmd in PARALLEL_DECOMPRESSORS.get(fmt, ()):
+                        if which(cmd[0]):
+                            decompressor = cmd
+                            break
+                    break
+        if decompressor:
+            _heavy_debug("Decompressing '%s' with %s", archive, decompressor)
+            proc = subprocess.Popen(decompressor, stdin=fin, stdout=subprocess.PIPE, close_fds=True)
+            try:
+                try:
+                    yield tarfile.open(fileobj=proc.stdout, mode='r|'), fin
+                except (tarfile.TarError, EOFError, zlib.error) as err:
+                    raise IOError(err)
+                # Drain any padding after the end-of-archive marker so the decompressor exits normally
+                while proc.stdout.read(65536):
+                    pass
+            finally:
+                proc.stdout.close()
+                retval = proc.wait()
+            if retval:
+                raise IOError("%s failed with return code %d decompressing '%s'" % (decompressor[0], retval, archive))
+        else:
+            try:
+                yield tarfile.open(fileobj=fin, mode='r|*'), fin
+            except (tarfile.TarError, EOFError, zlib.error) as err:
+                raise IOError(err)
+
+
 def archive_toplevel(archive):
     """Returns the name of the top-level directory in an archive.
     
@@ -306,6 +529,7 @@ def archive_toplevel(archive):
     
     The top-level directory here is "foo"
     This routine will return stupid results for archives with multiple top-level elements.
+    Only the archive's first members are read.
     
     Args:
         archive (str): Path to archive file.
@@ -317,41 +541,40 @@ def archive_toplevel(archive):
         str: Directory name.
     """
     _heavy_debug("Determining top-level directory name in '%s'", archive)
-    try:
-        fin = tarfile.open(archive)
-    except tarfile.ReadError:
-        raise IOError
-    else:
-        if fin.firstmember.isdir():
-            topdir = fin.firstmember.name
+    with _open_tar_stream(archive, parallel=False) as (tar, _):
+        for member in tar:
+            topdir = _member_toplevel(member.name)
+            if topdir:
+                break
         else:
-            dirs = [d.name for d in fin.getmembers() if d.isdir()]
-            if dirs:
-                topdir = min(dirs, key=len)
-            else:
-                dirs = set()
-                names = [d.name for d in fin.getmembers() if d.isfile()]
-                for name in names:
-                    dirname, basename = os.path.split(name)
-                    while dirname:
-                        dirname, basename = os.path.split(dirname)
-                    dirs.add(basename)
-                topdir = min(dirs, key=len)
-        LOGGER.debug("Top-level directory in '%s' is '%s'", archive, topdir)
-        return topdir
-
-
-def _show_extract_progress(members):
-    with ProgressIndicator(len(members), show_cpu=False) as progress_bar:
-        for i, member in enumerate(members):
-            progress_bar.update(i)
+            raise IOError("'%s' is empty" % archive)
+    LOGGER.debug("Top-level directory in '%s' is '%s'", archive, topdir)
+    return topdir
+
+
+def _stream_members(tar, fin, total_size, show_progress, found):
+    """Yields members of an archive while recording their top-level directories in `found`."""
+    if show_progress:
+        context = ProgressIndicator(total_size, show_cpu=False)
+    else:
+        context = _null_context()
+    with context as progress_bar:
+        for member in tar:
+            if not found:
+                topdir = _member_toplevel(member.name)
+                if topdir:
+                    found.append(topdir)
+            if progress_bar:
+                progress_bar.update(os.lseek(fin.fileno(), 0, os.SEEK_CUR))
             yield member
 
 def extract_archive(archive, dest, show_progress=True):
     """Extracts archive file to dest.
     
     Supports compressed and uncompressed tar archives. Destination folder will
-    be created if it doesn't exist.
+    be created if it doesn't exist.  The archive is decompressed once, by a 
+    multi-threaded decompressor from :any:`PARALLEL_DECOMPRESSORS` if one is 
+    available, and the top-level directory is found while extracting.
     
     Args:
         archive (str): Path to archive file to extract.
@@ -363,19 +586,14 @@ def extract_archive(archive, dest, show_progress=True):
     Raises:
         IOError: Failed to extract archive.
     """
-    topdir = archive_toplevel(archive)
-    full_dest = os.path.join(dest, topdir)
     mkdirp(dest)
-    with tarfile.open(archive) as fin:
-        if show_progress:
-            LOGGER.info("Checking contents of '%s'", archive)
-            with progress_spinner(show_cpu=False):
-                members = fin.getmembers()
-            LOGGER.info("Extracting '%s' to create '%s'", archive, full_dest)
-            fin.extractall(dest, members=_show_extract_progress(members))
-        else:
-            LOGGER.info("Extracting '%s' to create '%s'", archive, full_dest)
-            fin.extractall(dest)
+    found = []
+    LOGGER.info("Extracting '%s' to '%s'", archive, dest)
+    with _open_tar_stream(archive) as (tar, fin):
+        tar.extractall(dest, members=_stream_members(tar, fin, os.path.getsize(archive), show_progress, found))
+    if not found:
+        raise IOError("'%s' is empty" % archive)
+    full_dest = os.path.join(dest, found[0])
     if not os.path.isdir(full_dest):
         raise IOError("Extracting '%s' does not create '%s'" % (archive, full_dest))
     return full_dest
@@ -519,14 +737,70 @@ def create_subprocess(cmd, cwd=None, env=None, stdout=True, log=True, show_progr
     return retval
 
 
-def get_command_output(cmd):
+def file_identity(path):
+    """Identify the current version of a file.
+    
+    Args:
+        path (str): Path to the file.
+        
+    Raises:
+        OSError: The file does not exist.
+        
+    Returns:
+        list: The file's inode, size, and modification time.
+    """
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_size, stat.st_mtime]
+
+
+def _command_output_cache_path(cmd):
+    key = json.dumps([socket.gethostname()] + list(cmd))
+    return os.path.join(COMMAND_OUTPUT_CACHE_PREFIX, hashlib.sha1(key).hexdigest() + '.json')
+
+
+def _load_command_output(cmd, ttl):
+    """Return output of `cmd` cached on disk no more than `ttl` seconds ago by the same executable, or None."""
+    executable = which(cmd[0])
+    if not executable:
+        return None
+    try:
+        with open(_command_output_cache_path(cmd)) as fin:
+            entry = json.load(fin)
+        if (entry['cmd'] == list(cmd) and entry['identity'] == file_identity(executable) and 
+                0 <= time.time() - entry['time'] <= ttl):
+            return entry['output'].encode('utf-8')
+    except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+    return None
+
+
+def _save_command_output(cmd, stdout):
+    executable = which(cmd[0])
+    if not executable:
+        return
+    path = _command_output_cache_path(cmd)
+    try:
+        entry = {'cmd': list(cmd), 'identity': file_identity(executable), 'time': time.time(), 'output': stdout}
+        mkdirp(COMMAND_OUTPUT_CACHE_PREFIX)
+        atomic_write(path, json.dumps(entry), fsync=False)
+    except (IOError, OSError, ValueError) as err:
+        LOGGER.debug("Failed to cache command output in '%s': %s", path, err)
+
+
+def get_command_output(cmd, ttl=None):
     """Return the possibly cached output of a command.
     
     Just :any:`subprocess.check_output` with a cache.
     Subprocess stderr is always sent to subprocess stdout.
     
+    Output is always cached for the life of the process.  Callers may also opt in to caching output 
+    on disk at user level so that later processes don't execute the command again.  Output cached on 
+    disk is ignored when it is older than `ttl` seconds, when the command's executable changed, or on 
+    another host.  Only output of successful commands is cached on disk.
+    
     Args:
         cmd (list): Command and its command line arguments.
+        ttl (float): Seconds the output of this command stays valid on disk, or None to not cache on disk.
 
     Raises:
         subprocess.CalledProcessError: return code was non-zero.
@@ -536,18 +810,27 @@ def get_command_output(cmd):
     """
     key = repr(cmd)
     try:
-        return get_command_output.cache[key]
+        stdout = get_command_output.cache[key]
     except AttributeError:
         get_command_output.cache = {}
     except KeyError:
         pass
     else:
         _heavy_debug("Using cached output for command: %s", cmd)
+        return stdout
+    if ttl is not None:
+        stdout = _load_command_output(cmd, ttl)
+        if stdout is not None:
+            LOGGER.debug("Using output cached on disk for command: %s", cmd)
+            get_command_output.cache[key] = stdout
+            return stdout
     LOGGER.debug("Checking subprocess output: %s", cmd)
     stdout = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
     get_command_output.cache[key] = stdout
     _heavy_debug(stdout)
     LOGGER.debug("%s returned 0", cmd)
+    if ttl is not None:
+        _save_command_output(cmd, stdout)
     return stdout
 
 